@@ -1,15 +1,19 @@
 import os
 import shutil
+import argparse
 import subprocess
 
+from pipeline import telemetry
+from pipeline.scheduler import SCHEDULERS, get_scheduler
+
 # Number of molecules
 nmol = 1
 
 TEMPLATE_DIR = "scripts/forcefield"
 OUTPUT_ROOT = "outputs/forcefield"
 
-for i in range(1, nmol + 1):
-    mol_name = f"mol_{i}"
+
+def submit_forcefield(mol_name, scheduler):
     mol_dir = os.path.join(OUTPUT_ROOT, mol_name)
 
     print(f"Preparing job for {mol_name}...")
@@ -25,7 +29,21 @@ for i in range(1, nmol + 1):
     submit_path = os.path.join(mol_dir, "submit.pbs")
     subprocess.run(["sed", "-i", f"s/mol_INDEX/{mol_name}/g", submit_path])
 
-    # Submit the PBS job
+    # Submit the job
     print(f"Submitting job for {mol_name}")
-    subprocess.run(["qsub", "submit.pbs"], cwd=mol_dir)
+    return scheduler.submit("submit.pbs", cwd=mol_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up and submit force field jobs.")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    args = parser.parse_args()
+
+    scheduler = get_scheduler(args.scheduler)
+
+    for i in range(1, nmol + 1):
+        with telemetry.track("forcefield", mol=f"mol_{i}"):
+            submit_forcefield(f"mol_{i}", scheduler)
 
+    # Local jobs run in this process; PBS jobs are already queued
+    scheduler.wait()
@@ -1,7 +1,11 @@
 import os
 import shutil
+import argparse
 import subprocess
 
+from pipeline import telemetry
+from pipeline.scheduler import SCHEDULERS, get_scheduler
+
 # Number of molecules
 nmol = 1
 
@@ -9,8 +13,14 @@ TEMPLATE_DIR = "scripts/metadynamics"
 INPUT_ROOT = "outputs/forcefield"
 OUTPUT_ROOT = "outputs/metadynamics"
 
-for i in range(1, nmol + 1):
-    mol_name = f"mol_{i}"
+# Files carried over from the force field stage
+INPUT_FILES = [
+    "system_1.frcmod", "system_1.inpcrd", "system_1.mol2",
+    "system_1.prmtop", "natoms.txt", "total_charge.txt"
+]
+
+
+def submit_metadynamics(mol_name, scheduler):
     mol_dir = os.path.join(OUTPUT_ROOT, mol_name)
     input_dir = os.path.join(INPUT_ROOT, mol_name)
 
@@ -24,10 +34,7 @@ for i in range(1, nmol + 1):
     shutil.copytree(TEMPLATE_DIR, mol_dir)
 
     # Copy required input files from numbered folder
-    for filename in [
-        "system_1.frcmod", "system_1.inpcrd", "system_1.mol2",
-        "system_1.prmtop", "natoms.txt", "total_charge.txt"
-    ]:
+    for filename in INPUT_FILES:
         shutil.copy(os.path.join(input_dir, filename), os.path.join(mol_dir, filename))
 
     # Replace mol_INDEX in submit.pbs
@@ -36,5 +43,19 @@ for i in range(1, nmol + 1):
 
     # Submit the job
     print(f"Submitting job for {mol_name}")
-    subprocess.run(["qsub", "submit.pbs"], cwd=mol_dir)
+    return scheduler.submit("submit.pbs", cwd=mol_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up and submit metadynamics jobs.")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    args = parser.parse_args()
+
+    scheduler = get_scheduler(args.scheduler)
+
+    for i in range(1, nmol + 1):
+        with telemetry.track("metadynamics", mol=f"mol_{i}"):
+            submit_metadynamics(f"mol_{i}", scheduler)
 
+    # Local jobs run in this process; PBS jobs are already queued
+    scheduler.wait()
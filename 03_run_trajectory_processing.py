@@ -2,13 +2,16 @@ import os
 import shutil
 import subprocess
 
+from pipeline import telemetry
+
 nmol = 1  # Set this to however many molecules you have
+cluster_rmsd = None  # Heavy-atom RMSD cutoff (Å) for conformer clustering; None keeps every frame
 
 TEMPLATE_DIR = "scripts/trajectory_processing"
 OUTPUT_ROOT = "outputs/trajectory_processing"
 
-for i in range(1, nmol + 1):
-    mol_name = f"mol_{i}"
+
+def process_trajectory(mol_name):
     mol_dir = os.path.join(OUTPUT_ROOT, mol_name)
 
     print(f"\n🧬 Setting up and extracting descriptor input for {mol_name}...")
@@ -30,8 +33,27 @@ for i in range(1, nmol + 1):
 
     # Run extract_sdf_from_md.sh in the molecule folder
     try:
-        subprocess.run(["bash", "extract_sdf_from_md.sh"], cwd=mol_dir, check=True)
+        subprocess.run(["bash", "extract_sdf_from_md.sh"], cwd=mol_dir, check=True, env=telemetry.child_env())
         print(f"✅ output.sdf created in {mol_dir}")
+
+        # Reduce near-duplicate frames to one representative per cluster
+        if cluster_rmsd is not None:
+            # The memory-mapped ensemble is read when the extractor wrote one
+            cluster_input = "output.ens" if os.path.isdir(os.path.join(mol_dir, "output.ens")) else "output.sdf"
+            cluster_command = ["python", "cluster_conformers.py", "-i", cluster_input, "-r", str(cluster_rmsd)]
+            if os.path.exists(os.path.join(mol_dir, "frame_weights.csv")):
+                # Each cluster's weight is the sum of its members' metadynamics weights
+                cluster_command += ["-f", "frame_weights.csv"]
+            subprocess.run(cluster_command, cwd=mol_dir, check=True, env=telemetry.child_env())
+            print(f"✅ output_clustered.sdf created in {mol_dir}")
+        return True
     except subprocess.CalledProcessError:
         print(f"❌ Failed to generate output.sdf for {mol_name}")
+        return False
+
 
+if __name__ == "__main__":
+    for i in range(1, nmol + 1):
+        with telemetry.track("trajectory_processing", mol=f"mol_{i}") as span:
+            if not process_trajectory(f"mol_{i}"):
+                span.status = 1
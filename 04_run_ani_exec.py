@@ -1,72 +1,120 @@
 import os
 import argparse
+import importlib.util
+
+from pipeline import telemetry
+from pipeline.scheduler import SCHEDULER_ENV, SCHEDULERS, get_scheduler
 
 # Define configurable parameters
 solvent = 'chloroform'
 nmol = 1
 output_file = "../data/output.sdf"
-frames_per_job = 15
-num_jobs = 3
+target_task_hours = 1.0  # Chunks are sized by the cost model so each array task takes about this long
+max_array_tasks = 500
 output_dir = "files"
 template_script = "../0_scripts/template_submit_array.pbs"
+use_clustered_frames = False  # Use the cluster representatives from 03 (cluster_rmsd) instead of every frame
+use_ensemble = False  # Chunk the memory-mapped conformer ensemble output.ens from 03 instead of output.sdf (not with use_clustered_frames)
+
+
+def setup_ani_jobs(mol_ii, scheduler):
+    """Step 1: copy the ANI job tree for one molecule and submit its minimization array."""
+    if use_clustered_frames and use_ensemble:
+        raise ValueError("use_clustered_frames and use_ensemble cannot both be set: the clustered frames are written as SDF only")
+
+    dir0 = f'outputs/ani_exec/mol_{mol_ii}'
+    traj_dir = f'../../trajectory_processing/mol_{mol_ii}'
+
+    # Conformers to minimize: every frame, the cluster representatives or the memory-mapped ensemble
+    input_file = output_file
+    copy_input = f"cp {traj_dir}/output.sdf data/output.sdf"
+    populations = ""
+    if use_clustered_frames:
+        # Cluster representatives replace the frames; their populations weight the Boltzmann average
+        copy_input = (f"cp {traj_dir}/output_clustered.sdf data/output.sdf\n"
+                      f"    cp {traj_dir}/cluster_populations.csv data/cluster_populations.csv")
+        populations = "../data/cluster_populations.csv"
+    elif use_ensemble:
+        input_file = f"{os.path.splitext(output_file)[0]}.ens"
+        copy_input = f"cp -r {traj_dir}/output.ens data/output.ens"
+
+    # Prepare configurations for single-point energy calculations and property calculations
+    CC = f'''\
+    rm -rf {dir0}
+    cp -r scripts/ani_exec {dir0}
+    cd {dir0}
+    mkdir data
+    {copy_input}
+    if [ -f {traj_dir}/frame_weights.csv ]; then cp {traj_dir}/frame_weights.csv data/frame_weights.csv; fi
+    cd ani
+    sed -i "s/__SOLVENT__/{solvent}/g" submit_ani.pbs
+    bash prep.sh {solvent} "{input_file}" {target_task_hours} {max_array_tasks} "{output_dir}" "{template_script}" {populations}
+    '''
+    print(CC)
+    # ani_job_setup.py runs from the copied job tree and submits its own array job
+    telemetry.system(CC, **{SCHEDULER_ENV: scheduler.name, "PIPELINE_ROOT": os.getcwd()})
+
+    # Queued arrays are returned for polling; local arrays have already run inside ani_job_setup.py
+    job_id_path = f"{dir0}/ani/{output_dir}/array_job_id.txt"
+    if scheduler.asynchronous and os.path.exists(job_id_path):
+        with open(job_id_path) as f:
+            return f.read().strip()
+    return None
+
+
+def submit_ani_properties(mol_ii, scheduler):
+    """Step 2: submit the property calculations on the ANI-minimized conformations."""
+    dir0 = f'outputs/ani_exec/mol_{mol_ii}'
 
-# Define the argument parser
-parser = argparse.ArgumentParser(description="Run job scripts with different steps.")
-parser.add_argument("step", type=int, choices=[1, 2], help="Step to execute (1 or 2).")
-args = parser.parse_args()
-
-# Verify the step before proceeding
-if args.step not in [1, 2]:
-    print("Invalid step. Please specify 1 for single-point energy calculations or 2 for ANI-based property calculations.")
-    exit(1)
-
-# Display the loaded modules
-print("Checking loaded modules...")
-os.system("module list")
-
-# Step 1: Single-point energy calculations and ANI minimization
-if args.step == 1:
-    # Prompt the user to verify if RDKit is loaded
-    rdkit_loaded = input("Is the RDKit module loaded? (yes/no): ").strip().lower()
-    if rdkit_loaded != 'yes':
-        print("RDKit module is not loaded. Exiting...")
+    # Check if the directory {dir0}/ani exists
+    if not os.path.exists(f"{dir0}/ani"):
+        print(f"Directory {dir0}/ani does not exist. Skipping...")
+        return None
+
+    # Perform property calculations on ANI-minimized conformations
+    CC = f'''\
+    cd {dir0}/ani
+    sed -i "s/__SOLVENT__/{solvent}/g" submit_ani.pbs
+    '''
+    print(CC)
+    os.system(CC)
+    return scheduler.submit("submit_ani.pbs", cwd=f"{dir0}/ani")
+
+
+if __name__ == "__main__":
+    # Define the argument parser
+    parser = argparse.ArgumentParser(description="Run job scripts with different steps.")
+    parser.add_argument("step", type=int, choices=[1, 2], help="Step to execute (1 or 2).")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    args = parser.parse_args()
+
+    scheduler = get_scheduler(args.scheduler)
+
+    # Verify the step before proceeding
+    if args.step not in [1, 2]:
+        print("Invalid step. Please specify 1 for single-point energy calculations or 2 for ANI-based property calculations.")
         exit(1)
 
-    for i in range(nmol):
-        mol_ii = i + 1
-        dir0 = f'outputs/ani_exec/mol_{mol_ii}'
-
-        # Prepare configurations for single-point energy calculations and property calculations
-        CC = f'''\
-        rm -rf {dir0}
-        cp -r scripts/ani_exec {dir0}
-        cd {dir0}
-        mkdir data
-        cp ../../trajectory_processing/mol_{mol_ii}/output.sdf data/output.sdf
-        cd ani
-        sed -i "s/__SOLVENT__/{solvent}/g" submit_ani.pbs
-        bash prep.sh {solvent} "{output_file}" {frames_per_job} {num_jobs} "{output_dir}" "{template_script}"
-        '''
-        print(CC)
-        os.system(CC)
-
-# Step 2: Property calculations on ANI-minimized conformations
-elif args.step == 2:
-    for i in range(nmol):
-        mol_ii = i + 1
-        dir0 = f'outputs/ani_exec/mol_{mol_ii}'
-
-        # Check if the directory {dir0}/ani exists
-        if not os.path.exists(f"{dir0}/ani"):
-            print(f"Directory {dir0}/ani does not exist. Skipping...")
-            continue
-
-        # Perform property calculations on ANI-minimized conformations
-        CC = f'''\
-        cd {dir0}/ani
-        sed -i "s/__SOLVENT__/{solvent}/g" submit_ani.pbs
-        qsub submit_ani.pbs
-        '''
-        print(CC)
-        os.system(CC)
+    # Display the loaded modules
+    print("Checking loaded modules...")
+    os.system("module list")
+
+    # Step 1: Single-point energy calculations and ANI minimization
+    if args.step == 1:
+        # The ANI job scripts need RDKit; check it instead of asking, so campaigns can run unattended
+        if importlib.util.find_spec("rdkit") is None:
+            print("RDKit is not importable. Load the RDKit module and rerun. Exiting...")
+            exit(1)
+
+        for i in range(nmol):
+            with telemetry.track("ani_exec", mol=f"mol_{i + 1}"):
+                setup_ani_jobs(i + 1, scheduler)
+
+    # Step 2: Property calculations on ANI-minimized conformations
+    elif args.step == 2:
+        for i in range(nmol):
+            with telemetry.track("ani_properties", mol=f"mol_{i + 1}"):
+                submit_ani_properties(i + 1, scheduler)
 
+        # Local jobs run in this process; PBS jobs are already queued
+        scheduler.wait()
@@ -1,47 +1,66 @@
 import os
+import argparse
+
+from pipeline import telemetry
+from pipeline.scheduler import SCHEDULERS, get_scheduler
 
 ml_models_dir = "outputs/ml_models"
 pbs_list_path = f"{ml_models_dir}/pbs_job_list.txt"
 
-CC = f'''\
-cp scripts/ml_models/* {ml_models_dir}
-cd {ml_models_dir}
-python get_3d_properties.py
-rm -rf outputs pbs_jobs
-mkdir outputs
-python generate_pbs_jobs.py
-'''
-print(CC)
-os.system(CC)
-
-try:
-    with open(pbs_list_path, "r") as f:
-        job_names = [line.strip() for line in f if line.strip()]
-
-    print("Jobs listed in pbs_job_list.txt:")
-    for name in job_names:
-        print(name)
-        dir0 = f' outputs/{name}'
-        pbs0 = f'{name}.pbs'
-
-        CC = f'''\
-        cd {ml_models_dir}
-        rm -rf {dir0}
-        mkdir {dir0}
-        mv pbs_jobs/{pbs0} {dir0}/submit.pbs
-        cd {dir0}
-        qsub submit.pbs
-        '''
-        print(CC)
-        os.system(CC)
-
-
-except FileNotFoundError:
-    print(f"Error: File '{pbs_list_path}' not found.")
-
-CC = f'''\
-rm -rf pbs_jobs
-'''
-print(CC)
-os.system(CC)
 
+def submit_ml_models(scheduler):
+    CC = f'''\
+    cp scripts/ml_models/* {ml_models_dir}
+    cd {ml_models_dir}
+    python get_3d_properties.py
+    rm -rf outputs pbs_jobs
+    mkdir outputs
+    python generate_pbs_jobs.py
+    '''
+    print(CC)
+    with telemetry.track("ml_models", job="prepare") as span:
+        span.status = telemetry.system(CC)
+
+    job_ids = []
+    try:
+        with open(pbs_list_path, "r") as f:
+            job_names = [line.strip() for line in f if line.strip()]
+
+        print("Jobs listed in pbs_job_list.txt:")
+        for name in job_names:
+            print(name)
+            dir0 = f' outputs/{name}'
+            pbs0 = f'{name}.pbs'
+
+            CC = f'''\
+            cd {ml_models_dir}
+            rm -rf {dir0}
+            mkdir {dir0}
+            mv pbs_jobs/{pbs0} {dir0}/submit.pbs
+            '''
+            print(CC)
+            with telemetry.track("ml_models", job=name):
+                os.system(CC)
+                job_ids.append(scheduler.submit("submit.pbs", cwd=os.path.join(ml_models_dir, "outputs", name)))
+
+    except FileNotFoundError:
+        print(f"Error: File '{pbs_list_path}' not found.")
+
+    CC = f'''\
+    rm -rf pbs_jobs
+    '''
+    print(CC)
+    os.system(CC)
+    return job_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up and submit ML model training jobs.")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    args = parser.parse_args()
+
+    scheduler = get_scheduler(args.scheduler)
+    submit_ml_models(scheduler)
+
+    # Local jobs run in this process; PBS jobs are already queued
+    scheduler.wait()
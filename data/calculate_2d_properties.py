@@ -1,10 +1,17 @@
+import os
+import json
 import pandas as pd
+import rdkit
+from concurrent.futures import ProcessPoolExecutor
 from rdkit import Chem
 from rdkit.Chem import Descriptors
 from rdkit.Chem import rdMolDescriptors
 from rdkit.Chem import AllChem
 import argparse
 
+EMBED_SEED = 42  # Fixed ETKDG seed so CharVol is reproducible across runs and workers
+SMILES_PER_TASK = 8  # SMILES computed per worker task
+
 # Define the desired properties and their corresponding RDKit descriptor functions
 descriptor_functions = {
     "MolecularWeight": Descriptors.MolWt,
@@ -30,7 +37,7 @@ def calculate_tnsa(mol):
 def calculate_charvol(mol):
     """Calculate Characteristic Volume (CharVol)."""
     mol = Chem.AddHs(mol)
-    AllChem.EmbedMolecule(mol)
+    AllChem.EmbedMolecule(mol, randomSeed=EMBED_SEED)
     try:
         return AllChem.ComputeMolVolume(mol)
     except:
@@ -74,10 +81,74 @@ def calculate_properties(smiles):
         "Total non-polar surface area (TNSA)": result.get("TNSA"),
     }
 
+def canonical_smiles(smiles):
+    """Cache key: RDKit canonical SMILES, or the input string if it does not parse."""
+    mol = Chem.MolFromSmiles(smiles)
+    return Chem.MolToSmiles(mol) if mol is not None else smiles
+
+def calculate_batch(smiles_list):
+    return [calculate_properties(smiles) for smiles in smiles_list]
+
+class PropertyCache:
+    """
+    Properties of every SMILES computed so far, keyed by canonical SMILES and saved as JSON.
+    Entries are discarded when the RDKit version or the embedding seed changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = {"rdkit": rdkit.__version__, "embed_seed": EMBED_SEED}
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                cached = json.load(f)
+            if cached.get("version") == self.version:
+                self.entries = cached["entries"]
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": self.version, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+
+def calculate_all(smiles_series, workers=1, cache=None):
+    """
+    Property rows for a Series of SMILES. Each distinct canonical SMILES not in the cache is
+    computed once, in chunks on a process pool when workers > 1.
+    """
+    cache = cache or PropertyCache(None)
+    keys = [canonical_smiles(smiles) for smiles in smiles_series]
+    missing = list(dict.fromkeys(key for key in keys if key not in cache.entries))
+
+    if missing:
+        # Small batches are spread over every worker; the cache is saved as each chunk completes,
+        # so an interrupted run keeps what it has computed
+        chunk_size = max(1, min(SMILES_PER_TASK, -(-len(missing) // workers)))
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for chunk, rows in zip(chunks, executor.map(calculate_batch, chunks)):
+                    cache.entries.update(zip(chunk, rows))
+                    cache.save()
+        else:
+            for chunk in chunks:
+                cache.entries.update(zip(chunk, calculate_batch(chunk)))
+                cache.save()
+
+    print(f"Computed {len(missing)} new compounds; {len(set(keys)) - len(missing)} taken from the cache.")
+    return pd.DataFrame([cache.entries[key] for key in keys], index=smiles_series.index)
+
 def main():
     parser = argparse.ArgumentParser(description="Calculate molecular properties from a CSV with a 'Smiles' column.")
     parser.add_argument("input_file", help="Path to the input CSV file with 'Smiles' column.")
     parser.add_argument("output_file", help="Path to the output CSV file.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: all cores; 1 runs serially).")
+    parser.add_argument("--cache", default=None,
+                        help="JSON cache of computed properties (default: 2d_properties_cache.json next to the output file).")
+    parser.add_argument("--no_cache", action="store_true", help="Recompute every compound and do not write a cache.")
     args = parser.parse_args()
 
     smiles_df = pd.read_csv(args.input_file)
@@ -85,7 +156,11 @@ def main():
     if "Smiles" not in smiles_df.columns:
         raise ValueError("Input file must contain a column named 'Smiles'.")
 
-    smiles_df = smiles_df.assign(**smiles_df["Smiles"].apply(calculate_properties).apply(pd.Series))
+    cache_path = None if args.no_cache else (
+        args.cache or os.path.join(os.path.dirname(os.path.abspath(args.output_file)), "2d_properties_cache.json")
+    )
+    properties = calculate_all(smiles_df["Smiles"], args.workers, PropertyCache(cache_path))
+    smiles_df = smiles_df.assign(**properties)
     smiles_df.to_csv(args.output_file, index=False)
     print(f"Molecular properties saved to {args.output_file}")
 
@@ -1,8 +1,12 @@
 #!/bin/bash
 
-cpptraj -i get_frames.in
-cpptraj -i split_dcd.in
+# Split md.dcd of eq_1 and eq_2 into two halves (md_part1.dcd, md_part2.dcd) by copying
+# frame bytes with dcd.py; this runs in outputs/metadynamics/mol_N/eq_1, four levels below the repository root
+PIPELINE_ROOT="${PIPELINE_ROOT:-$(cd ../../../.. && pwd)}"
+DCD_TOOL="$PIPELINE_ROOT/scripts/trajectory_processing/dcd.py"
+
+python "$DCD_TOOL" info md.dcd
+python "$DCD_TOOL" split md.dcd -n 2 -o "md_part{}.dcd"
 
-cp split_dcd.in ../eq_2
 cd ../eq_2
-cpptraj -i split_dcd.in
+python "$DCD_TOOL" split md.dcd -n 2 -o "md_part{}.dcd"
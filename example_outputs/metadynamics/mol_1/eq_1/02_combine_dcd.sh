@@ -1,8 +1,14 @@
 #!/bin/bash
 
-cpptraj -i combine_dcd.in
-cpptraj -i get_frames.in
+# Join md_part1.dcd and md_part2.dcd of eq_1 and eq_2 back into md.dcd by copying
+# frame bytes with dcd.py; this runs in outputs/metadynamics/mol_N/eq_1, four levels below the repository root
+PIPELINE_ROOT="${PIPELINE_ROOT:-$(cd ../../../.. && pwd)}"
+DCD_TOOL="$PIPELINE_ROOT/scripts/trajectory_processing/dcd.py"
 
-cp combine_dcd.in ../eq_2
-cd ../eq_2
-cpptraj -i combine_dcd.in
+for EQ in ../eq_1 ../eq_2; do
+    # Nothing to do when the trajectory was never split
+    if [ -f "$EQ/md_part1.dcd" ] && [ -f "$EQ/md_part2.dcd" ]; then
+        python "$DCD_TOOL" concat "$EQ/md_part1.dcd" "$EQ/md_part2.dcd" -o "$EQ/md.dcd"
+    fi
+done
+python "$DCD_TOOL" info md.dcd
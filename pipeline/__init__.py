@@ -0,0 +1 @@
+"""Shared infrastructure used by the 01-05 pipeline drivers."""
@@ -0,0 +1,325 @@
+"""
+Stage-level benchmarks on synthetic inputs (pipeline/synthetic.py).
+
+Each stage is timed over a sweep of input sizes: the best of ``--repeat`` runs is
+reported as the time, and one further run under tracemalloc gives the peak memory
+allocated by the benchmark process (allocations inside worker processes are not
+included, so process-pool stages are run with one worker). Results are written
+as JSON and can be compared against a stored baseline; a stage that got slower
+than ``--threshold`` times its baseline is reported as a regression. ``check``
+runs the optimized implementations next to the reference ones they replace and
+fails if any result differs by more than its tolerance.
+
+Usage (from the repository root):
+
+    python -m pipeline.benchmark run -o benchmark.json
+    python -m pipeline.benchmark run --stages split_sdf descriptors_3d --scale 0.25
+    python -m pipeline.benchmark run -o new.json --baseline benchmark.json
+    python -m pipeline.benchmark compare new.json benchmark.json
+    python -m pipeline.benchmark check
+
+Nothing here needs Amber, ANI or Schrödinger.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from pipeline import synthetic
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_DIRS = ["scripts/ani_exec/0_scripts", "scripts/trajectory_processing", "scripts/ml_models"]
+
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 1.25  # Slowdown relative to the baseline reported as a regression
+MIN_SIZE = 4  # Smallest scaled size (a train/test split needs at least two molecules on each side)
+
+
+def _import_scripts():
+    for script_dir in SCRIPT_DIRS:
+        path = os.path.join(REPO_ROOT, script_dir)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+# Every stage: (unit, default sizes, setup(size, workdir) -> state, run(state)).
+# setup builds the synthetic input once per size and is not timed.
+
+def _setup_pdb(size, workdir):
+    return synthetic.write_pdb(os.path.join(workdir, f"frames_{size}.pdb"), size)
+
+
+def _run_process_pdb_frames(pdb_file):
+    from frames_to_sdf import process_pdb_frames
+    process_pdb_frames(pdb_file, pdb_file + ".sdf", workers=1)
+
+
+def _setup_sdf(size, workdir):
+    return synthetic.write_sdf(os.path.join(workdir, f"frames_{size}.sdf"), size)
+
+
+def _run_split_sdf(sdf_file):
+    from ani_job_setup import split_sdf
+    from sdf_index import index_path
+
+    # Time the scan as well as the split: drop the saved index of the previous run
+    if os.path.exists(index_path(sdf_file)):
+        os.remove(index_path(sdf_file))
+    split_sdf(sdf_file, tempfile.mkdtemp(dir=os.path.dirname(sdf_file)), 15)
+
+
+def _setup_mols(size, workdir):
+    from rdkit import Chem
+    sdf_file = _setup_sdf(size, workdir)
+    return [mol for mol in Chem.SDMolSupplier(sdf_file, removeHs=False)]
+
+
+def _run_descriptors_3d(mols):
+    from calculate_3d_descriptors import calculate_3D_descriptors_batch, CONFORMERS_PER_BATCH
+    for start in range(0, len(mols), CONFORMERS_PER_BATCH):
+        calculate_3D_descriptors_batch(mols[start:start + CONFORMERS_PER_BATCH])
+
+
+def _setup_coordinates(size, workdir):
+    return synthetic.degrader_molecule(), synthetic.conformer_coordinates(size)
+
+
+def _run_numpy_psa(state):
+    from sasa import polar_surface_area
+    polar_surface_area(*state)
+
+
+def _run_numpy_imhb(state):
+    from imhb import HBondTopology, find_imhb
+    mol, coordinates = state
+    find_imhb(HBondTopology(mol), coordinates)
+
+
+def _setup_ensemble(size, workdir):
+    energies = synthetic.energy_table(size)["ANI_energy(kcal/mol)"].values
+    values = synthetic.property_table(size)[["PSA", "Num_IMHB", "RadiusOfGyration"]].values
+    return energies, values
+
+
+def _run_ensemble_averages(state):
+    from ensemble_averages import ensemble_averages
+    ensemble_averages(*state, temperatures=[298.0, 310.0])
+
+
+def _setup_features(size, workdir):
+    df = synthetic.feature_matrix(size)
+    outdir = os.path.join(workdir, f"model_{size}")
+    os.makedirs(outdir, exist_ok=True)
+    return df, outdir
+
+
+def _run_evaluate_model(state):
+    from run_model import evaluate_model
+    df, outdir = state
+    features = df.drop(columns="P_appLog")
+    evaluate_model("pls", features, df["P_appLog"], outdir, n_splits=10, perm_repeats=5,
+                   model_args_for_config={"model": "pls"})
+
+
+STAGES = {
+    "process_pdb_frames": ("frames", [100, 400, 1600], _setup_pdb, _run_process_pdb_frames),
+    "split_sdf": ("frames", [1000, 4000, 16000], _setup_sdf, _run_split_sdf),
+    "descriptors_3d": ("conformers", [100, 400, 1600], _setup_mols, _run_descriptors_3d),
+    "numpy_psa": ("conformers", [25, 100, 400], _setup_coordinates, _run_numpy_psa),
+    "numpy_imhb": ("conformers", [100, 1000, 10000], _setup_coordinates, _run_numpy_imhb),
+    "ensemble_averages": ("conformers", [1000, 10000, 100000], _setup_ensemble, _run_ensemble_averages),
+    "evaluate_model": ("molecules", [32, 128, 512], _setup_features, _run_evaluate_model),
+}
+
+
+def _max_difference(values, reference):
+    """Largest absolute difference, relative to the reference value where that exceeds 1."""
+    values, reference = np.asarray(values, dtype=float), np.asarray(reference, dtype=float)
+    return float((np.abs(values - reference) / np.maximum(np.abs(reference), 1.0)).max())
+
+
+# Every check: (tolerance, check() -> largest difference from the reference implementation).
+
+def _check_permutation_importance():
+    """--perm_engine batched against sklearn.inspection.permutation_importance, for pls and rf."""
+    from run_model import run_split
+    df = synthetic.feature_matrix(48)
+    features, y = df.drop(columns="P_appLog"), df["P_appLog"]
+    difference = 0.0
+    for model_type, model_params in [("pls", {"n_components": 3}), ("rf", {"n_estimators": 20})]:
+        for i in (1, 2):
+            batched, reference = (
+                run_split(i, model_type=model_type, features=features, y=y, model_params=model_params,
+                          perm_repeats=5, n_jobs=1, perm_engine=engine)[1]
+                for engine in ("batched", "sklearn")
+            )
+            difference = max(difference, _max_difference([batched[c] for c in features.columns],
+                                                          [reference[c] for c in features.columns]))
+    return difference
+
+
+def _check_shape_descriptors():
+    """Batched shape descriptors of calculate_3d_descriptors.py against rdkit.Chem.Descriptors3D."""
+    from rdkit import Chem
+    from rdkit.Chem import Descriptors3D
+    from calculate_3d_descriptors import shape_descriptors
+
+    with tempfile.TemporaryDirectory() as workdir:
+        mols = list(Chem.SDMolSupplier(synthetic.write_sdf(os.path.join(workdir, "frames.sdf"), 8), removeHs=False))
+    coordinates = np.array([mol.GetConformer().GetPositions() for mol in mols])
+    values = shape_descriptors(coordinates, [atom.GetMass() for atom in mols[0].GetAtoms()])
+    batched = [[values[name][k] for name in values] for k in range(len(mols))]
+    reference = [[getattr(Descriptors3D, name)(mol) for name in values] for mol in mols]
+    return _max_difference(batched, reference)
+
+
+CHECKS = {
+    "permutation_importance": (1e-8, _check_permutation_importance),
+    "shape_descriptors": (1e-6, _check_shape_descriptors),
+}
+
+
+def run_checks(checks):
+    """Run the equivalence checks and print their results; return the names of those that failed."""
+    _import_scripts()
+    failed = []
+    for name in checks:
+        tolerance, check = CHECKS[name]
+        with contextlib.redirect_stdout(io.StringIO()):
+            difference = check()
+        passed = difference <= tolerance
+        print(f"{name:<24} max difference {difference:10.3g}  tolerance {tolerance:g}  {'ok' if passed else 'FAILED'}")
+        if not passed:
+            failed.append(name)
+    return failed
+
+
+def measure(run, state, repeat=DEFAULT_REPEAT):
+    """Best wall time of ``repeat`` runs and the tracemalloc peak of one more, with output silenced."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            run(state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return min(times), peak / 2 ** 20
+
+
+def run_benchmarks(stages, scale=1.0, repeat=DEFAULT_REPEAT):
+    """Results of every stage at every size of its sweep, as a list of dicts."""
+    _import_scripts()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for stage in stages:
+            unit, sizes, setup, run = STAGES[stage]
+            for size in sorted({max(MIN_SIZE, int(round(s * scale))) for s in sizes}):
+                state = setup(size, workdir)
+                seconds, peak_mb = measure(run, state, repeat)
+                results.append({"stage": stage, "size": size, "unit": unit, "seconds": seconds,
+                                "per_item_ms": 1000 * seconds / size, "peak_mb": peak_mb})
+                print(f"{stage:<20} {size:>8} {unit:<10} {seconds:10.4f} s {peak_mb:10.1f} MB", flush=True)
+    return results
+
+
+def environment():
+    versions = {"python": platform.python_version()}
+    for module in ["numpy", "pandas", "rdkit", "sklearn"]:
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"), "host": platform.node(),
+            "cpu_count": os.cpu_count(), "versions": versions}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Print current/baseline time ratios for the (stage, size) pairs in both; return the regressions."""
+    reference = {(r["stage"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'stage':<20} {'size':>8} {'baseline s':>12} {'current s':>12} {'ratio':>7} {'peak MB':>16}")
+    for result in results["results"]:
+        base = reference.get((result["stage"], result["size"]))
+        if base is None:
+            continue
+        ratio = result["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{result['stage']:<20} {result['size']:>8} {base['seconds']:12.4f} {result['seconds']:12.4f} "
+              f"{ratio:7.2f} {base['peak_mb']:7.1f} -> {result['peak_mb']:6.1f}{flag}")
+        if ratio > threshold:
+            regressions.append({**result, "baseline_seconds": base["seconds"], "ratio": ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic inputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = subparsers.add_parser("run", help="Run the benchmarks and write the results as JSON.")
+    run_cmd.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES),
+                         help="Stages to benchmark (default: all).")
+    run_cmd.add_argument("--scale", type=float, default=1.0, help="Multiply every sweep size (default: 1).")
+    run_cmd.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Timed runs per size (default: {DEFAULT_REPEAT}).")
+    run_cmd.add_argument("-o", "--output", default="benchmark.json", help="Results file (default: benchmark.json).")
+    run_cmd.add_argument("--baseline", default=None, help="Compare against this results file when done.")
+    run_cmd.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                         help=f"Slowdown ratio reported as a regression (default: {DEFAULT_THRESHOLD}).")
+
+    compare_cmd = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_cmd.add_argument("results")
+    compare_cmd.add_argument("baseline")
+    compare_cmd.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                             help=f"Slowdown ratio reported as a regression (default: {DEFAULT_THRESHOLD}).")
+
+    check_cmd = subparsers.add_parser("check", help="Compare optimized implementations with their references.")
+    check_cmd.add_argument("--checks", nargs="+", choices=list(CHECKS), default=list(CHECKS),
+                           help="Checks to run (default: all).")
+
+    args = parser.parse_args()
+
+    if args.command == "check":
+        failed = run_checks(args.checks)
+        if failed:
+            print(f"{len(failed)} check(s) failed: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    if args.command == "run":
+        results = {"environment": environment(), "scale": args.scale, "repeat": args.repeat,
+                   "results": run_benchmarks(args.stages, args.scale, args.repeat)}
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results saved to {args.output}")
+        baseline_path = args.baseline
+    else:
+        with open(args.results) as f:
+            results = json.load(f)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage/size pairs are more than {args.threshold:g}x slower than {baseline_path}")
+            sys.exit(1)
+        print(f"No regressions against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Memory-mapped conformer ensembles.
+
+Every conformer of a molecule shares one topology; only the coordinates change. An
+ensemble is a directory (by convention ``<name>.ens``) holding:
+
+* ``topology.mol``: the MolBlock of the first conformer (atoms, bonds, charges)
+* ``coordinates.npy``: float32 coordinates of shape (n_conformers, n_atoms, 3)
+* ``names.json``: the title line of every conformer
+* ``c0000.npy``, ...: float64 per-conformer columns (energies, populations, ...)
+* ``ensemble.json``: the manifest naming the columns and their files
+
+Readers memory-map the coordinates and slice them without parsing any text.
+SDF files are converted at the edges of the pipeline: ``from_sdf`` reads the V2000
+records of a single molecule (numeric SD tags become columns) and ``to_sdf``
+writes records back by putting the coordinates into the topology's atom lines.
+
+Usage (from the repository root):
+
+    python -m pipeline.ensemble from-sdf output.sdf output.ens
+    python -m pipeline.ensemble to-sdf output.ens frames.sdf --start 100 --stop 200
+    python -m pipeline.ensemble info output.ens
+
+Only NumPy is needed to read coordinates and columns; RDKit is imported for
+``topology`` and ``mol()``.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+
+MANIFEST = "ensemble.json"
+TOPOLOGY_FILE = "topology.mol"
+COORDINATES_FILE = "coordinates.npy"
+NAMES_FILE = "names.json"
+FORMAT_VERSION = 1
+SDF_DECIMALS = 4  # Coordinate decimals of V2000 atom lines
+COPY_BLOCK_SIZE = 1 << 24
+
+
+def _numeric(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_record(record):
+    """
+    (name, MolBlock lines up to ``M  END``, coordinates (n_atoms, 3), {tag: value}) of
+    one V2000 SDF record; tag values that are not numbers are skipped.
+    """
+    lines = record.splitlines(keepends=True)
+    if len(lines) < 4 or "V3000" in lines[3]:
+        raise ValueError("only V2000 SDF records are supported")
+    n_atoms = int(lines[3][:3])
+    atom_lines = lines[4:4 + n_atoms]
+    coordinates = [(float(line[0:10]), float(line[10:20]), float(line[20:30])) for line in atom_lines]
+
+    end = next((k for k in range(4 + n_atoms, len(lines)) if lines[k].startswith("M  END")), len(lines) - 1)
+    tags = {}
+    k = end + 1
+    while k < len(lines):
+        line = lines[k]
+        if line.startswith(">") and "<" in line and ">" in line[1:]:
+            tag = line[line.index("<") + 1:line.rindex(">")]
+            value = _numeric(lines[k + 1].strip()) if k + 1 < len(lines) else None
+            if value is not None:
+                tags[tag] = value
+            k += 2
+        else:
+            k += 1
+    return lines[0].rstrip("\r\n"), lines[:end + 1], np.array(coordinates, dtype=np.float64), tags
+
+
+def _atom_signature(molblock_lines):
+    n_atoms = int(molblock_lines[3][:3])
+    return [line[31:34].strip() for line in molblock_lines[4:4 + n_atoms]]
+
+
+class EnsembleWriter:
+    """
+    Write an ensemble one batch of conformers at a time. The ensemble is built in
+    ``<path>.tmp`` and moved into place on close, so readers never see a partial one.
+    """
+
+    def __init__(self, path, topology):
+        """``topology`` is a MolBlock (str) or an RDKit molecule."""
+        if not isinstance(topology, str):
+            from rdkit import Chem
+            topology = Chem.MolToMolBlock(topology)
+        self.path = path
+        self.tmp = path.rstrip(os.sep) + ".tmp"
+        self.topology = topology
+        self.n_atoms = int(topology.splitlines()[3][:3])
+        self.n_conformers = 0
+        self.names = []
+        self.columns = {}
+
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        with open(os.path.join(self.tmp, TOPOLOGY_FILE), "w") as f:
+            f.write(topology)
+        self._raw = open(os.path.join(self.tmp, COORDINATES_FILE + ".raw"), "wb")
+
+    def append(self, coordinates, names=None, **columns):
+        """Add conformers (n, n_atoms, 3) with optional names and per-conformer column values."""
+        coordinates = np.asarray(coordinates, dtype=np.float32).reshape(-1, self.n_atoms, 3)
+        n = len(coordinates)
+        self._raw.write(np.ascontiguousarray(coordinates).tobytes())
+        self.names.extend(names if names is not None else [""] * n)
+        for name, values in columns.items():
+            # Columns missing from earlier batches are NaN there
+            column = self.columns.setdefault(name, [np.full(self.n_conformers, np.nan)])
+            column.append(np.asarray(values, dtype=np.float64).reshape(n))
+        for name, column in self.columns.items():
+            if name not in columns:
+                column.append(np.full(n, np.nan))
+        self.n_conformers += n
+
+    def close(self):
+        self._raw.close()
+        raw_path = os.path.join(self.tmp, COORDINATES_FILE + ".raw")
+        with open(raw_path, "rb") as raw, open(os.path.join(self.tmp, COORDINATES_FILE), "wb") as f:
+            header = {"descr": "<f4", "fortran_order": False, "shape": (self.n_conformers, self.n_atoms, 3)}
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(raw, f, COPY_BLOCK_SIZE)
+        os.remove(raw_path)
+
+        with open(os.path.join(self.tmp, NAMES_FILE), "w") as f:
+            json.dump(self.names, f)
+        manifest_columns = []
+        for k, (name, parts) in enumerate(self.columns.items()):
+            manifest_columns.append({"name": name, "file": f"c{k:04d}.npy"})
+            np.save(os.path.join(self.tmp, manifest_columns[-1]["file"]), np.concatenate(parts))
+        with open(os.path.join(self.tmp, MANIFEST), "w") as f:
+            json.dump({"version": FORMAT_VERSION, "n_conformers": self.n_conformers, "n_atoms": self.n_atoms,
+                       "columns": manifest_columns}, f, indent=1)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(self.tmp, self.path)
+
+    def abort(self):
+        self._raw.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ConformerMols:
+    """Sequence of RDKit molecules for conformers [start, stop), each built on first access."""
+
+    def __init__(self, ensemble, start, stop):
+        self.ensemble = ensemble
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, k):
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        return self.ensemble.mol(self.start + k)
+
+
+class ConformerEnsemble:
+    """Read access to an ensemble directory; coordinates and columns are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported ensemble version {self.manifest.get('version')}")
+        self.coordinates = np.load(os.path.join(path, COORDINATES_FILE), mmap_mode="r")
+        with open(os.path.join(path, TOPOLOGY_FILE)) as f:
+            self.molblock = f.read()
+        self._names = None
+        self._topology = None
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    @property
+    def n_atoms(self):
+        return self.coordinates.shape[1]
+
+    @property
+    def names(self):
+        if self._names is None:
+            with open(os.path.join(self.path, NAMES_FILE)) as f:
+                self._names = json.load(f)
+        return self._names
+
+    @property
+    def columns(self):
+        return [column["name"] for column in self.manifest["columns"]]
+
+    def column(self, name):
+        """Memory-mapped float64 values of one per-conformer column."""
+        for column in self.manifest["columns"]:
+            if column["name"] == name:
+                return np.load(os.path.join(self.path, column["file"]), mmap_mode="r")
+        raise KeyError(f"Column '{name}' is not in the ensemble {self.path}")
+
+    def set_column(self, name, values):
+        """Add or replace a per-conformer column."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(self),):
+            raise ValueError(f"Column '{name}' has shape {values.shape}, expected ({len(self)},)")
+        files = {column["name"]: column["file"] for column in self.manifest["columns"]}
+        if name not in files:
+            files[name] = f"c{len(self.manifest['columns']):04d}.npy"
+            self.manifest["columns"].append({"name": name, "file": files[name]})
+
+        # Column file first, then the manifest that names it
+        tmp = os.path.join(self.path, files[name] + ".tmp.npy")
+        np.save(tmp, values)
+        os.replace(tmp, os.path.join(self.path, files[name]))
+        tmp = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+    def positions(self, start=0, stop=None):
+        """
+        Float64 coordinates of conformers [start, stop), rounded to the decimals of
+        SDF atom lines, so results equal those computed from the SDF text.
+        """
+        return np.round(np.asarray(self.coordinates[start:stop], dtype=np.float64), SDF_DECIMALS)
+
+    @property
+    def topology(self):
+        """Sanitized RDKit molecule of the topology (coordinates of the first conformer)."""
+        if self._topology is None:
+            from rdkit import Chem
+            mol = Chem.MolFromMolBlock(self.molblock, sanitize=False, removeHs=False)
+            if mol is None:
+                raise ValueError(f"RDKit could not read the topology of {self.path}")
+            Chem.SanitizeMol(mol)
+            self._topology = mol
+        return self._topology
+
+    def mol(self, i):
+        """RDKit molecule of conformer ``i``, named like its SDF record."""
+        from rdkit import Chem
+        from rdkit.Geometry import Point3D
+
+        mol = Chem.Mol(self.topology)
+        conformer = mol.GetConformer()
+        for k, (x, y, z) in enumerate(self.positions(i, i + 1)[0].tolist()):
+            conformer.SetAtomPosition(k, Point3D(x, y, z))
+        mol.SetProp("_Name", self.names[i])
+        return mol
+
+    def mols(self, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return ConformerMols(self, start, max(start, stop))
+
+    def records(self, start=0, stop=None, columns=None):
+        """SDF text of conformers [start, stop), with the given columns (default: all) as SD tags."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        lines = self.molblock.splitlines(keepends=True)
+        n_atoms = self.n_atoms
+        head = "".join(lines[1:4])
+        atom_tails = [line[30:] for line in lines[4:4 + n_atoms]]
+        tail = "".join(lines[4 + n_atoms:])
+        if not tail.endswith("\n"):
+            tail += "\n"
+        columns = self.columns if columns is None else columns
+        values = {name: self.column(name)[start:stop].tolist() for name in columns}
+
+        records = []
+        for k, frame in enumerate(self.positions(start, stop).tolist()):
+            atom_block = "".join(f"{x:10.4f}{y:10.4f}{z:10.4f}{rest}" for (x, y, z), rest in zip(frame, atom_tails))
+            tags = "".join(f">  <{name}>\n{column[k]!r}\n\n" for name, column in values.items() if not math.isnan(column[k]))
+            records.append(f"{self.names[start + k]}\n{head}{atom_block}{tail}{tags}$$$$\n")
+        return records
+
+    def chunks(self, chunk_size):
+        """(start, stop) ranges of consecutive chunks of ``chunk_size`` conformers, as SDFIndex.chunks."""
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        return [(start, min(start + chunk_size, len(self))) for start in range(0, len(self), chunk_size)]
+
+    def write_ranges(self, output_pattern, ranges):
+        """Write conformers [start, stop) of the k-th range as SDF to ``output_pattern.format(k)``, k from 1."""
+        paths = []
+        for k, (start, stop) in enumerate(ranges, start=1):
+            path = output_pattern.format(k)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.writelines(self.records(start, stop))
+            paths.append(path)
+        return paths
+
+
+def iter_sdf_records(sdf_file):
+    """Text of each record of an SDF file, read line by line."""
+    record = []
+    with open(sdf_file) as f:
+        for line in f:
+            if line.startswith("$$$$"):
+                yield "".join(record)
+                record = []
+            else:
+                record.append(line)
+    if "".join(record).strip():
+        yield "".join(record)
+
+
+def from_sdf(sdf_file, path, batch_size=1000):
+    """Convert a multi-conformer SDF of one molecule to an ensemble; returns the number of conformers."""
+    writer = None
+    signature = None
+    batch = []
+
+    def flush():
+        names = [name for name, _, _ in batch]
+        tags = sorted({tag for _, _, record_tags in batch for tag in record_tags})
+        columns = {tag: [record_tags.get(tag, np.nan) for _, _, record_tags in batch] for tag in tags}
+        writer.append(np.array([xyz for _, xyz, _ in batch]), names, **columns)
+        batch.clear()
+
+    try:
+        for k, record in enumerate(iter_sdf_records(sdf_file), start=1):
+            name, molblock, xyz, tags = parse_record(record)
+            if writer is None:
+                writer = EnsembleWriter(path, "".join(molblock))
+                signature = _atom_signature(molblock)
+            elif _atom_signature(molblock) != signature:
+                raise ValueError(f"{sdf_file}: record {k} has different atoms than the first record")
+            batch.append((name, xyz, tags))
+            if len(batch) == batch_size:
+                flush()
+        if writer is None:
+            raise ValueError(f"No records found in {sdf_file}")
+        if batch:
+            flush()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    writer.close()
+    return writer.n_conformers
+
+
+def to_sdf(path, sdf_file, start=0, stop=None, columns=None, batch_size=1000):
+    """Write conformers [start, stop) of an ensemble as SDF records; returns the number written."""
+    ensemble = ConformerEnsemble(path)
+    start, stop, _ = slice(start, stop).indices(len(ensemble))
+    with open(sdf_file, "w") as f:
+        for first in range(start, stop, batch_size):
+            f.writelines(ensemble.records(first, min(first + batch_size, stop), columns))
+    return max(0, stop - start)
+
+
+def is_ensemble(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between SDF files and memory-mapped conformer ensembles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    from_cmd = subparsers.add_parser("from-sdf", help="Convert a multi-conformer SDF to an ensemble.")
+    from_cmd.add_argument("sdf_file")
+    from_cmd.add_argument("ensemble")
+
+    to_cmd = subparsers.add_parser("to-sdf", help="Write conformers of an ensemble as SDF.")
+    to_cmd.add_argument("ensemble")
+    to_cmd.add_argument("sdf_file")
+    to_cmd.add_argument("-s", "--start", type=int, default=0, help="First conformer, 0-based (default: 0).")
+    to_cmd.add_argument("-e", "--stop", type=int, default=None, help="Stop conformer, exclusive (default: all).")
+    to_cmd.add_argument("-c", "--columns", nargs="*", default=None, help="Columns written as SD tags (default: all).")
+
+    info_cmd = subparsers.add_parser("info", help="Print the size and columns of an ensemble.")
+    info_cmd.add_argument("ensemble")
+
+    args = parser.parse_args()
+
+    if args.command == "from-sdf":
+        n = from_sdf(args.sdf_file, args.ensemble)
+        print(f"{n} conformers of {args.sdf_file} saved to {args.ensemble}")
+    elif args.command == "to-sdf":
+        n = to_sdf(args.ensemble, args.sdf_file, args.start, args.stop, args.columns)
+        print(f"{n} conformers of {args.ensemble} saved to {args.sdf_file}")
+    else:
+        ensemble = ConformerEnsemble(args.ensemble)
+        print(f"{len(ensemble)} conformers of {ensemble.n_atoms} atoms")
+        for name in ensemble.columns:
+            print(f"    {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Submit-and-wait pipeline orchestrator.
+
+``pipeline.runner`` submits one stage for every molecule and exits, so the next
+stage has to be started by hand. The orchestrator instead follows each molecule
+through the stages on its own. When a molecule's job for one stage has finished
+and its outputs exist, that molecule's next stage is submitted right away, while
+other molecules are still queued or running. The jobs of all molecules are
+polled together, with one ``Scheduler.status()`` call (one ``qstat`` on PBS)
+every ``--poll`` seconds. A stage that fails is resubmitted after an
+exponentially growing delay, up to ``--retries`` times. Campaign-wide stages
+(``ml_models``) start once every molecule has finished its stages.
+
+Stages that are up to date in the runner's state file are skipped, and results
+are recorded there, so the runner and the orchestrator can be mixed. Nothing
+waits for input, so a whole campaign can run unattended:
+
+    python -m pipeline.orchestrator --scheduler local --poll 5
+    nohup python -m pipeline.orchestrator --mols 1 2 3 --poll 120 > orchestrator.log &
+"""
+import argparse
+import asyncio
+import datetime
+import os
+
+from pipeline import telemetry
+from pipeline.runner import PipelineRunner, build_stages, discover_molecules, outputs_exist
+from pipeline.scheduler import FAILED, FINISHED_STATES, SCHEDULERS, UNKNOWN, get_scheduler
+
+DEFAULT_POLL = 60  # Seconds between status polls
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 300  # Seconds before the first retry; doubled for every further retry
+UNKNOWN_POLLS = 3  # Consecutive polls a job may be missing from qstat before it counts as finished
+
+
+def log(message):
+    print(f"[{datetime.datetime.now():%H:%M:%S}] {message}", flush=True)
+
+
+class JobWatcher:
+    """Polls the state of every pending job in one status() call and wakes the stages waiting on them."""
+
+    def __init__(self, scheduler, poll_interval=DEFAULT_POLL):
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.pending = {}  # job_id -> future resolved with the final state
+        self.misses = {}
+
+    async def wait(self, job_id):
+        if job_id not in self.pending:
+            self.pending[job_id] = asyncio.get_running_loop().create_future()
+        return await self.pending[job_id]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.pending:
+                continue
+            try:
+                states = await asyncio.to_thread(self.scheduler.status, list(self.pending))
+            except Exception as error:
+                log(f"Status poll failed ({type(error).__name__}: {error}); retrying in {self.poll_interval} s")
+                continue
+
+            for job_id, state in states.items():
+                # Finished jobs drop out of qstat once the server's job history expires
+                if state == UNKNOWN:
+                    self.misses[job_id] = self.misses.get(job_id, 0) + 1
+                    if self.misses[job_id] < UNKNOWN_POLLS:
+                        continue
+                elif state not in FINISHED_STATES:
+                    continue
+                self.misses.pop(job_id, None)
+                self.pending.pop(job_id).set_result(state)
+
+
+def job_ids_of(result):
+    """Job ids returned by a stage's run function; synchronous stages return none."""
+    if isinstance(result, str):
+        return [result]
+    if isinstance(result, (list, tuple)):
+        return [job_id for job_id in result if isinstance(job_id, str)]
+    return []
+
+
+class Orchestrator:
+
+    def __init__(self, runner, poll_interval=DEFAULT_POLL, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_active=0, force=False):
+        self.runner = runner
+        self.stages = runner.stages
+        self.scheduler = runner.scheduler
+        self.watcher = JobWatcher(self.scheduler, poll_interval)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_active = max_active
+        self.force = force
+
+    def up_to_date(self, stage, mol):
+        record = self.runner.refresh(stage, mol)
+        return (not self.force and bool(record) and record["status"] == "done"
+                and record["inputs"] == self.runner.input_hash(stage, mol))
+
+    def mark(self, stage, mol, status):
+        # Hash after the run so in-place rewrites of inputs do not mark the stage stale
+        self.runner.state.setdefault(stage.name, {})[mol or "all"] = {"inputs": self.runner.input_hash(stage, mol), "status": status}
+        self.runner.save()
+
+    def submit(self, stage, mol):
+        """Call the stage's run function under its own span; runs in a worker thread."""
+        with telemetry.track(stage.name, mol=mol, scope="orchestrator"):
+            return stage.run(mol, self.scheduler)
+
+    async def run_stage(self, stage, mol):
+        """Run one stage of one molecule (or of the campaign) until its outputs exist; True on success."""
+        label = f"{stage.name} {mol or 'all'}"
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                log(f"{label}: retry {attempt}/{self.retries} in {delay:g} s")
+                await asyncio.sleep(delay)
+
+            try:
+                result = await asyncio.to_thread(self.submit, stage, mol)
+            except Exception as error:
+                log(f"{label}: submission failed ({type(error).__name__}: {error})")
+                continue
+
+            job_ids = job_ids_of(result)
+            if job_ids:
+                log(f"{label}: waiting for {', '.join(job_ids)}")
+            states = await asyncio.gather(*(self.watcher.wait(job_id) for job_id in job_ids))
+
+            if FAILED not in states and result is not False and outputs_exist(stage.outputs(mol)):
+                self.mark(stage, mol, "done")
+                log(f"{label}: done")
+                return True
+            reason = "a job failed" if FAILED in states else "outputs missing"
+            log(f"{label}: attempt {attempt + 1} failed ({reason})")
+
+        self.mark(stage, mol, "failed")
+        log(f"{label}: giving up after {self.retries + 1} attempts")
+        return False
+
+    async def run_molecule(self, mol, stage_names, slots):
+        async with slots:
+            for name in stage_names:
+                stage = self.stages[name]
+                if not stage.per_molecule:
+                    continue
+                # Upstream stages outside the selection must already be done
+                missing = [dep for dep in stage.deps if dep not in stage_names and not self.runner.is_done(dep, mol)]
+                if missing:
+                    log(f"{name} {mol}: waiting for {', '.join(missing)}, which is not selected")
+                    return False
+                if self.up_to_date(stage, mol):
+                    log(f"{name} {mol}: up to date")
+                    continue
+                if not await self.run_stage(stage, mol):
+                    return False
+            return True
+
+    async def run(self, stage_names, mols):
+        """Run the selected stages for every molecule; returns {molecule or stage: success}."""
+        slots = asyncio.Semaphore(self.max_active or max(1, len(mols)))
+        watcher = asyncio.create_task(self.watcher.run())
+        try:
+            results = dict(zip(mols, await asyncio.gather(*(self.run_molecule(mol, stage_names, slots) for mol in mols))))
+
+            for name in stage_names:
+                stage = self.stages[name]
+                if stage.per_molecule:
+                    continue
+                failed = [mol for mol, ok in results.items() if not ok]
+                if failed:
+                    log(f"{name}: skipped, {len(failed)} molecule(s) did not finish: {', '.join(failed)}")
+                    results[name] = False
+                elif self.up_to_date(stage, None):
+                    log(f"{name}: up to date")
+                    results[name] = True
+                else:
+                    results[name] = await self.run_stage(stage, None)
+        finally:
+            watcher.cancel()
+        return results
+
+
+def main():
+    stages = build_stages()
+
+    parser = argparse.ArgumentParser(description="Run the pipeline unattended, starting each molecule's next stage as soon as the previous one succeeds.")
+    parser.add_argument("--stages", nargs="+", choices=list(stages), default=list(stages), help="Stages to run (default: all, in pipeline order).")
+    parser.add_argument("--mols", nargs="+", type=int, help="Molecule indices (default: every data/mol_N.pdb).")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL, help=f"Seconds between job status polls (default: {DEFAULT_POLL}).")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help=f"Resubmissions of a failed stage (default: {DEFAULT_RETRIES}).")
+    parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF,
+                        help=f"Seconds before the first retry, doubled for each further retry (default: {DEFAULT_BACKOFF}).")
+    parser.add_argument("--max_active", type=int, default=0, help="Molecules in flight at once (default: all).")
+    parser.add_argument("--force", action="store_true", help="Re-run the selected stages even if they are up to date.")
+    args = parser.parse_args()
+
+    mols = [f"mol_{i}" for i in args.mols] if args.mols else discover_molecules()
+    stage_names = [name for name in stages if name in args.stages]
+
+    # The stages' scripts and job commands import pipeline modules from the repository root
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [telemetry.REPO_ROOT, os.environ.get("PYTHONPATH")]))
+
+    runner = PipelineRunner(stages, get_scheduler(args.scheduler))
+    orchestrator = Orchestrator(runner, args.poll, args.retries, args.backoff, args.max_active, args.force)
+    results = asyncio.run(orchestrator.run(stage_names, mols))
+
+    failed = [name for name, ok in results.items() if not ok]
+    print(f"\n{len(results) - len(failed)} of {len(results)} finished" + (f"; failed: {', '.join(failed)}" if failed else ""))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
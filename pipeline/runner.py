@@ -0,0 +1,343 @@
+"""
+Incremental pipeline runner.
+
+Runs the forcefield -> metadynamics -> trajectory_processing -> ani_exec ->
+ani_properties -> ml_models stages as a DAG.  For every stage and molecule the
+runner records a content hash of the stage inputs (``data/mol_N.pdb``, the
+stage template under ``scripts/``, the driver parameters and the outputs of the
+upstream stage).  On the next run only molecules whose hash changed, or whose
+previous attempt failed, are executed again; everything else is left in place.
+
+Usage (from the repository root):
+
+    python -m pipeline.runner --scheduler local
+    python -m pipeline.runner --stages ani_exec ani_properties --mols 1 2 3
+    python -m pipeline.runner --dry-run
+    python -m pipeline.runner --adopt    # start tracking outputs that already exist
+
+With the PBS backend jobs finish after the runner exits.  Their stages are
+recorded as ``submitted`` and are promoted to ``done`` once their outputs
+exist, at which point the next invocation continues with the downstream stages.
+"""
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import os
+import re
+
+from pipeline import telemetry
+from pipeline.scheduler import SCHEDULERS, get_scheduler
+
+STATE_PATH = "outputs/.pipeline_state.json"
+HASH_CACHE_PATH = "outputs/.pipeline_hash_cache.json"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class HashCache:
+    """
+    Content hashes of files, reused while a file's size and mtime are unchanged.
+    Keeps multi-gigabyte trajectories from being re-read on every invocation.
+    """
+
+    def __init__(self, path=HASH_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def digest(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                sha.update(block)
+
+        self.entries[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha.hexdigest()}
+        return self.entries[key]["sha256"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+
+
+def expand_paths(patterns):
+    """Expand files, directories and glob patterns into a sorted list of files."""
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern) or [pattern]:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs[:] = [d for d in dirs if d != "__pycache__"]
+                    files.update(os.path.join(root, name) for name in names)
+            elif os.path.exists(path):
+                files.add(path)
+    return sorted(files)
+
+
+def outputs_exist(patterns):
+    """True when every output path or glob pattern matches at least one file."""
+    return all(glob.glob(pattern) for pattern in patterns)
+
+
+def ani_chunk_outputs(mol):
+    """
+    The optimized_<k>.sdf of every array task listed in files/runs.txt, so a molecule
+    is only complete once all of its chunks are (at least one before the setup has run).
+    """
+    files_dir = f"outputs/ani_exec/{mol}/ani/files"
+    n_tasks = 0
+    if os.path.exists(os.path.join(files_dir, "runs.txt")):
+        with open(os.path.join(files_dir, "runs.txt")) as f:
+            n_tasks = sum(1 for line in f if line.strip())
+    return [os.path.join(files_dir, "sdf", f"optimized_{k}.sdf") for k in range(1, max(n_tasks, 1) + 1)]
+
+
+class Stage:
+    """
+    One pipeline stage.
+    ``inputs``/``outputs`` map a molecule name to paths or glob patterns; ``run``
+    starts the stage for a molecule and returns once it is submitted (or done),
+    with the submitted job id(s) so the orchestrator can poll them.
+    Stages with ``per_molecule=False`` run once for the whole campaign.
+    """
+
+    def __init__(self, name, inputs, outputs, run, deps=(), params=None, per_molecule=True):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.deps = list(deps)
+        self.params = params or {}
+        self.per_molecule = per_molecule
+
+
+def _driver(module_name):
+    # The numbered drivers are not valid identifiers, so import them by name
+    return importlib.import_module(module_name)
+
+
+def build_stages():
+    forcefield = _driver("01_run_forcefield")
+    metadynamics = _driver("02_run_metadynamics")
+    trajectory = _driver("03_run_trajectory_processing")
+    ani = _driver("04_run_ani_exec")
+    ml = _driver("05_submit_ml_models")
+
+    ani_params = {
+        "solvent": ani.solvent,
+        "target_task_hours": ani.target_task_hours,
+        "max_array_tasks": ani.max_array_tasks,
+        "use_clustered_frames": ani.use_clustered_frames,
+        "use_ensemble": ani.use_ensemble,
+    }
+
+    stages = [
+        Stage(
+            "forcefield",
+            inputs=lambda mol: [f"data/{mol}.pdb", forcefield.TEMPLATE_DIR],
+            outputs=lambda mol: [os.path.join(forcefield.OUTPUT_ROOT, mol, f) for f in metadynamics.INPUT_FILES],
+            run=lambda mol, scheduler: forcefield.submit_forcefield(mol, scheduler),
+        ),
+        Stage(
+            "metadynamics",
+            inputs=lambda mol: [metadynamics.TEMPLATE_DIR],
+            outputs=lambda mol: [
+                os.path.join(metadynamics.OUTPUT_ROOT, mol, f)
+                for f in ["system_2.pdb", "system_2.prmtop", "eq_1/md.dcd", "eq_2/md.dcd"]
+            ],
+            run=lambda mol, scheduler: metadynamics.submit_metadynamics(mol, scheduler),
+            deps=["forcefield"],
+        ),
+        Stage(
+            "trajectory_processing",
+            inputs=lambda mol: [trajectory.TEMPLATE_DIR],
+            outputs=lambda mol: [os.path.join(trajectory.OUTPUT_ROOT, mol, "output.sdf")] + (
+                [os.path.join(trajectory.OUTPUT_ROOT, mol, "output_clustered.sdf")]
+                if trajectory.cluster_rmsd is not None else []
+            ),
+            run=lambda mol, scheduler: trajectory.process_trajectory(mol),
+            deps=["metadynamics"],
+            params={"cluster_rmsd": trajectory.cluster_rmsd},
+        ),
+        Stage(
+            "ani_exec",
+            inputs=lambda mol: ["scripts/ani_exec"],
+            outputs=ani_chunk_outputs,
+            run=lambda mol, scheduler: ani.setup_ani_jobs(_mol_index(mol), scheduler),
+            deps=["trajectory_processing"],
+            params=ani_params,
+        ),
+        Stage(
+            "ani_properties",
+            inputs=lambda mol: ["scripts/ani_exec"],
+            outputs=lambda mol: [f"outputs/ani_exec/{mol}/ensemble_averages.csv"],
+            run=lambda mol, scheduler: ani.submit_ani_properties(_mol_index(mol), scheduler),
+            deps=["ani_exec"],
+            params={"solvent": ani.solvent},
+        ),
+        Stage(
+            "ml_models",
+            inputs=lambda mol: [
+                "scripts/ml_models",
+                os.path.join(ml.ml_models_dir, "model_data.csv"),
+                os.path.join(ml.ml_models_dir, "model_template.pbs"),
+                "outputs/ani_exec/mol_*/ensemble_averages.csv",
+            ],
+            outputs=lambda mol: [os.path.join(ml.ml_models_dir, "outputs", "*", "metrics.csv")],
+            run=lambda mol, scheduler: ml.submit_ml_models(scheduler),
+            per_molecule=False,
+        ),
+    ]
+    return {stage.name: stage for stage in stages}
+
+
+def _mol_index(mol_name):
+    return int(mol_name.split("_")[1])
+
+
+def discover_molecules(data_dir="data"):
+    """Molecules with an input structure, e.g. data/mol_1.pdb -> mol_1."""
+    names = []
+    for path in glob.glob(os.path.join(data_dir, "mol_*.pdb")):
+        match = re.fullmatch(r"(mol_\d+)\.pdb", os.path.basename(path))
+        if match:
+            names.append(match.group(1))
+    return sorted(names, key=_mol_index)
+
+
+class PipelineRunner:
+    def __init__(self, stages, scheduler, state_path=STATE_PATH, hash_cache=None):
+        self.stages = stages
+        self.scheduler = scheduler
+        self.state_path = state_path
+        self.hash_cache = hash_cache or HashCache()
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        self.hash_cache.save()
+
+    def input_hash(self, stage, mol):
+        """Hash of the stage parameters, its input files and the outputs of its upstream stages."""
+        sha = hashlib.sha256()
+        sha.update(json.dumps(stage.params, sort_keys=True).encode())
+
+        patterns = list(stage.inputs(mol))
+        for dep in stage.deps:
+            patterns += self.stages[dep].outputs(mol)
+
+        for path in expand_paths(patterns):
+            sha.update(path.encode())
+            sha.update(self.hash_cache.digest(path).encode())
+        return sha.hexdigest()
+
+    def record(self, stage, mol):
+        return self.state.setdefault(stage.name, {}).get(mol or "all")
+
+    def refresh(self, stage, mol):
+        """Promote a submitted stage to done once its outputs have appeared."""
+        record = self.record(stage, mol)
+        if record and record["status"] == "submitted" and outputs_exist(stage.outputs(mol)):
+            record["status"] = "done"
+        return record
+
+    def is_done(self, stage_name, mol):
+        record = self.refresh(self.stages[stage_name], mol)
+        return bool(record) and record["status"] == "done"
+
+    def plan(self, stage, mols, force=False, adopt=False):
+        """
+        Split molecules into (to_run, skipped) lists with a reason for each skip.
+        With ``adopt``, outputs produced before the runner was used are recorded as up to date.
+        """
+        to_run, skipped = [], []
+        for mol in (mols if stage.per_molecule else [None]):
+            if stage.per_molecule and not all(self.is_done(dep, mol) for dep in stage.deps):
+                skipped.append((mol, "waiting for upstream stages"))
+                continue
+
+            record = self.refresh(stage, mol)
+            if adopt and record is None and outputs_exist(stage.outputs(mol)):
+                self.state[stage.name][mol or "all"] = {"inputs": self.input_hash(stage, mol), "status": "done"}
+                skipped.append((mol, "adopted existing outputs"))
+                continue
+            if not force and record and record["inputs"] == self.input_hash(stage, mol):
+                if record["status"] == "done":
+                    skipped.append((mol, "up to date"))
+                    continue
+                if record["status"] == "submitted":
+                    skipped.append((mol, "submitted, outputs pending"))
+                    continue
+            to_run.append(mol)
+        return to_run, skipped
+
+    def run(self, stage_names, mols, force=False, adopt=False, dry_run=False):
+        for name in stage_names:
+            stage = self.stages[name]
+            to_run, skipped = self.plan(stage, mols, force=force, adopt=adopt)
+
+            print(f"\n=== Stage: {name} ===")
+            for mol, reason in skipped:
+                print(f"  skip {mol or 'all'}: {reason}")
+            for mol in to_run:
+                print(f"  run  {mol or 'all'}")
+
+            if dry_run or not to_run:
+                continue
+
+            for mol in to_run:
+                with telemetry.track(name, mol=mol, scope="runner"):
+                    stage.run(mol, self.scheduler)
+            self.scheduler.wait()
+
+            # Hash after the run so in-place rewrites of inputs do not mark the stage stale
+            for mol in to_run:
+                if outputs_exist(stage.outputs(mol)):
+                    status = "done"
+                elif self.scheduler.asynchronous:
+                    status = "submitted"
+                else:
+                    status = "failed"
+                self.state[name][mol or "all"] = {"inputs": self.input_hash(stage, mol), "status": status}
+                print(f"  {mol or 'all'}: {status}")
+            self.save()
+
+        if not dry_run:
+            self.save()
+
+
+def main():
+    stages = build_stages()
+
+    parser = argparse.ArgumentParser(description="Run the pipeline stages, skipping molecules whose inputs are unchanged.")
+    parser.add_argument("--stages", nargs="+", choices=list(stages), default=list(stages), help="Stages to run (default: all, in pipeline order).")
+    parser.add_argument("--mols", nargs="+", type=int, help="Molecule indices (default: every data/mol_N.pdb).")
+    parser.add_argument("--scheduler", choices=list(SCHEDULERS), help="Job scheduler backend (default: $PIPELINE_SCHEDULER or pbs).")
+    parser.add_argument("--force", action="store_true", help="Re-run the selected stages even if they are up to date.")
+    parser.add_argument("--adopt", action="store_true", help="Record existing outputs without a saved state as up to date.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages and molecules would run.")
+    args = parser.parse_args()
+
+    mols = [f"mol_{i}" for i in args.mols] if args.mols else discover_molecules()
+    stage_names = [name for name in stages if name in args.stages]
+
+    runner = PipelineRunner(stages, get_scheduler(args.scheduler))
+    runner.run(stage_names, mols, force=args.force, adopt=args.adopt, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
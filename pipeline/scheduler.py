@@ -0,0 +1,269 @@
+"""
+Job scheduler backends for the pipeline drivers.
+
+Every stage is described by a PBS script (``submit.pbs``, ``submit_array.pbs``,
+``model_template.pbs``...).  The drivers hand those scripts to a scheduler
+instead of calling ``qsub`` themselves:
+
+* ``PBSScheduler`` submits them with ``qsub`` exactly as before.
+* ``LocalScheduler`` runs them with ``bash`` on a bounded pool of workers on the
+  current machine.  The ``ncpus`` requested in the ``#PBS -l select=`` line is
+  reserved for each job, array jobs (``qsub -J``) are expanded into one task per
+  ``PBS_ARRAY_INDEX``, and the usual PBS environment variables are exported so
+  the scripts run unchanged.
+
+The backend is chosen with ``--scheduler`` on the drivers or with the
+``PIPELINE_SCHEDULER`` environment variable (default: ``pbs``).
+
+Both backends report job states through ``status()`` (``qstat`` on PBS), which
+``pipeline.orchestrator`` polls to chain the stages of each molecule.
+"""
+import itertools
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+SCHEDULER_ENV = "PIPELINE_SCHEDULER"
+MAX_CPUS_ENV = "PIPELINE_MAX_CPUS"
+DEFAULT_SCHEDULER = "pbs"
+
+# Thread-pool variables capped to the job's ncpus so local jobs do not oversubscribe
+THREAD_LIMIT_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+# Job states reported by Scheduler.status()
+QUEUED, RUNNING, DONE, FAILED, UNKNOWN = "queued", "running", "done", "failed", "unknown"
+FINISHED_STATES = (DONE, FAILED)
+
+
+def parse_pbs_directives(script_path):
+    """
+    Read the ``#PBS`` header of a job script.
+    Returns a dict with the job name, output file, and requested ncpus.
+    """
+    directives = {"name": None, "output": None, "ncpus": 1}
+    with open(script_path, "r") as f:
+        for line in f:
+            if not line.startswith("#PBS"):
+                continue
+            tokens = line.split()
+            if len(tokens) < 3:
+                continue
+            flag, value = tokens[1], tokens[2]
+            if flag == "-N":
+                directives["name"] = value
+            elif flag == "-o":
+                directives["output"] = value
+            elif flag == "-l":
+                match = re.search(r"ncpus=(\d+)", value)
+                if match:
+                    directives["ncpus"] = int(match.group(1))
+    return directives
+
+
+class Scheduler:
+    """Common interface for submitting PBS-style job scripts."""
+
+    name = None
+    # True when submit() returns before the job has run (e.g. queued on a cluster)
+    asynchronous = False
+
+    def submit(self, script, cwd=".", array=None):
+        """
+        Submit ``script`` (relative to ``cwd``) and return its job id.
+        ``array`` is an optional ``(first, last)`` range, equivalent to ``qsub -J first-last``.
+        """
+        raise NotImplementedError
+
+    def wait(self, job_ids=None):
+        """Block until the given jobs (default: all submitted jobs) have finished."""
+        return {}
+
+    def status(self, job_ids):
+        """
+        ``{job_id: state}`` for the given jobs without blocking. An array job is done
+        once every task exited with status 0 and failed once every task finished
+        with any task failing. Jobs the scheduler no longer knows are ``unknown``.
+        """
+        raise NotImplementedError
+
+
+class PBSScheduler(Scheduler):
+    """Submit jobs to a PBS cluster with ``qsub``."""
+
+    name = "pbs"
+    asynchronous = True
+
+    def submit(self, script, cwd=".", array=None):
+        command = ["qsub"]
+        if array is not None:
+            command += ["-J", f"{array[0]}-{array[1]}"]
+        command.append(script)
+
+        result = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr.strip())
+            raise RuntimeError(f"qsub failed for {os.path.join(cwd, script)}")
+
+        job_id = result.stdout.strip()
+        print(job_id)
+        return job_id
+
+    def status(self, job_ids):
+        # -x includes finished jobs, -t lists the tasks of array jobs; one qstat call for all jobs
+        result = subprocess.run(["qstat", "-x", "-t", "-f", "-F", "json", *job_ids], capture_output=True, text=True)
+        try:
+            jobs = json.loads(result.stdout).get("Jobs", {}) if result.stdout.strip() else {}
+        except json.JSONDecodeError:
+            print(f"Could not parse qstat output: {result.stderr.strip() or result.stdout[:200]}")
+            return {job_id: UNKNOWN for job_id in job_ids}
+
+        states = {}
+        for job_id in job_ids:
+            if "[]" in job_id:
+                prefix, suffix = job_id.split("[]", 1)
+                tasks = [info for name, info in jobs.items()
+                         if name.startswith(prefix + "[") and name.endswith("]" + suffix) and name != job_id]
+            else:
+                tasks = [jobs[job_id]] if job_id in jobs else []
+            states[job_id] = _combine([_pbs_state(info) for info in tasks])
+        return states
+
+
+class LocalScheduler(Scheduler):
+    """
+    Run job scripts on the local machine.
+    At most ``max_cpus`` cores are in use at once; each job holds the ncpus it
+    requests in its ``#PBS -l select=`` line for as long as it runs.
+    """
+
+    name = "local"
+
+    def __init__(self, max_cpus=None):
+        if max_cpus is None:
+            max_cpus = int(os.environ.get(MAX_CPUS_ENV, 0)) or os.cpu_count() or 1
+        self.max_cpus = max_cpus
+        self._free_cpus = max_cpus
+        self._cpu_lock = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_cpus)
+        self._counter = itertools.count(1)
+        self._jobs = {}
+
+    def _acquire(self, ncpus):
+        with self._cpu_lock:
+            self._cpu_lock.wait_for(lambda: self._free_cpus >= ncpus)
+            self._free_cpus -= ncpus
+
+    def _release(self, ncpus):
+        with self._cpu_lock:
+            self._free_cpus += ncpus
+            self._cpu_lock.notify_all()
+
+    def _run_task(self, script_path, cwd, job_id, directives, array_index=None):
+        ncpus = min(directives["ncpus"], self.max_cpus)
+        job_name = directives["name"] or os.path.basename(script_path)
+
+        env = os.environ.copy()
+        env.update({
+            "PBS_O_WORKDIR": cwd,
+            "PBS_JOBID": job_id,
+            "PBS_JOBNAME": job_name,
+            "NCPUS": str(ncpus),
+        })
+        for var in THREAD_LIMIT_VARS:
+            env[var] = str(ncpus)
+
+        seq = job_id.split(".")[-1].split("[")[0]
+        if array_index is not None:
+            env["PBS_ARRAY_INDEX"] = str(array_index)
+            log_name = f"{job_name}.o{seq}.{array_index}"
+        else:
+            log_name = directives["output"] or f"{job_name}.o{seq}"
+        log_path = os.path.join(cwd, log_name)
+
+        self._acquire(ncpus)
+        try:
+            with open(log_path, "w") as log:
+                returncode = subprocess.call(
+                    ["bash", script_path], cwd=cwd, env=env,
+                    stdout=log, stderr=subprocess.STDOUT
+                )
+        finally:
+            self._release(ncpus)
+
+        if returncode != 0:
+            print(f"Local job {job_id} exited with status {returncode} (log: {log_path})")
+        return returncode
+
+    def submit(self, script, cwd=".", array=None):
+        cwd = os.path.abspath(cwd)
+        script_path = os.path.join(cwd, script)
+        directives = parse_pbs_directives(script_path)
+        seq = next(self._counter)
+
+        if array is None:
+            job_id = f"local.{seq}"
+            futures = [self._executor.submit(self._run_task, script_path, cwd, job_id, directives)]
+        else:
+            job_id = f"local.{seq}[]"
+            futures = [
+                self._executor.submit(self._run_task, script_path, cwd, f"local.{seq}[{index}]", directives, index)
+                for index in range(array[0], array[1] + 1)
+            ]
+
+        self._jobs[job_id] = futures
+        print(job_id)
+        return job_id
+
+    def status(self, job_ids):
+        states = {}
+        for job_id in job_ids:
+            task_states = []
+            for future in self._jobs.get(job_id, []):
+                if future.done():
+                    task_states.append(DONE if future.exception() is None and future.result() == 0 else FAILED)
+                else:
+                    task_states.append(RUNNING if future.running() else QUEUED)
+            states[job_id] = _combine(task_states)
+        return states
+
+    def wait(self, job_ids=None):
+        """Wait for jobs and return ``{job_id: [exit status per task]}``."""
+        if job_ids is None:
+            job_ids = list(self._jobs)
+        wait_futures([future for job_id in job_ids for future in self._jobs[job_id]])
+        return {job_id: [future.result() for future in self._jobs[job_id]] for job_id in job_ids}
+
+
+def _pbs_state(info):
+    state = info.get("job_state")
+    if state in ("F", "X"):
+        return DONE if info.get("Exit_status", 0) == 0 else FAILED
+    if state in ("R", "E", "B"):
+        return RUNNING
+    return QUEUED
+
+
+def _combine(task_states):
+    """State of a job from the states of its tasks."""
+    if not task_states:
+        return UNKNOWN
+    if all(state in FINISHED_STATES for state in task_states):
+        return FAILED if FAILED in task_states else DONE
+    return RUNNING if any(state != QUEUED for state in task_states) else QUEUED
+
+
+SCHEDULERS = {
+    PBSScheduler.name: PBSScheduler,
+    LocalScheduler.name: LocalScheduler,
+}
+
+
+def get_scheduler(name=None, **kwargs):
+    """Return a scheduler by name, falling back to ``$PIPELINE_SCHEDULER`` and then PBS."""
+    name = name or os.environ.get(SCHEDULER_ENV, DEFAULT_SCHEDULER)
+    if name not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{name}'. Choose from: {', '.join(SCHEDULERS)}")
+    return SCHEDULERS[name](**kwargs)
@@ -0,0 +1,151 @@
+"""
+Synthetic inputs of controllable size for benchmarking the pipeline stages offline.
+
+Conformer ensembles are built from one RDKit-embedded degrader (compound 6a of
+``data/mol_data.csv``, ~120 atoms with hydrogens) by perturbing its coordinates, so
+no Amber, ANI or Schrödinger run is needed. Energies, property tables and model
+matrices are random but seeded, and use the column names of the real files.
+
+Usage (from the repository root):
+
+    python -m pipeline.synthetic sdf -n 1000 -o frames.sdf
+    python -m pipeline.synthetic pdb -n 1000 -o frames.pdb
+    python -m pipeline.synthetic energies -n 1000 -o output_sp.csv
+    python -m pipeline.synthetic features -n 500 -o model_data.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+DEGRADER_SMILES = (
+    "O=C(C(N1C(C2=CC=CC(NCCOCCOCCOCCC(N(CC3)CCN3C(C=C4)=CC=C4C5=NN(C(NC)=O)[C@@H](C)"
+    "CC6=CC(OC)=C(OC)C=C65)=O)=C2C1=O)=O)CC7)NC7=O"
+)
+EMBED_SEED = 42
+FRAME_NOISE = 0.05  # Per-atom displacement of each frame (Angstrom); larger values create spurious PDB proximity bonds
+N_2D_FEATURES = 17  # Columns of the 2D block of model_data.csv
+FEATURES_3D = [
+    "Ensemble_Average_PSA_Chloroform_ANI",
+    "Ensemble_Average_Num_IMHB_Chloroform_ANI",
+    "Ensemble_Average_RadiusOfGyration_Chloroform_ANI",
+]
+
+_molecule = None
+
+
+def degrader_molecule():
+    """The embedded template molecule (with hydrogens), built once per process."""
+    global _molecule
+    if _molecule is None:
+        from rdkit import Chem
+        from rdkit.Chem import AllChem
+
+        mol = Chem.AddHs(Chem.MolFromSmiles(DEGRADER_SMILES))
+        AllChem.EmbedMolecule(mol, randomSeed=EMBED_SEED)
+        mol.SetProp("_Name", "synthetic_degrader")
+        _molecule = mol
+    return _molecule
+
+
+def conformer_coordinates(n_frames, seed=0, noise=FRAME_NOISE):
+    """Coordinates (n_frames, n_atoms, 3): the template, randomly rotated and perturbed."""
+    rng = np.random.default_rng(seed)
+    template = degrader_molecule().GetConformer().GetPositions()
+    template = template - template.mean(axis=0)
+
+    # Random rotations from normalized quaternions
+    q = rng.normal(size=(n_frames, 4))
+    w, x, y, z = (q / np.linalg.norm(q, axis=1, keepdims=True)).T
+    rotations = np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=1)
+    coordinates = np.einsum("fij,aj->fai", rotations, template)
+    return coordinates + rng.normal(scale=noise, size=coordinates.shape)
+
+
+def _frame_blocks(coordinates, to_block):
+    from rdkit import Chem
+
+    mol = Chem.Mol(degrader_molecule())
+    conformer = mol.GetConformer()
+    for frame in coordinates:
+        for k, (x, y, z) in enumerate(frame):
+            conformer.SetAtomPosition(k, (float(x), float(y), float(z)))
+        yield to_block(mol)
+
+
+def write_sdf(path, n_frames, seed=0):
+    """Multi-record SDF with n_frames conformers of the template, named like output.sdf records."""
+    from rdkit import Chem
+
+    with open(path, "w") as f:
+        for block in _frame_blocks(conformer_coordinates(n_frames, seed), Chem.MolToMolBlock):
+            f.write(block + "$$$$\n")
+    return path
+
+
+def write_pdb(path, n_frames, seed=0):
+    """Multi-frame PDB (frames separated by END, no CONECT records), like the frames.pdb cpptraj writes."""
+    from rdkit import Chem
+
+    with open(path, "w") as f:
+        for block in _frame_blocks(conformer_coordinates(n_frames, seed), lambda m: Chem.MolToPDBBlock(m, flavor=2)):
+            f.write(block)
+    return path
+
+
+def energy_table(n_conformers, seed=0):
+    """Energies in the format of the ANI single-point CSV (mol, hartree, kcal/mol)."""
+    rng = np.random.default_rng(seed)
+    kcal = -1.8e6 + rng.gamma(2.0, 2.0, n_conformers)
+    return pd.DataFrame({
+        "mol": np.arange(n_conformers),
+        "ANI_energy(hartree)": kcal / 627.5094740631,
+        "ANI_energy(kcal/mol)": kcal,
+    })
+
+
+def property_table(n_conformers, seed=0):
+    """Per-conformer PSA, Num_IMHB and RadiusOfGyration, as in properties.csv."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Conformation_ID": np.arange(1, n_conformers + 1),
+        "PSA": rng.normal(200, 20, n_conformers),
+        "Num_IMHB": rng.poisson(1.0, n_conformers),
+        "RadiusOfGyration": rng.normal(7.5, 0.8, n_conformers),
+    })
+
+
+def feature_matrix(n_molecules, seed=0, n_2d=N_2D_FEATURES):
+    """A model_data.csv-like table: 2D columns, the three 3D averages and a P_appLog target."""
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_molecules, n_2d + len(FEATURES_3D)))
+    target = features @ rng.normal(scale=0.3, size=features.shape[1]) + rng.normal(scale=0.3, size=n_molecules)
+    columns = [f"Feature_2D_{k + 1}" for k in range(n_2d)] + FEATURES_3D
+    df = pd.DataFrame(features, columns=columns)
+    df["P_appLog"] = target
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic pipeline inputs of a given size.")
+    parser.add_argument("kind", choices=["sdf", "pdb", "energies", "properties", "features"])
+    parser.add_argument("-n", "--size", type=int, required=True, help="Frames/conformers, or molecules for 'features'.")
+    parser.add_argument("-o", "--output", required=True, help="Output file.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    args = parser.parse_args()
+
+    if args.kind == "sdf":
+        write_sdf(args.output, args.size, args.seed)
+    elif args.kind == "pdb":
+        write_pdb(args.output, args.size, args.seed)
+    else:
+        table = {"energies": energy_table, "properties": property_table, "features": feature_matrix}[args.kind]
+        table(args.size, args.seed).to_csv(args.output, index=False)
+    print(f"Wrote synthetic {args.kind} of size {args.size} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
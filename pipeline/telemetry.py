@@ -0,0 +1,294 @@
+"""
+Per-stage timing and memory telemetry as JSON lines.
+
+Every record is one line of ``outputs/telemetry.jsonl`` (or ``$PIPELINE_TELEMETRY``;
+``off`` disables recording) with the stage, molecule, host, PBS job id, wall time,
+CPU time, peak RSS, item counts (frames, conformers, splits...) and exit status.
+
+* Drivers wrap their work in ``with track("ani_exec", mol="mol_3") as span:`` and
+  may call ``span.count(frames=n)``. Subprocesses started with ``system(command)``
+  or ``env=child_env()`` report their item counts to the span.
+* Job scripts wrap their commands with the ``run`` command, which measures the
+  child processes (CPU time and peak RSS from ``getrusage``):
+
+      python "$PIPELINE_ROOT/pipeline/telemetry.py" run --stage ani_properties -- bash run_ani.sh chloroform
+
+  Python scripts running under it report item counts with ``count_items(conformers=n)``;
+  the counts are summed into the job's record.
+* ``report`` aggregates every telemetry file under ``outputs/`` by stage and flags
+  molecules whose wall time is far from the rest of their stage:
+
+      python -m pipeline.telemetry report
+
+Only the standard library is used, so job scripts can run this file directly.
+"""
+import argparse
+import contextlib
+import contextvars
+import datetime
+import fcntl
+import glob
+import json
+import os
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TELEMETRY_ENV = "PIPELINE_TELEMETRY"
+ITEMS_ENV = "PIPELINE_TELEMETRY_ITEMS"  # Where child scripts of a ``run`` append their item counts
+DEFAULT_LOG = os.path.join(REPO_ROOT, "outputs", "telemetry.jsonl")
+OUTLIER_Z = 3.5  # Robust z-score (median/MAD) above which a molecule is reported as an outlier
+
+# Innermost open span of this thread or task; asyncio.to_thread workers get their own copy
+_active = contextvars.ContextVar("telemetry_span", default=None)
+
+
+def log_path():
+    """Telemetry file, or None when recording is disabled."""
+    path = os.environ.get(TELEMETRY_ENV, DEFAULT_LOG)
+    return None if path.lower() in ("", "off", "0", "none") else path
+
+
+def _append(path, record):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(record) + "\n")
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _mol_from_path(path):
+    matches = re.findall(r"mol_\d+", path)
+    return matches[-1] if matches else None
+
+
+def _rusage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in KiB on Linux
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) / 1024
+
+
+class Span:
+    """One timed unit of work; written as a record when it ends."""
+
+    def __init__(self, stage, mol=None, **tags):
+        self.stage = stage
+        self.mol = mol if mol is not None else _mol_from_path(os.getcwd())
+        self.tags = tags
+        self.items = {}
+        self.status = 0
+        self.error = None
+
+    def count(self, **items):
+        for name, n in items.items():
+            self.items[name] = self.items.get(name, 0) + n
+
+    def start(self):
+        self._wall = time.perf_counter()
+        self._cpu, _ = _rusage()
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        return self
+
+    def record(self):
+        cpu, peak_rss_mb = _rusage()
+        return {
+            "stage": self.stage,
+            "mol": self.mol,
+            "started": self.started,
+            "host": socket.gethostname(),
+            "job_id": os.environ.get("PBS_JOBID"),
+            "array_index": os.environ.get("PBS_ARRAY_INDEX"),
+            "ncpus": int(os.environ.get("NCPUS", 1)),
+            "wall_s": time.perf_counter() - self._wall,
+            "cpu_s": cpu - self._cpu,
+            "peak_rss_mb": peak_rss_mb,
+            "items": self.items,
+            "status": self.status,
+            "error": self.error,
+            **self.tags,
+        }
+
+
+@contextlib.contextmanager
+def track(stage, mol=None, scope="driver", **tags):
+    """
+    Time the enclosed block; an exception is recorded as a non-zero status and re-raised.
+    Subprocesses started inside the block with ``child_env()`` report their item counts to this span.
+    """
+    span = Span(stage, mol, scope=scope, **tags).start()
+    fd, span.items_path = tempfile.mkstemp(prefix="telemetry_items_", suffix=".jsonl")
+    os.close(fd)
+    token = _active.set(span)
+    try:
+        yield span
+    except SystemExit as error:
+        span.status = error.code if isinstance(error.code, int) else int(error.code is not None)
+        raise
+    except BaseException as error:
+        span.status = 1
+        span.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        _active.reset(token)
+        with open(span.items_path) as f:
+            for line in f:
+                span.count(**json.loads(line))
+        os.remove(span.items_path)
+
+        path = log_path()
+        if path:
+            _append(path, span.record())
+
+
+def child_env(**variables):
+    """
+    Environment for a subprocess of the current span: the repository root is on
+    PYTHONPATH and item counts go to the span. ``variables`` are added to it.
+    """
+    env = {**os.environ, **variables}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    span = _active.get()
+    if span is not None:
+        env[ITEMS_ENV] = span.items_path
+    return env
+
+
+def system(command, cwd=None, **variables):
+    """Run a shell command with ``child_env(**variables)`` and return its exit status."""
+    return subprocess.call(command, shell=True, cwd=cwd, env=child_env(**variables))
+
+
+def count_items(**items):
+    """Add item counts to the innermost open span, in this process or in the one that started it."""
+    span = _active.get()
+    if span is not None:
+        span.count(**items)
+        return
+    path = os.environ.get(ITEMS_ENV)
+    if path and os.path.exists(path):
+        _append(path, items)
+
+
+def run_command(stage, command, mol=None):
+    """Run ``command`` under a span and return its exit status."""
+    with track(stage, mol, scope="job", command=" ".join(command)) as span:
+        span.status = subprocess.call(command, env=child_env())
+    return span.status
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def stage_label(record):
+    """Stage name, marked with the scope for records of the drivers rather than the jobs."""
+    scope = record.get("scope", "job")
+    return record["stage"] if scope == "job" else f"{record['stage']} [{scope}]"
+
+
+def outliers(records, z_threshold=OUTLIER_Z):
+    """(stage, mol, wall_s, robust z) for molecules whose total wall time in a stage is unusual."""
+    totals = {}
+    for record in records:
+        if record.get("mol"):
+            key = (stage_label(record), record["mol"])
+            totals[key] = totals.get(key, 0.0) + record["wall_s"]
+
+    flagged = []
+    for stage in sorted({stage for stage, _ in totals}):
+        walls = {mol: wall for (s, mol), wall in totals.items() if s == stage}
+        if len(walls) < 3:
+            continue
+        median = statistics.median(walls.values())
+        mad = statistics.median(abs(w - median) for w in walls.values())
+        if mad == 0:
+            continue
+        for mol, wall in walls.items():
+            z = 0.6745 * (wall - median) / mad
+            if abs(z) > z_threshold:
+                flagged.append((stage, mol, wall, z))
+    return flagged
+
+
+def report(records, z_threshold=OUTLIER_Z):
+    stages = {}
+    for record in records:
+        stages.setdefault(stage_label(record), []).append(record)
+
+    total_core_h = sum(r["wall_s"] * r.get("ncpus", 1) for r in records) / 3600 or 1.0
+    print(f"{'stage':<32} {'runs':>5} {'failed':>6} {'mols':>5} {'wall h':>9} {'core h':>9} {'share':>6} "
+          f"{'cpu h':>9} {'max RSS MB':>11}  items")
+    for stage, rows in sorted(stages.items(), key=lambda kv: -sum(r["wall_s"] * r.get("ncpus", 1) for r in kv[1])):
+        core_h = sum(r["wall_s"] * r.get("ncpus", 1) for r in rows) / 3600
+        items = {}
+        for r in rows:
+            for name, n in (r.get("items") or {}).items():
+                items[name] = items.get(name, 0) + n
+        wall = sum(r["wall_s"] for r in rows)
+        item_text = ", ".join(f"{n} {name} ({wall / n:.3g} s each)" for name, n in items.items() if n)
+        print(f"{stage:<32} {len(rows):>5} {sum(1 for r in rows if r['status']):>6} "
+              f"{len({r['mol'] for r in rows if r.get('mol')}):>5} {wall / 3600:9.3f} {core_h:9.3f} "
+              f"{core_h / total_core_h:6.1%} {sum(r['cpu_s'] for r in rows) / 3600:9.3f} "
+              f"{max(r['peak_rss_mb'] for r in rows):11.1f}  {item_text}")
+
+    flagged = outliers(records, z_threshold)
+    if flagged:
+        print(f"\nOutliers (robust z > {z_threshold:g} on total wall time per molecule):")
+        for stage, mol, wall, z in flagged:
+            print(f"  {stage:<32} {mol:<10} {wall / 60:9.1f} min  z = {z:+.1f}")
+
+    failed = [r for r in records if r["status"]]
+    if failed:
+        print(f"\nFailed runs: {len(failed)}")
+        for r in failed[-20:]:
+            print(f"  {r['started']}  {stage_label(r):<32} {r.get('mol') or '-':<10} status {r['status']}  {r.get('error') or r.get('command', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and report per-stage pipeline telemetry.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = subparsers.add_parser("run", help="Run a command and record its telemetry.")
+    run_cmd.add_argument("--stage", required=True, help="Stage name, e.g. ani_properties.")
+    run_cmd.add_argument("--mol", default=None, help="Molecule (default: the last mol_N in the working directory).")
+    run_cmd.add_argument("cmd", nargs=argparse.REMAINDER, help="Command to run, after '--'.")
+
+    report_cmd = subparsers.add_parser("report", help="Summarize telemetry by stage and list outlier molecules.")
+    report_cmd.add_argument("files", nargs="*",
+                            help="Telemetry files (default: every *telemetry*.jsonl under outputs/).")
+    report_cmd.add_argument("--stages", nargs="+", default=None, help="Only these stages.")
+    report_cmd.add_argument("--z", type=float, default=OUTLIER_Z, help=f"Outlier robust z-score (default: {OUTLIER_Z}).")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        command = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+        if not command:
+            parser.error("run needs a command after '--'")
+        sys.exit(run_command(args.stage, command, args.mol))
+
+    files = args.files or sorted(glob.glob(os.path.join(REPO_ROOT, "outputs", "**", "*telemetry*.jsonl"), recursive=True))
+    records = load_records(files)
+    if args.stages:
+        records = [r for r in records if r["stage"] in args.stages]
+    if not records:
+        print("No telemetry records found.")
+        return
+    print(f"{len(records)} records from {len(files)} file(s)\n")
+    report(records, args.z)
+
+
+if __name__ == "__main__":
+    main()
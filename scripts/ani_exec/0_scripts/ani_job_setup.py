@@ -1,60 +1,63 @@
 import os
-import math
+import shutil
 import argparse
-from rdkit import Chem
+import numpy as np
+
+from pipeline_root import PIPELINE_ROOT
+from pipeline.ensemble import ConformerEnsemble, is_ensemble
+from pipeline.scheduler import get_scheduler
+from pipeline.telemetry import count_items
+from sdf_index import SDFIndex
+from chunk_planner import PLAN_FILE, heavy_atom_counts, load_model, plan_chunks, save_plan
+
+DEFAULT_COST_MODEL = os.path.join(PIPELINE_ROOT, "outputs", "ani_exec", "cost_model.json")
+JOB_ID_FILE = "array_job_id.txt"  # Read by 04_run_ani_exec.py so the orchestrator can poll the array
+
+def open_conformers(path):
+    # A conformer ensemble (pipeline/ensemble.py) is sliced from its memory map and its chunks
+    # written as SDF for the ANI worker; an SDF is indexed and its chunks copied as byte ranges
+    return ConformerEnsemble(path) if is_ensemble(path) else SDFIndex(path)
 
 def split_sdf(input_file, output_dir, chunk_size):
-    # Check if output directory exists, create it if not
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Read the input SDF
-    supplier = Chem.SDMolSupplier(input_file, removeHs=False)
-    if not supplier:
-        raise ValueError(f"Failed to read the input SDF file: {input_file}")
-
-    # Split the file
-    current_chunk = []
-    chunk_count = 0
-
-    for i, mol in enumerate(supplier):
-        if mol is None:
-            continue  # Skip invalid molecules
-
-        current_chunk.append(mol)
-
-        # Write to a new file when the chunk size is reached
-        if len(current_chunk) == chunk_size:
-            chunk_dir = os.path.join(output_dir, f"chunk_{chunk_count + 1}")
-            os.makedirs(chunk_dir, exist_ok=True)
-
-            output_file = os.path.join(chunk_dir, f"chunk_{chunk_count + 1}.sdf")
-            writer = Chem.SDWriter(output_file)
-            for m in current_chunk:
-                writer.write(m)
-            writer.close()
-
-            current_chunk = []
-            chunk_count += 1
-
-    # Write any remaining molecules to a final chunk
-    if current_chunk:
-        chunk_dir = os.path.join(output_dir, f"chunk_{chunk_count + 1}")
-        os.makedirs(chunk_dir, exist_ok=True)
-
-        output_file = os.path.join(chunk_dir, f"chunk_{chunk_count + 1}.sdf")
-        writer = Chem.SDWriter(output_file)
-        for m in current_chunk:
-            writer.write(m)
-        writer.close()
+    # Chunks are copied as byte ranges of the indexed SDF; records are not parsed or rewritten
+    index = open_conformers(input_file)
+    chunk_files = index.write_ranges(os.path.join(output_dir, "chunk_{0}", "chunk_{0}.sdf"), index.chunks(chunk_size))
+    chunk_count = len(chunk_files)
+    count_items(chunks=chunk_count)
 
     print(f"SDF split into {chunk_count} files in separate directories under: {output_dir}")
     return chunk_count
 
-def setup_jobs(solvent, total_configurations, chunk_size, sdf_file, files_dir, template_pbs):
-    # Calculate number of jobs
-    num_jobs = math.ceil(total_configurations / chunk_size)
-    
+def copy_populations(populations_csv, sdf_file, files_dir):
+    # Cluster populations are matched to conformers by position
+    n_rows = sum(1 for line in open(populations_csv, "r") if line.strip()) - 1
+    n_mols = len(open_conformers(sdf_file))
+    if n_rows != n_mols:
+        raise ValueError(f"{populations_csv} has {n_rows} populations but {sdf_file} has {n_mols} conformers")
+    shutil.copy(populations_csv, os.path.join(files_dir, "cluster_populations.csv"))
+
+def plan_split(sdf_file, chunks_dir, plan_path, target_hours, max_tasks, cost_model=DEFAULT_COST_MODEL):
+    # Chunks of equal predicted cost under the target wall time, cut as byte ranges of the indexed SDF
+    index = open_conformers(sdf_file)
+    if isinstance(index, ConformerEnsemble):
+        # Every conformer of an ensemble shares its topology
+        heavy = np.full(len(index), index.topology.GetNumHeavyAtoms())
+    else:
+        heavy = heavy_atom_counts(index)
+    plan = plan_chunks(heavy, load_model(cost_model), target_hours, max_tasks)
+    save_plan(plan, plan_path)
+    index.write_ranges(os.path.join(chunks_dir, "chunk_{0}", "chunk_{0}.sdf"), [(c["start"], c["stop"]) for c in plan["chunks"]])
+    chunk_count = len(plan["chunks"])
+    count_items(chunks=chunk_count)
+
+    if not chunk_count:
+        return 0
+    longest = max(c["predicted_s"] for c in plan["chunks"])
+    print(f"SDF split into {chunk_count} chunks of {len(index)} conformers under: {chunks_dir} (longest predicted task {longest / 60:.1f} min)")
+    return chunk_count
+
+def setup_jobs(solvent, sdf_file, files_dir, template_pbs, populations_csv=None,
+               target_hours=1.0, max_tasks=500, chunk_size=None, cost_model=DEFAULT_COST_MODEL):
     # Directory structure setup
     chunks_dir = os.path.join(files_dir, "chunks")
     jobs_dir = os.path.join(files_dir, "jobs")
@@ -63,14 +66,29 @@ def setup_jobs(solvent, total_configurations, chunk_size, sdf_file, files_dir, t
     os.makedirs(os.path.join(files_dir, "sdf"), exist_ok=True)
     os.makedirs(os.path.join(files_dir, "csv"), exist_ok=True)
 
-    # Split SDF into chunks
-    chunk_count = split_sdf(sdf_file, chunks_dir, chunk_size)
+    # Keep cluster populations next to the job files for the Boltzmann weighting in run_ani.sh
+    if populations_csv:
+        copy_populations(populations_csv, sdf_file, files_dir)
+
+    # Split SDF into chunks: a fixed number of conformers each, or sized by the cost model
+    if chunk_size:
+        chunk_count = split_sdf(sdf_file, chunks_dir, chunk_size)
+    else:
+        chunk_count = plan_split(sdf_file, chunks_dir, os.path.join(files_dir, PLAN_FILE), target_hours, max_tasks, cost_model)
+
+    if chunk_count == 0:
+        # Nothing to minimize (e.g. extraction or clustering produced no frames); an empty
+        # runs.txt leaves ani_exec incomplete instead of submitting a 1-0 array
+        open(os.path.join(files_dir, "runs.txt"), "w").close()
+        print(f"No conformers in {sdf_file}; no ANI jobs submitted for solvent '{solvent}'.")
+        return
 
     # Generate PBS job file
     pbs_output_path = os.path.join(jobs_dir, "submit_array.pbs")
     with open(template_pbs, "r") as template, open(pbs_output_path, "w") as output:
         for line in template:
-            output.write(line.replace("ANI2x_SOLVENT", f"{solvent}"))
+            # The array tasks run in files/chunks/chunk_N and do not inherit the environment
+            output.write(line.replace("ANI2x_SOLVENT", f"{solvent}").replace("ANI_PIPELINE_ROOT", os.path.abspath(PIPELINE_ROOT)))
 
     # Generate runs.txt
     runs_txt_path = os.path.join(files_dir, "runs.txt")
@@ -80,23 +98,30 @@ def setup_jobs(solvent, total_configurations, chunk_size, sdf_file, files_dir, t
             runs_file.write(f"{chunk_path}\n")
 
     # Submit jobs
-    job_array_command = f"cd {jobs_dir} && qsub -J 1-{chunk_count} submit_array.pbs"
-    os.system(job_array_command)
+    scheduler = get_scheduler()
+    job_id = scheduler.submit("submit_array.pbs", cwd=jobs_dir, array=(1, chunk_count))
+    with open(os.path.join(files_dir, JOB_ID_FILE), "w") as f:
+        f.write(job_id + "\n")
+    scheduler.wait()
 
-    print(f"Setup complete for solvent '{solvent}'. Generated {chunk_count} jobs with chunk size {chunk_size}.")
+    print(f"Setup complete for solvent '{solvent}'. Generated {chunk_count} jobs.")
 
 def main():
     parser = argparse.ArgumentParser(description="Set up and submit jobs for ANI computation.")
     parser.add_argument("solvent", type=str, help="Solvent type (e.g., chloroform, water).")
-    parser.add_argument("sdf_file", type=str, help="Path to the input SDF file.")
-    parser.add_argument("total_configurations", type=int, help="Total number of configurations (required).")
-    parser.add_argument("chunk_size", type=int, help="Number of configurations per chunk (required).")
+    parser.add_argument("sdf_file", type=str, help="Path to the input SDF file or conformer ensemble (.ens).")
     parser.add_argument("files_dir", type=str, help="Base directory for generated files.")
     parser.add_argument("template_pbs", type=str, help="Path to the PBS template file.")
+    parser.add_argument("--populations", type=str, default=None, help="Cluster populations CSV from cluster_conformers.py (optional).")
+    parser.add_argument("--target_hours", type=float, default=1.0, help="Target wall time per array task for the cost model (default: 1).")
+    parser.add_argument("--max_tasks", type=int, default=500, help="Maximum number of array tasks (default: 500).")
+    parser.add_argument("--cost_model", type=str, default=DEFAULT_COST_MODEL, help=f"Cost model fitted by chunk_planner.py refine (default: {DEFAULT_COST_MODEL}; the built-in prior when missing).")
+    parser.add_argument("--chunk_size", type=int, default=None, help="Fixed number of configurations per chunk instead of the cost model.")
 
     args = parser.parse_args()
 
-    setup_jobs(args.solvent, args.total_configurations, args.chunk_size, args.sdf_file, args.files_dir, args.template_pbs)
+    setup_jobs(args.solvent, args.sdf_file, args.files_dir, args.template_pbs, args.populations,
+               args.target_hours, args.max_tasks, args.chunk_size, args.cost_model)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,292 @@
+"""
+Optimize every conformer of an SDF chunk in one long-lived process.
+
+The calculator (and, for TorchANI, the model) is loaded once. Conformers with the
+same atoms are optimized together in batches with a vectorized FIRE minimizer,
+each conformer converging independently. A conformer whose optimization fails or
+runs past the timeout falls back to a single-point energy on its input geometry,
+as run_ani_batch.sh did per molecule. Outputs match run_ANI.py: an SDF with the
+ANI energies as properties and a CSV with mol, ANI_energy(hartree), ANI_energy(kcal/mol).
+"""
+import csv
+import time
+import argparse
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
+HARTREE_TO_KCALMOL = 627.5094740631
+HARTREE_TO_EV = 27.211386024367243
+
+# FIRE parameters (Bitzek et al., PRL 97, 170201), in eV, Angstrom and ASE time units
+FIRE_DT = 0.1
+FIRE_DT_MAX = 1.0
+FIRE_MAX_STEP = 0.2
+FIRE_N_MIN = 5
+FIRE_F_INC = 1.1
+FIRE_F_DEC = 0.5
+FIRE_ALPHA_START = 0.1
+FIRE_F_ALPHA = 0.99
+
+
+class Calculator:
+    """
+    Energy and force backend. ``energies_and_forces`` takes the RDKit molecule
+    shared by a batch and coordinates of shape (n_conformers, n_atoms, 3) in Angstrom,
+    and returns energies in hartree (n_conformers,) and forces in hartree/Angstrom.
+    """
+    name = None
+
+    def energies_and_forces(self, mol, coordinates):
+        raise NotImplementedError
+
+
+class TorchANICalculator(Calculator):
+    """
+    TorchANI model evaluated on the whole batch at once. ``model`` names a stock
+    torchani model (e.g. ANI2x); other models, such as the solvent variants, are
+    loaded from ``model_file`` (TorchScript or a pickled module).
+    """
+    name = "torchani"
+
+    def __init__(self, model="ANI2x", model_file=None, device=None):
+        import torch
+        import torchani
+
+        self.torch = torch
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        if model_file:
+            try:
+                self.model = torch.jit.load(model_file, map_location=self.device)
+            except RuntimeError:
+                self.model = torch.load(model_file, map_location=self.device, weights_only=False)
+        elif hasattr(torchani.models, model):
+            self.model = getattr(torchani.models, model)(periodic_table_index=True)
+        else:
+            raise ValueError(f"torchani has no model named '{model}'; pass --model_file (ANI_MODEL_FILE in run_ani_batch.sh) for custom models")
+        self.model = self.model.to(self.device).eval()
+
+    def energies_and_forces(self, mol, coordinates):
+        torch = self.torch
+        species = torch.tensor(
+            [[atom.GetAtomicNum() for atom in mol.GetAtoms()]] * len(coordinates), device=self.device
+        )
+        xyz = torch.tensor(coordinates, dtype=torch.float32, device=self.device, requires_grad=True)
+        energies = self.model((species, xyz)).energies
+        forces = -torch.autograd.grad(energies.sum(), xyz)[0]
+        return energies.detach().cpu().double().numpy(), forces.cpu().double().numpy()
+
+
+class MMFFCalculator(Calculator):
+    """RDKit MMFF94 stand-in for running and testing the worker without TorchANI."""
+    name = "mmff"
+
+    def energies_and_forces(self, mol, coordinates):
+        props = AllChem.MMFFGetMoleculeProperties(mol)
+        if props is None:
+            raise ValueError("MMFF94 parameters are not available for this molecule")
+        ff = AllChem.MMFFGetMoleculeForceField(mol, props)
+        energies = np.empty(len(coordinates))
+        forces = np.empty_like(coordinates)
+        for k, xyz in enumerate(coordinates):
+            positions = xyz.ravel().tolist()
+            energies[k] = ff.CalcEnergy(positions)
+            forces[k] = -np.reshape(ff.CalcGrad(positions), xyz.shape)
+        return energies / HARTREE_TO_KCALMOL, forces / HARTREE_TO_KCALMOL
+
+
+CALCULATORS = {cls.name: cls for cls in (TorchANICalculator, MMFFCalculator)}
+
+
+def fire_minimize(calculator, mol, coordinates, fmax, max_steps, deadline):
+    """
+    Minimize a batch of conformers with FIRE, each with its own step size and mixing.
+    Returns (coordinates, energies in hartree, status) where status is
+    'converged', 'max_steps', 'failed' (non-finite energy or forces) or 'timeout'.
+    """
+    x = np.array(coordinates, dtype=np.float64)
+    n = len(x)
+    v = np.zeros_like(x)
+    dt = np.full(n, FIRE_DT)
+    alpha = np.full(n, FIRE_ALPHA_START)
+    n_positive = np.zeros(n, dtype=int)
+    energies = np.full(n, np.nan)
+    status = np.full(n, "timeout", dtype=object)
+    active = np.arange(n)
+
+    for step in range(max_steps + 1):
+        e, f = calculator.energies_and_forces(mol, x[active])
+        f = f * HARTREE_TO_EV
+        energies[active] = e
+
+        bad = ~np.isfinite(e) | ~np.isfinite(f).all(axis=(1, 2))
+        done = ~bad & (np.sqrt((f ** 2).sum(axis=2)).max(axis=1) < fmax)
+        status[active[bad]] = "failed"
+        status[active[done]] = "converged"
+        keep = ~(bad | done)
+        active, f = active[keep], f[keep]
+        if not len(active):
+            break
+        if step == max_steps:
+            status[active] = "max_steps"
+            break
+        if time.monotonic() > deadline:
+            break
+
+        # FIRE velocity update, vectorized over the conformers still moving (none on the first step)
+        vv = v[active]
+        if step:
+            power = (f * vv).sum(axis=(1, 2))
+            uphill = power <= 0
+            f_norm = np.sqrt((f ** 2).sum(axis=(1, 2)))[:, None, None]
+            v_norm = np.sqrt((vv ** 2).sum(axis=(1, 2)))[:, None, None]
+            a = alpha[active][:, None, None]
+            vv = np.where(uphill[:, None, None], 0.0, (1 - a) * vv + a * f / np.maximum(f_norm, 1e-12) * v_norm)
+
+            grow = ~uphill & (n_positive[active] > FIRE_N_MIN)
+            dt[active] = np.where(uphill, dt[active] * FIRE_F_DEC, np.where(grow, np.minimum(dt[active] * FIRE_F_INC, FIRE_DT_MAX), dt[active]))
+            alpha[active] = np.where(uphill, FIRE_ALPHA_START, np.where(grow, alpha[active] * FIRE_F_ALPHA, alpha[active]))
+            n_positive[active] = np.where(uphill, 0, n_positive[active] + 1)
+
+        vv += dt[active][:, None, None] * f
+        dr = dt[active][:, None, None] * vv
+        dr_norm = np.sqrt((dr ** 2).sum(axis=(1, 2)))[:, None, None]
+        dr *= np.minimum(1.0, FIRE_MAX_STEP / np.maximum(dr_norm, 1e-12))
+        x[active] += dr
+        v[active] = vv
+
+    return x, energies, status
+
+
+def iter_batches(mols, batch_size):
+    """Consecutive runs of up to ``batch_size`` conformers with identical atoms."""
+    batch = []
+    for k, mol in mols:
+        if batch and (len(batch) == batch_size or not same_atoms(batch[0][1], mol)):
+            yield batch
+            batch = []
+        batch.append((k, mol))
+    if batch:
+        yield batch
+
+
+def same_atoms(a, b):
+    return [atom.GetAtomicNum() for atom in a.GetAtoms()] == [atom.GetAtomicNum() for atom in b.GetAtoms()]
+
+
+def single_point(calculator, mol, xyz):
+    """Energy of one geometry, or None if the calculator fails on it."""
+    try:
+        energy = calculator.energies_and_forces(mol, xyz[None])[0][0]
+    except Exception as exc:
+        print(f"Single-point calculation raised {type(exc).__name__}: {exc}")
+        return None
+    return energy if np.isfinite(energy) else None
+
+
+def optimize_batch(calculator, batch, fmax, max_steps, timeout, single_point_only=False):
+    """
+    Optimize one batch; returns [(position, mol, coordinates, energy or None, status)].
+    If the batched call raises, each conformer is retried on its own before falling back.
+    """
+    mol = batch[0][1]
+    initial = np.array([m.GetConformer().GetPositions() for _, m in batch])
+
+    if single_point_only:
+        xyz, energies = initial, np.full(len(batch), np.nan)
+        status = np.full(len(batch), "single_point_only", dtype=object)
+    else:
+        try:
+            xyz, energies, status = fire_minimize(calculator, mol, initial, fmax, max_steps, time.monotonic() + timeout)
+        except Exception as exc:
+            if len(batch) > 1:
+                print(f"Batch optimization raised {type(exc).__name__}: {exc}; retrying conformers individually")
+                return [r for item in batch for r in optimize_batch(calculator, [item], fmax, max_steps, timeout)]
+            print(f"Optimization raised {type(exc).__name__}: {exc}")
+            xyz, energies = initial, np.full(1, np.nan)
+            status = np.array(["failed"], dtype=object)
+
+    results = []
+    for j, (k, m) in enumerate(batch):
+        if status[j] in ("converged", "max_steps"):
+            results.append((k, m, xyz[j], energies[j], status[j]))
+        else:
+            # Single-point fallback on the input geometry
+            energy = single_point(calculator, m, initial[j])
+            results.append((k, m, initial[j], energy, "single_point" if energy is not None else "failed"))
+    return results
+
+
+def run_chunk(input_sdf, output_sdf, output_csv, calculator, batch_size=32, fmax=0.05, max_steps=1000, timeout=3600, single_point_only=False):
+    supplier = Chem.SDMolSupplier(input_sdf, removeHs=False)
+    mols = []
+    for k, mol in enumerate(supplier, start=1):
+        if mol is None:
+            print(f"Skipping conformer {k}: Invalid molecule.")
+        else:
+            mols.append((k, mol))
+
+    counts = {}
+    writer = Chem.SDWriter(output_sdf)
+    with open(output_csv, "w", newline="") as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(["mol", "ANI_energy(hartree)", "ANI_energy(kcal/mol)"])
+
+        for batch in iter_batches(mols, batch_size):
+            start = time.monotonic()
+            results = optimize_batch(calculator, batch, fmax, max_steps, timeout, single_point_only)
+            for k, mol, xyz, energy, status in results:
+                counts[status] = counts.get(status, 0) + 1
+                if energy is None:
+                    print(f"Conformer {k}: optimization and single-point calculation failed.")
+                    continue
+
+                conformer = mol.GetConformer()
+                for i, position in enumerate(xyz.tolist()):
+                    conformer.SetAtomPosition(i, position)
+                mol.SetProp("ANI_energy(hartree)", str(energy))
+                mol.SetProp("ANI_energy(kcal/mol)", str(energy * HARTREE_TO_KCALMOL))
+                writer.write(mol)
+                name = mol.GetProp("_Name") if mol.HasProp("_Name") and mol.GetProp("_Name") else k
+                csv_writer.writerow([name, energy, energy * HARTREE_TO_KCALMOL])
+            print(f"Processed conformers {batch[0][0]}-{batch[-1][0]} in {time.monotonic() - start:.1f} s")
+    writer.close()
+
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    count_items(conformers=len(mols))
+    print(f"{len(mols)} conformers processed ({summary}). Results saved to {output_sdf} and {output_csv}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize all conformers of an SDF chunk with a single calculator instance.")
+    parser.add_argument("-i", "--input", required=True, help="Input SDF chunk.")
+    parser.add_argument("--output_sdf", required=True, help="Output SDF with optimized geometries and energies.")
+    parser.add_argument("--output_csv", required=True, help="Output CSV with energies.")
+    parser.add_argument("--calculator", choices=sorted(CALCULATORS), default="torchani", help="Energy backend (default: torchani).")
+    parser.add_argument("--model", default="ANI2x", help="torchani model name (default: ANI2x).")
+    parser.add_argument("--model_file", default=None, help="Serialized model to load instead of a stock torchani model.")
+    parser.add_argument("--device", default=None, help="Torch device (default: cuda if available, else cpu).")
+    parser.add_argument("--batch_size", type=int, default=32, help="Conformers optimized together (default: 32).")
+    parser.add_argument("--fmax", type=float, default=0.05, help="Force convergence threshold in eV/Angstrom (default: 0.05).")
+    parser.add_argument("--max_steps", type=int, default=1000, help="Maximum optimizer steps (default: 1000).")
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds allowed per batch before falling back to single points (default: 3600).")
+    parser.add_argument("--single_point", action="store_true", help="Only compute single-point energies.")
+    args = parser.parse_args()
+
+    if args.calculator == "torchani":
+        calculator = TorchANICalculator(args.model, args.model_file, args.device)
+    else:
+        calculator = CALCULATORS[args.calculator]()
+
+    run_chunk(
+        args.input, args.output_sdf, args.output_csv, calculator,
+        batch_size=args.batch_size, fmax=args.fmax, max_steps=args.max_steps,
+        timeout=args.timeout, single_point_only=args.single_point,
+    )
+
+
+if __name__ == "__main__":
+    main()
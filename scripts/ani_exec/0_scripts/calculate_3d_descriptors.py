@@ -1,9 +1,15 @@
-import pandas as pd
+import csv
+import numpy as np
 from rdkit import Chem
 from rdkit.Chem import Descriptors3D
 import argparse
 
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
 DESCRIPTOR_FAIL_VALUE = -1  # Default value for failed descriptor calculations
+CONFORMERS_PER_BATCH = 256  # Conformers of one topology evaluated together
+EPSILON = 1e-8  # Denominators below this give 0, as in RDKit
 
 def calculate_3D_descriptors(mol):
     """
@@ -12,15 +18,81 @@ def calculate_3D_descriptors(mol):
     """
     if mol is None:
         return [DESCRIPTOR_FAIL_VALUE] * len(descriptor3D_names)
-    descriptor_values = []
-    for desc_name in descriptor3D_names:
-        desc_func = getattr(Descriptors3D, desc_name, None)
-        if desc_func:
-            try:
-                descriptor_values.append(desc_func(mol))
-            except:
-                descriptor_values.append(DESCRIPTOR_FAIL_VALUE)
-    return descriptor_values
+    return calculate_3D_descriptors_batch([mol])[0]
+
+def shape_descriptors(coordinates, masses):
+    """
+    Every inertia- and shape-based Descriptors3D value for a stack of conformers
+    (n_conformers, n_atoms, 3) in one pass: the mass-weighted inertia tensors and
+    the unweighted coordinate covariances are diagonalized with batched eigh.
+    Returns {descriptor name: array of n_conformers values}.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    masses = np.asarray(masses, dtype=np.float64)
+    total_mass = masses.sum()
+
+    # Principal moments of inertia about the center of mass, ascending
+    centered = coordinates - np.einsum("n,cni->ci", masses, coordinates)[:, None, :] / total_mass
+    weighted_r2 = np.einsum("n,cn->c", masses, (centered ** 2).sum(axis=-1))
+    tensor = weighted_r2[:, None, None] * np.eye(3) - np.einsum("n,cni,cnj->cij", masses, centered, centered)
+    pm1, pm2, pm3 = np.linalg.eigvalsh(tensor).T
+
+    # Unweighted covariance: smallest axis gives the plane of best fit
+    geometric = coordinates - coordinates.mean(axis=1, keepdims=True)
+    covariance = np.einsum("cni,cnj->cij", geometric, geometric) / coordinates.shape[1]
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    normal = eigenvectors[:, :, 0]
+
+    def ratio(numerator, denominator):
+        return np.where(denominator > EPSILON, numerator / np.where(denominator > EPSILON, denominator, 1.0), 0.0)
+
+    return {
+        "PMI1": pm1,
+        "PMI2": pm2,
+        "PMI3": pm3,
+        "NPR1": ratio(pm1, pm3),
+        "NPR2": ratio(pm2, pm3),
+        "RadiusOfGyration": np.sqrt(weighted_r2 / total_mass),
+        "InertialShapeFactor": ratio(pm2, pm1 * pm3),
+        "Eccentricity": ratio(np.sqrt(np.clip(pm3 ** 2 - pm1 ** 2, 0, None)), pm3),
+        "Asphericity": ratio(2 * ((pm1 - pm2) ** 2 + (pm1 - pm3) ** 2 + (pm2 - pm3) ** 2), (pm1 + pm2 + pm3) ** 2),
+        "SpherocityIndex": ratio(3 * eigenvalues[:, 0], eigenvalues.sum(axis=1)),
+        "PBF": np.abs(np.einsum("cni,ci->cn", geometric, normal)).mean(axis=1),
+    }
+
+def calculate_3D_descriptors_batch(mols, coordinates=None):
+    """
+    Descriptor rows (in descriptor3D_names order) for sanitized conformers of one topology.
+    Columns without a batched formula fall back to calling the RDKit function per molecule.
+    ``coordinates`` (n_conformers, n_atoms, 3) may be given instead of reading them from
+    the molecules; ``mols[k]`` is then only accessed for those fallback columns.
+    """
+    if coordinates is None:
+        coordinates = np.array([mol.GetConformer().GetPositions() for mol in mols])
+    masses = [atom.GetMass() for atom in mols[0].GetAtoms()]
+    values = shape_descriptors(coordinates, masses)
+
+    rows = []
+    for k in range(len(coordinates)):
+        computed = {name: float(column[k]) for name, column in values.items()}
+        row = []
+        for desc_name in descriptor3D_names:
+            if desc_name in computed:
+                row.append(computed[desc_name])
+            elif desc_name == "CalcMolDescriptors3D":
+                row.append({name: computed[name] for name, _ in Descriptors3D.descList})
+            else:
+                try:
+                    row.append(getattr(Descriptors3D, desc_name)(mols[k]))
+                except:
+                    row.append(DESCRIPTOR_FAIL_VALUE)
+        rows.append(row)
+    return rows
+
+def same_topology(a, b):
+    return a.GetNumAtoms() == b.GetNumAtoms() and all(
+        x.GetAtomicNum() == y.GetAtomicNum() for x, y in zip(a.GetAtoms(), b.GetAtoms())
+    )
 
 # Get the list of all available 3D descriptors in RDKit
 descriptor3D_names = [
@@ -37,32 +109,39 @@ def main():
 
     # Load molecules from the SDF file
     supplier = Chem.SDMolSupplier(args.input, sanitize=False)
-    molecules_data = []
 
     print(f"Calculating 3D descriptors for molecules in {args.input}...")
 
-    # Process each molecule and calculate descriptors
-    molecule_names = []
-    for mol in supplier:
-        if mol is not None:
-            try:
-                Chem.SanitizeMol(mol)
-                descriptors = calculate_3D_descriptors(mol)
-                molecule_names.append(mol.GetProp("_Name") if mol.HasProp("_Name") else "N/A")
-                molecules_data.append(descriptors)
-            except Exception as e:
-                print(f"Error processing a molecule: {e}")
-                molecule_names.append("Failed")
-                molecules_data.append([DESCRIPTOR_FAIL_VALUE] * len(descriptor3D_names))
-
-    # Save results to a DataFrame
-    descriptor_df = pd.DataFrame(molecules_data, columns=descriptor3D_names)
-    descriptor_df.insert(0, "Molecule_Name", molecule_names)
-    
-    # Write the results to a CSV file
-    descriptor_df.to_csv(args.output, index=False)
+    with open(args.output, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Molecule_Name"] + descriptor3D_names)
+
+        # Conformers of the same molecule are computed in batches; rows are written as each batch completes
+        batch = []
+
+        def flush():
+            if not batch:
+                return
+            for mol, descriptors in zip(batch, calculate_3D_descriptors_batch(batch)):
+                writer.writerow([mol.GetProp("_Name") if mol.HasProp("_Name") else "N/A"] + descriptors)
+            batch.clear()
+
+        for mol in supplier:
+            if mol is not None:
+                try:
+                    Chem.SanitizeMol(mol)
+                except Exception as e:
+                    print(f"Error processing a molecule: {e}")
+                    flush()
+                    writer.writerow(["Failed"] + [DESCRIPTOR_FAIL_VALUE] * len(descriptor3D_names))
+                    continue
+                if batch and (len(batch) == CONFORMERS_PER_BATCH or not same_topology(batch[0], mol)):
+                    flush()
+                batch.append(mol)
+        flush()
+
+    count_items(conformers=len(supplier))
     print(f"Saved 3D descriptors to {args.output}")
 
 if __name__ == "__main__":
     main()
-
@@ -11,6 +11,8 @@ beta = 1 / (k_B * T)
 parser = argparse.ArgumentParser(description="Calculate Boltzmann weights from energy data.")
 parser.add_argument("-i", "--input", required=True, help="Path to the input CSV file containing energy data.")
 parser.add_argument("-o", "--output", required=True, help="Path to the output CSV file to save results.")
+parser.add_argument("-p", "--populations", default=None, help="Optional cluster populations CSV (cluster_conformers.py); rows follow the conformer order.")
+parser.add_argument("-f", "--frame_weights", default=None, help="Optional metadynamics frame weights CSV (hills_reweight.py); rows follow the conformer order; clustered runs use the summed Log_Weight column of --populations instead.")
 args = parser.parse_args()
 
 # File paths
@@ -27,8 +29,33 @@ energies = energy_df['ANI_energy(kcal/mol)'].values
 min_energy = np.min(energies)
 shifted_energies = energies - min_energy
 
+# Metadynamics frames are a biased sample; their log-weights undo the bias.
+# A cluster's weight is the sum of its members' weights (cluster_conformers.py -f),
+# which already accounts for its population
+log_factors = -beta * shifted_energies
+use_populations = bool(args.populations)
+if args.frame_weights:
+    if args.populations:
+        populations_df = pd.read_csv(args.populations)
+        if 'Log_Weight' not in populations_df.columns:
+            raise ValueError(f"Frame weights need the summed cluster weights: rerun cluster_conformers.py with -f {args.frame_weights}")
+        frame_log_weights = populations_df['Log_Weight'].values
+        use_populations = False
+    else:
+        frame_log_weights = pd.read_csv(args.frame_weights)['Log_Weight'].values
+    if len(frame_log_weights) != len(energies):
+        raise ValueError(f"{args.frame_weights} has {len(frame_log_weights)} frame weights but {input_file} has {len(energies)} energies")
+    log_factors = log_factors + frame_log_weights
+
 # Calculate Boltzmann factors
-boltzmann_factors = np.exp(-beta * shifted_energies)
+boltzmann_factors = np.exp(log_factors - np.max(log_factors))
+
+# Each cluster representative stands for Population frames of the trajectory
+if use_populations:
+    populations = pd.read_csv(args.populations)['Population'].values
+    if len(populations) != len(boltzmann_factors):
+        raise ValueError(f"{args.populations} has {len(populations)} populations but {input_file} has {len(boltzmann_factors)} energies")
+    boltzmann_factors = populations * boltzmann_factors
 
 # Normalize to get weights
 partition_function = np.sum(boltzmann_factors)
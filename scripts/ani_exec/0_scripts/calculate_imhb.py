@@ -1,12 +1,13 @@
 import argparse
-from schrodinger import structure
-from schrodinger.structutils.interactions import hbond
 import csv
 
 def calculate_imhb(sdf_path):
     """
     Calculate intramolecular hydrogen bonds (IMHB) for each conformation in the input SDF file.
     """
+    from schrodinger import structure
+    from schrodinger.structutils.interactions import hbond
+
     imhb_data = []  # List to store IMHB results for each conformation
     
     # Read conformations from the SDF file
@@ -27,9 +28,34 @@ def calculate_imhb(sdf_path):
             'num_imhb': len(imhb_pairs),
             'imhb_pairs': imhb_pairs
         })
-    
+
     return imhb_data
 
+def calculate_imhb_numpy(sdf_path):
+    """
+    Geometric IMHB detection for all conformations at once (imhb.py): donor/acceptor
+    lists come from the topology of the first conformation.
+    """
+    import numpy as np
+    from rdkit import Chem
+    from imhb import HBondTopology, find_imhb
+
+    mols = list(Chem.SDMolSupplier(sdf_path, removeHs=False))
+    for conf_id, mol in enumerate(mols, start=1):
+        if mol is None:
+            raise ValueError(f"RDKit could not read conformation {conf_id} of {sdf_path}")
+        if mol.GetNumAtoms() != mols[0].GetNumAtoms():
+            raise ValueError(f"Conformation {conf_id} of {sdf_path} is a different molecule")
+    if not mols:
+        return []
+
+    coordinates = np.array([mol.GetConformer().GetPositions() for mol in mols])
+    pairs = find_imhb(HBondTopology(mols[0]), coordinates)
+    return [
+        {'conf_id': conf_id, 'num_imhb': len(imhb_pairs), 'imhb_pairs': imhb_pairs}
+        for conf_id, imhb_pairs in enumerate(pairs, start=1)
+    ]
+
 def save_results(output_path, results):
     """
     Save IMHB results to a CSV file.
@@ -45,10 +71,15 @@ def main():
     parser = argparse.ArgumentParser(description="Calculate intramolecular hydrogen bonds (IMHB) from an SDF file.")
     parser.add_argument('-i', '--input', required=True, help="Path to the input SDF file")
     parser.add_argument('-o', '--output', required=True, help="Path to the output CSV file")
+    parser.add_argument('--backend', choices=['schrodinger', 'numpy'], default='schrodinger',
+                        help="'schrodinger' (hbond.get_hydrogen_bonds, needs $SCHRODINGER/run) or 'numpy' (built-in geometric criteria) (default: schrodinger)")
     args = parser.parse_args()
 
     # Calculate IMHB
-    results = calculate_imhb(args.input)
+    if args.backend == 'schrodinger':
+        results = calculate_imhb(args.input)
+    else:
+        results = calculate_imhb_numpy(args.input)
 
     # Save results to the specified output file
     save_results(args.output, results)
@@ -57,4 +88,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
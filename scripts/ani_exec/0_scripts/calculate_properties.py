@@ -0,0 +1,255 @@
+"""
+Per-conformer property engine: PSA, intramolecular hydrogen bonds (IMHB) and all
+RDKit Descriptors3D values computed in a single pass over an SDF ensemble.
+
+Each record is read from disk once through the SDF index and parsed once per
+toolkit. Consecutive conformers are handed to a process pool in batches, and the
+combined table is streamed to CSV in conformer order.
+
+The input may also be a conformer ensemble (pipeline/ensemble.py). With the
+'numpy' backends, workers then slice the memory-mapped coordinates of their
+batch and compute on the shared topology without parsing any SDF text.
+
+The PSA and IMHB values come from the selected backends; the 'schrodinger'
+backends reproduce calculate_psa.py and calculate_imhb.py and need the
+Schrödinger Python runtime ($SCHRODINGER/run). The 'numpy' backends
+(sasa.py, imhb.py) need only RDKit and NumPy.
+"""
+import os
+import csv
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from rdkit import Chem
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.ensemble import ConformerEnsemble, is_ensemble
+from pipeline.telemetry import count_items
+from sdf_index import SDFIndex
+from sasa import POLAR_ATOMIC_NUMBERS, polar_surface_area
+from imhb import HBondTopology, find_imhb
+from calculate_3d_descriptors import DESCRIPTOR_FAIL_VALUE, calculate_3D_descriptors_batch, descriptor3D_names
+
+FRAMES_PER_TASK = 64  # Conformers computed per worker task
+TASKS_PER_WORKER = 4  # Finished batches held in memory per worker before writing
+
+
+class Conformer:
+    """One SDF record, with each toolkit's parse made on first use."""
+
+    def __init__(self, conf_id, block):
+        self.conf_id = conf_id
+        self.block = block
+        self.error = None
+        self._mol = None
+        self._structure = None
+
+    @property
+    def mol(self):
+        """Sanitized RDKit molecule, or None (with ``error`` set) if RDKit cannot read it."""
+        if self._mol is None and self.error is None:
+            mol = Chem.MolFromMolBlock(self.block, sanitize=False, removeHs=False)
+            try:
+                if mol is None:
+                    raise ValueError("RDKit could not parse the record")
+                Chem.SanitizeMol(mol)
+                self._mol = mol
+            except Exception as e:
+                self.error = e
+        return self._mol
+
+    @property
+    def structure(self):
+        if self._structure is None:
+            from schrodinger import structure
+            self._structure = next(iter(structure.StructureReader.fromString(self.block, format=structure.SD)))
+        return self._structure
+
+
+def schrodinger_psa(conformers):
+    """Total SASA of N, O and their bonded hydrogens, as in calculate_psa.py."""
+    from schrodinger.structutils.analyze import calculate_sasa_by_atom
+
+    values = []
+    for conformer in conformers:
+        conf = conformer.structure
+        polar_atom_ids = [atom.index for atom in conf.atom if atom.atomic_number in POLAR_ATOMIC_NUMBERS]
+        for atom in conf.atom:
+            if atom.atomic_number == 1 and any(ba.atomic_number in POLAR_ATOMIC_NUMBERS for ba in atom.bonded_atoms):
+                polar_atom_ids.append(atom.index)
+        values.append(sum(calculate_sasa_by_atom(conf, atoms=polar_atom_ids)))
+    return values
+
+
+def schrodinger_imhb(conformers):
+    """Intramolecular hydrogen-bond (donor H, acceptor) index pairs, as in calculate_imhb.py."""
+    from schrodinger.structutils.interactions import hbond
+
+    values = []
+    for conformer in conformers:
+        conf = conformer.structure
+        values.append([
+            (hb[0].index, hb[1].index)
+            for hb in hbond.get_hydrogen_bonds(conf)
+            if conf.atom[hb[0].index].molecule_number == conf.atom[hb[1].index].molecule_number
+        ])
+    return values
+
+
+def topology_groups(conformers):
+    """
+    Consecutive runs of conformers sharing atoms and bonds, as (RDKit molecule, conformers).
+    Conformers RDKit cannot read are returned in their own group with molecule None.
+    """
+    groups = []
+    key = None
+    for conformer in conformers:
+        mol = conformer.mol
+        if mol is None:
+            groups.append((None, [conformer]))
+            key = None
+            continue
+        mol_key = (
+            tuple(atom.GetAtomicNum() for atom in mol.GetAtoms()),
+            tuple((bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()) for bond in mol.GetBonds()),
+        )
+        if mol_key != key:
+            groups.append((mol, []))
+            key = mol_key
+        groups[-1][1].append(conformer)
+    return groups
+
+
+def numpy_psa(conformers):
+    """Shrake-Rupley PSA of N, O and their bonded hydrogens, vectorized over each topology's conformers."""
+    values = []
+    for mol, group in topology_groups(conformers):
+        if mol is None:
+            raise ValueError(f"Conformer {group[0].conf_id}: {group[0].error}")
+        coordinates = np.array([c.mol.GetConformer().GetPositions() for c in group])
+        values.extend(polar_surface_area(mol, coordinates).tolist())
+    return values
+
+
+def numpy_imhb(conformers):
+    """Geometric IMHB detection, vectorized over each topology's conformers."""
+    values = []
+    for mol, group in topology_groups(conformers):
+        if mol is None:
+            raise ValueError(f"Conformer {group[0].conf_id}: {group[0].error}")
+        coordinates = np.array([c.mol.GetConformer().GetPositions() for c in group])
+        values.extend(find_imhb(HBondTopology(mol), coordinates))
+    return values
+
+
+PSA_BACKENDS = {"schrodinger": schrodinger_psa, "numpy": numpy_psa}
+IMHB_BACKENDS = {"schrodinger": schrodinger_imhb, "numpy": numpy_imhb}
+
+COLUMNS = ["Conformation_ID", "Molecule_Name", "PSA", "Num_IMHB", "IMHB_Pairs"] + descriptor3D_names
+
+
+def descriptor_rows(conformers):
+    """Molecule names and Descriptors3D values, as in calculate_3d_descriptors.py, batched per topology."""
+    rows = []
+    for mol, group in topology_groups(conformers):
+        if mol is None:
+            print(f"Error processing a molecule: {group[0].error}")
+            rows.append(("Failed", [DESCRIPTOR_FAIL_VALUE] * len(descriptor3D_names)))
+            continue
+        mols = [c.mol for c in group]
+        for m, descriptors in zip(mols, calculate_3D_descriptors_batch(mols)):
+            rows.append(((m.GetProp("_Name") if m.HasProp("_Name") else "N/A"), descriptors))
+    return rows
+
+
+def compute_batch(first_id, blocks, psa_backend, imhb_backend):
+    """All properties of one batch of consecutive conformers, as CSV rows."""
+    conformers = [Conformer(first_id + k, block) for k, block in enumerate(blocks)]
+    psa = PSA_BACKENDS[psa_backend](conformers)
+    imhb = IMHB_BACKENDS[imhb_backend](conformers)
+
+    rows = []
+    for conformer, psa_value, pairs, (name, descriptors) in zip(conformers, psa, imhb, descriptor_rows(conformers)):
+        rows.append([conformer.conf_id, name, f"{psa_value:.2f}", len(pairs), pairs] + descriptors)
+    return rows
+
+
+_ensembles = {}  # Ensembles opened by this worker process
+
+
+def open_ensemble(path):
+    if path not in _ensembles:
+        _ensembles[path] = ConformerEnsemble(path)
+    return _ensembles[path]
+
+
+def compute_ensemble_batch(path, start, stop, psa_backend, imhb_backend):
+    """All properties of conformers [start, stop) of an ensemble, as CSV rows."""
+    ensemble = open_ensemble(path)
+    if psa_backend != "numpy" or imhb_backend != "numpy":
+        # The Schrödinger backends read SDF records
+        return compute_batch(start + 1, ensemble.records(start, stop, columns=[]), psa_backend, imhb_backend)
+
+    mol = ensemble.topology
+    coordinates = ensemble.positions(start, stop)
+    psa = polar_surface_area(mol, coordinates).tolist()
+    imhb = find_imhb(HBondTopology(mol), coordinates)
+    descriptors = calculate_3D_descriptors_batch(ensemble.mols(start, stop), coordinates)
+
+    rows = []
+    for k, (name, psa_value, pairs, values) in enumerate(zip(ensemble.names[start:stop], psa, imhb, descriptors)):
+        rows.append([start + 1 + k, name, f"{psa_value:.2f}", len(pairs), pairs] + values)
+    return rows
+
+
+def calculate_properties(input_sdf, output_csv, workers=None, psa_backend="schrodinger", imhb_backend="schrodinger"):
+    """
+    Compute every property for each record of input_sdf (an SDF file or a conformer
+    ensemble) on a pool of worker processes and write one row per conformer to
+    output_csv as batches complete, in record order.
+    """
+    ensemble = is_ensemble(input_sdf)
+    index = ConformerEnsemble(input_sdf) if ensemble else SDFIndex(input_sdf)
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * TASKS_PER_WORKER
+
+    with open(output_csv, "w", newline="") as csvfile, ProcessPoolExecutor(max_workers=workers) as executor:
+        writer = csv.writer(csvfile)
+        writer.writerow(COLUMNS)
+
+        pending = deque()
+        for start in range(0, len(index), FRAMES_PER_TASK):
+            stop = min(start + FRAMES_PER_TASK, len(index))
+            if ensemble:
+                # Workers map the coordinates themselves; only the range is sent
+                pending.append(executor.submit(compute_ensemble_batch, input_sdf, start, stop, psa_backend, imhb_backend))
+            else:
+                blocks = [record.decode() for record in index.records(start, stop)]
+                pending.append(executor.submit(compute_batch, start + 1, blocks, psa_backend, imhb_backend))
+
+            # Write the oldest batch before reading further once the window is full
+            if len(pending) >= max_pending:
+                writer.writerows(pending.popleft().result())
+
+        while pending:
+            writer.writerows(pending.popleft().result())
+
+    count_items(conformers=len(index))
+    print(f"Properties of {len(index)} conformers saved to {output_csv}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculate PSA, IMHB and 3D descriptors for every conformer of an SDF file or ensemble in one pass.")
+    parser.add_argument("-i", "--input", required=True, help="Path to the input SDF file or conformer ensemble (.ens).")
+    parser.add_argument("-o", "--output", required=True, help="Path to the output CSV file.")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--psa_backend", choices=sorted(PSA_BACKENDS), default="schrodinger", help="PSA implementation (default: schrodinger).")
+    parser.add_argument("--imhb_backend", choices=sorted(IMHB_BACKENDS), default="schrodinger", help="IMHB implementation (default: schrodinger).")
+    args = parser.parse_args()
+
+    calculate_properties(args.input, args.output, args.workers, args.psa_backend, args.imhb_backend)
+
+
+if __name__ == "__main__":
+    main()
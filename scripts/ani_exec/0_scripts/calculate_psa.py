@@ -1,28 +1,16 @@
 import csv
 import argparse
-from schrodinger import structure
-from schrodinger.structutils.analyze import calculate_sasa_by_atom
-
-# Parse command-line arguments
-parser = argparse.ArgumentParser(description="Calculate Polar Surface Area (PSA) from an SDF file.")
-parser.add_argument("-i", "--input", required=True, help="Path to the input SDF file.")
-parser.add_argument("-o", "--output", required=True, help="Path to the output CSV file.")
-args = parser.parse_args()
-
-# Input and output file paths
-input_file = args.input  # SDF file
-output_file = args.output  # Output CSV file
 
 # Atomic numbers for polar atoms
 polar_atoms = [7, 8]  # Nitrogen (N) and Oxygen (O)
 
-# Open the SDF file and process conformations
-with open(output_file, "w", newline="") as csvfile:
-    csv_writer = csv.writer(csvfile)
-    csv_writer.writerow(["Conformation_ID", "PSA"])  # Write header
+
+def schrodinger_psa_values(input_file):
+    from schrodinger import structure
+    from schrodinger.structutils.analyze import calculate_sasa_by_atom
 
     # Process each conformation in the SDF file
-    for conf_id, conf in enumerate(structure.StructureReader(input_file), start=1):
+    for conf in structure.StructureReader(input_file):
         polar_atom_ids = [atom.index for atom in conf.atom if atom.atomic_number in polar_atoms]
 
         # Add hydrogens bonded to polar atoms
@@ -34,10 +22,48 @@ with open(output_file, "w", newline="") as csvfile:
 
         # Calculate PSA for the selected atoms
         psa_values = calculate_sasa_by_atom(conf, atoms=polar_atom_ids)
-        total_psa = sum(psa_values)
+        yield sum(psa_values)
+
+
+def numpy_psa_values(input_file):
+    import numpy as np
+    from rdkit import Chem
+    from sasa import polar_surface_area
+
+    # All conformers share one topology: the polar atom mask is built once and the
+    # SASA of every conformer is computed in one batched call
+    mols = list(Chem.SDMolSupplier(input_file, removeHs=False))
+    if not mols:
+        return
+    for conf_id, mol in enumerate(mols, start=1):
+        if mol is None:
+            raise ValueError(f"RDKit could not read conformation {conf_id} of {input_file}")
+        if mol.GetNumAtoms() != mols[0].GetNumAtoms():
+            raise ValueError(f"Conformation {conf_id} of {input_file} is a different molecule")
+    coordinates = np.array([mol.GetConformer().GetPositions() for mol in mols])
+    yield from polar_surface_area(mols[0], coordinates).tolist()
 
+
+# Parse command-line arguments
+parser = argparse.ArgumentParser(description="Calculate Polar Surface Area (PSA) from an SDF file.")
+parser.add_argument("-i", "--input", required=True, help="Path to the input SDF file.")
+parser.add_argument("-o", "--output", required=True, help="Path to the output CSV file.")
+parser.add_argument("--backend", choices=["schrodinger", "numpy"], default="schrodinger",
+                    help="'schrodinger' (calculate_sasa_by_atom, needs $SCHRODINGER/run) or 'numpy' (built-in Shrake-Rupley) (default: schrodinger).")
+args = parser.parse_args()
+
+# Input and output file paths
+input_file = args.input  # SDF file
+output_file = args.output  # Output CSV file
+
+# Open the SDF file and process conformations
+with open(output_file, "w", newline="") as csvfile:
+    csv_writer = csv.writer(csvfile)
+    csv_writer.writerow(["Conformation_ID", "PSA"])  # Write header
+
+    psa_values = schrodinger_psa_values if args.backend == "schrodinger" else numpy_psa_values
+    for conf_id, total_psa in enumerate(psa_values(input_file), start=1):
         # Write the results
         csv_writer.writerow([conf_id, f"{total_psa:.2f}"])
 
 print(f"PSA calculation completed! Results saved to {output_file}")
-
@@ -0,0 +1,264 @@
+"""
+Cost model for sizing the chunks of the ANI minimization array.
+
+The predicted time of an array task is a fixed startup (loading the model) plus,
+for each conformer, ``coefficient * heavy_atoms ** exponent`` seconds. Each task
+is planned to take at most the target wall time. The SDF is then cut into that
+many consecutive chunks of nearly equal predicted cost. The chunks stay
+consecutive so that optimized_N.sdf and the cluster populations keep the
+conformer order.
+
+Every setup writes its plan to ``files/chunk_plan.json``. When the array has run,
+the plans are joined with the ``ani_minimization`` records of
+pipeline/telemetry.py. ``report`` then prints predicted against actual task
+times, and ``refine`` fits the model to them and saves it as
+``outputs/ani_exec/cost_model.json``, which later setups read.
+
+Usage (from the repository root):
+
+    python scripts/ani_exec/0_scripts/chunk_planner.py plan outputs/trajectory_processing/mol_1/output.sdf --target_hours 1
+    python scripts/ani_exec/0_scripts/chunk_planner.py report
+    python scripts/ani_exec/0_scripts/chunk_planner.py refine
+"""
+import os
+import glob
+import json
+import math
+import datetime
+import argparse
+import numpy as np
+
+from sdf_index import SDFIndex
+
+DEFAULT_COST_MODEL = os.path.join("outputs", "ani_exec", "cost_model.json")
+DEFAULT_PLANS = os.path.join("outputs", "ani_exec", "mol_*", "ani", "files", "chunk_plan.json")
+DEFAULT_TELEMETRY = os.path.join("outputs", "**", "*telemetry*.jsonl")
+PLAN_FILE = "chunk_plan.json"
+TELEMETRY_STAGE = "ani_minimization"  # Stage name of the array tasks in template_submit_array.pbs
+
+# Prior used until a model has been fitted to recorded runtimes
+DEFAULT_MODEL = {"coefficient": 0.5, "exponent": 1.0, "startup_s": 60.0}
+EXPONENT_RANGE = (0.5, 3.0)  # Fitted exponents are clipped to this range
+MIN_SIZE_SPREAD = 1.2  # Largest/smallest heavy-atom count needed to fit the exponent
+
+
+def heavy_atom_counts(index):
+    """Heavy atoms of every record of an SDFIndex, read from the V2000 atom block."""
+    counts = np.empty(len(index), dtype=np.int64)
+    for k, record in enumerate(index.records()):
+        lines = record.decode().splitlines()
+        if len(lines) < 4 or "V3000" in lines[3]:
+            from rdkit import Chem
+            mol = Chem.MolFromMolBlock(record.decode(), sanitize=False, removeHs=False)
+            counts[k] = sum(1 for atom in mol.GetAtoms() if atom.GetAtomicNum() > 1)
+            continue
+        n_atoms = int(lines[3][:3])
+        counts[k] = sum(1 for line in lines[4:4 + n_atoms] if line[31:34].strip() not in ("H", "D", "T"))
+    return counts
+
+
+def load_model(path):
+    """Cost model saved by ``refine``, or the prior when there is none."""
+    model = dict(DEFAULT_MODEL)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            model.update(json.load(f))
+    return model
+
+
+def conformer_seconds(model, heavy_atoms):
+    return model["coefficient"] * np.asarray(heavy_atoms, dtype=np.float64) ** model["exponent"]
+
+
+def partition(costs, n_chunks):
+    """
+    Cut ``costs`` into at most ``n_chunks`` consecutive, non-empty ranges of nearly
+    equal total cost. Returns (start, stop) pairs, none when there are no costs.
+    """
+    n = len(costs)
+    if n == 0:
+        return []
+    n_chunks = max(1, min(n_chunks, n))
+    cumulative = np.cumsum(costs)
+    targets = cumulative[-1] * np.arange(1, n_chunks) / n_chunks
+
+    # Cut before or after the record that crosses each target, whichever is closer
+    crossing = np.searchsorted(cumulative, targets)
+    before = np.where(crossing > 0, cumulative[np.maximum(crossing - 1, 0)], 0.0)
+    cuts = np.where(targets - before <= cumulative[crossing] - targets, crossing, crossing + 1)
+    cuts = np.unique(np.clip(cuts, 1, n - 1)) if n > 1 else np.empty(0, dtype=np.int64)
+
+    bounds = [0] + cuts.tolist() + [n]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def plan_chunks(heavy_atoms, model, target_hours, max_tasks):
+    """
+    Chunk plan for conformers with the given heavy-atom counts: the fewest tasks
+    that keep every task under ``target_hours``, capped at ``max_tasks``.
+    """
+    target_s = target_hours * 3600
+    if target_s <= model["startup_s"]:
+        raise ValueError(f"Target of {target_s:.0f} s per task does not cover the {model['startup_s']:.0f} s startup")
+    costs = conformer_seconds(model, heavy_atoms)
+    n_tasks = min(max_tasks, math.ceil(costs.sum() / (target_s - model["startup_s"])))
+    ranges = partition(costs, n_tasks)
+
+    chunks = [
+        {
+            "chunk": k,
+            "start": start,
+            "stop": stop,
+            "conformers": stop - start,
+            "heavy_atoms": float(np.mean(heavy_atoms[start:stop])),
+            "predicted_s": model["startup_s"] + float(costs[start:stop].sum()),
+        }
+        for k, (start, stop) in enumerate(ranges, start=1)
+    ]
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "model": model,
+        "target_s": target_s,
+        "max_tasks": max_tasks,
+        "chunks": chunks,
+    }
+
+
+def save_plan(plan, path):
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=1)
+
+
+def _mol_of_plan(path):
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        if part.startswith("mol_"):
+            return part
+    return None
+
+
+def history(plan_paths, telemetry_paths):
+    """
+    Planned chunks joined with the latest successful array-task record of the same
+    molecule and array index made after the plan. Returns one dict per chunk that ran.
+    """
+    latest = {}
+    for path in telemetry_paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["stage"] != TELEMETRY_STAGE or record["status"] or not record.get("array_index"):
+                    continue
+                key = (record.get("mol"), int(record["array_index"]))
+                if key not in latest or record["started"] > latest[key]["started"]:
+                    latest[key] = record
+
+    rows = []
+    for path in plan_paths:
+        with open(path) as f:
+            plan = json.load(f)
+        mol = _mol_of_plan(path)
+        for chunk in plan["chunks"]:
+            record = latest.get((mol, chunk["chunk"]))
+            if record is None or record["started"] < plan["created"]:
+                continue
+            rows.append({"mol": mol, **chunk, "actual_s": record["wall_s"]})
+    return rows
+
+
+def fit_model(rows, prior):
+    """
+    Cost model fitted to recorded chunks. The startup is kept from the prior. The
+    exponent is fitted by least squares on log per-conformer time when the chunks
+    cover a range of molecule sizes and kept otherwise; the coefficient is then the
+    median per-conformer time over heavy_atoms ** exponent.
+    """
+    heavy = np.array([row["heavy_atoms"] for row in rows])
+    per_conformer = np.array([max(row["actual_s"] - prior["startup_s"], 1e-3) / row["conformers"] for row in rows])
+
+    model = dict(prior)
+    if len(rows) >= 3 and heavy.max() / heavy.min() >= MIN_SIZE_SPREAD:
+        exponent, _ = np.polyfit(np.log(heavy), np.log(per_conformer), 1)
+        model["exponent"] = float(np.clip(exponent, *EXPONENT_RANGE))
+    model["coefficient"] = float(np.median(per_conformer / heavy ** model["exponent"]))
+    model["fitted_on"] = len(rows)
+    model["fitted"] = datetime.datetime.now().isoformat(timespec="seconds")
+    return model
+
+
+def predict(model, row):
+    return model["startup_s"] + row["conformers"] * float(conformer_seconds(model, row["heavy_atoms"]))
+
+
+def report(rows, model):
+    """Predicted (as planned and by ``model``) against actual time of every chunk, and the task imbalance per molecule."""
+    print(f"{'mol':<10} {'chunk':>5} {'confs':>6} {'heavy':>6} {'planned s':>10} {'model s':>10} {'actual s':>10} {'act/plan':>9}")
+    for row in sorted(rows, key=lambda r: (r["mol"], r["chunk"])):
+        print(f"{row['mol']:<10} {row['chunk']:>5} {row['conformers']:>6} {row['heavy_atoms']:>6.1f} "
+              f"{row['predicted_s']:10.0f} {predict(model, row):10.0f} {row['actual_s']:10.0f} {row['actual_s'] / row['predicted_s']:9.2f}")
+
+    print(f"\n{'mol':<10} {'tasks':>5} {'max/median actual':>18}")
+    for mol in sorted({row["mol"] for row in rows}):
+        actual = [row["actual_s"] for row in rows if row["mol"] == mol]
+        print(f"{mol:<10} {len(actual):>5} {max(actual) / np.median(actual):18.2f}")
+
+    actual = np.array([row["actual_s"] for row in rows])
+    print()
+    for label, predicted in [("planned", [row["predicted_s"] for row in rows]), ("model", [predict(model, row) for row in rows])]:
+        predicted = np.array(predicted)
+        print(f"{label:<8} median actual/predicted {np.median(actual / predicted):.2f}, "
+              f"mean absolute error {np.mean(np.abs(predicted - actual) / actual):.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan ANI array chunks with a cost model and refine it from recorded runtimes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_cmd = subparsers.add_parser("plan", help="Print (and optionally save) the chunk plan of an SDF file.")
+    plan_cmd.add_argument("sdf_file")
+    plan_cmd.add_argument("--target_hours", type=float, default=1.0, help="Target wall time per array task (default: 1).")
+    plan_cmd.add_argument("--max_tasks", type=int, default=500, help="Maximum array tasks (default: 500).")
+    plan_cmd.add_argument("--cost_model", default=DEFAULT_COST_MODEL, help=f"Cost model file (default: {DEFAULT_COST_MODEL}).")
+    plan_cmd.add_argument("-o", "--output", default=None, help="Save the plan as JSON.")
+
+    for name, help_text in [("report", "Compare predicted and actual array task times."),
+                            ("refine", "Fit the cost model to the recorded array task times.")]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--plans", nargs="+", default=None, help=f"Chunk plan files (default: {DEFAULT_PLANS}).")
+        sub.add_argument("--telemetry", nargs="+", default=None, help=f"Telemetry files (default: {DEFAULT_TELEMETRY}).")
+        sub.add_argument("--cost_model", default=DEFAULT_COST_MODEL, help=f"Cost model file (default: {DEFAULT_COST_MODEL}).")
+
+    args = parser.parse_args()
+    model = load_model(args.cost_model)
+
+    if args.command == "plan":
+        index = SDFIndex(args.sdf_file)
+        plan = plan_chunks(heavy_atom_counts(index), model, args.target_hours, args.max_tasks)
+        for chunk in plan["chunks"]:
+            print(f"chunk {chunk['chunk']:>4}: conformers {chunk['start'] + 1}-{chunk['stop']} ({chunk['conformers']}), predicted {chunk['predicted_s'] / 60:.1f} min")
+        if args.output:
+            save_plan(plan, args.output)
+            print(f"Plan saved to {args.output}")
+        return
+
+    rows = history(args.plans or sorted(glob.glob(DEFAULT_PLANS)),
+                   args.telemetry or sorted(glob.glob(DEFAULT_TELEMETRY, recursive=True)))
+    if not rows:
+        print("No planned chunks with recorded runtimes found.")
+        return
+
+    if args.command == "report":
+        report(rows, model)
+    else:
+        refined = fit_model(rows, model)
+        report(rows, refined)
+        os.makedirs(os.path.dirname(os.path.abspath(args.cost_model)), exist_ok=True)
+        with open(args.cost_model, "w") as f:
+            json.dump(refined, f, indent=1)
+        print(f"Cost model fitted on {len(rows)} chunks saved to {args.cost_model}: "
+              f"{refined['coefficient']:.3g} s x heavy_atoms^{refined['exponent']:.2f} per conformer + {refined['startup_s']:.0f} s startup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Boltzmann-weighted ensemble averages of many properties at many temperatures in one pass.
+
+The energy table and every property table are read once. Each conformer's
+log-weight is -E/kT plus the log population for clustered runs. With metadynamics
+frame weights from hills_reweight.py, the frame's bias log-weight is added instead;
+for clustered runs it is the log of the summed weights of the cluster's members.
+The log-weights are normalized with log-sum-exp for each temperature, so no energy
+shift or overflow guard is needed. Bootstrap uncertainties resample conformers
+with replacement: each resample is a row of multinomial counts, and the weighted
+sums of every property at every temperature for a block of resamples are one
+matrix product.
+
+Output is one CSV row per (temperature, property): Temperature, Property,
+Ensemble_Average, Bootstrap_SE.
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
+k_B = 0.001987204259  # Boltzmann constant in kcal/(mol·K)
+DEFAULT_TEMPERATURES = [298.0]
+DEFAULT_COLUMNS = ["PSA", "Num_IMHB", "RadiusOfGyration"]
+ENERGY_COLUMN = "ANI_energy(kcal/mol)"
+N_BOOTSTRAP = 1000
+BOOTSTRAP_BLOCK_ELEMENTS = 2 ** 24  # Multinomial counts drawn per block
+
+
+def log_boltzmann_weights(energies, temperatures, populations=None, log_weights=None):
+    """
+    Normalized log-weights of shape (n_temperatures, n_conformers). ``log_weights`` are
+    per-conformer log prior weights, such as the unbiasing weights of a metadynamics run.
+    """
+    beta = 1 / (k_B * np.asarray(temperatures, dtype=np.float64))
+    log_factors = -beta[:, None] * np.asarray(energies, dtype=np.float64)[None, :]
+    if populations is not None:
+        log_factors = log_factors + np.log(np.asarray(populations, dtype=np.float64))[None, :]
+    if log_weights is not None:
+        log_factors = log_factors + np.asarray(log_weights, dtype=np.float64)[None, :]
+    peak = log_factors.max(axis=1, keepdims=True)
+    return log_factors - (peak + np.log(np.exp(log_factors - peak).sum(axis=1, keepdims=True)))
+
+
+def bootstrap_standard_errors(weights, values, n_bootstrap=N_BOOTSTRAP, seed=0):
+    """
+    Standard deviation over bootstrap resamples of the weighted averages.
+    weights: (n_temperatures, n_conformers), values: (n_conformers, n_properties).
+    Returns (n_temperatures, n_properties).
+    """
+    n_temp, n_conf = weights.shape
+    if n_bootstrap < 2 or n_conf < 2:
+        return np.zeros((n_temp, values.shape[1]))
+
+    # Columns per temperature: weighted values of every property, then the weight itself
+    weighted = np.concatenate([weights[:, :, None] * values[None, :, :], weights[:, :, None]], axis=2)
+    weighted = weighted.transpose(1, 0, 2).reshape(n_conf, -1)
+
+    rng = np.random.default_rng(seed)
+    block = max(1, BOOTSTRAP_BLOCK_ELEMENTS // n_conf)
+    averages = []
+    for start in range(0, n_bootstrap, block):
+        counts = rng.multinomial(n_conf, np.full(n_conf, 1 / n_conf), size=min(block, n_bootstrap - start))
+        sums = (counts @ weighted).reshape(len(counts), n_temp, -1)
+        averages.append(sums[:, :, :-1] / sums[:, :, -1:])
+    return np.concatenate(averages).std(axis=0, ddof=1)
+
+
+def ensemble_averages(energies, values, temperatures, populations=None, n_bootstrap=N_BOOTSTRAP, seed=0, log_weights=None):
+    """Averages and bootstrap standard errors, both of shape (n_temperatures, n_properties)."""
+    weights = np.exp(log_boltzmann_weights(energies, temperatures, populations, log_weights))
+    values = np.asarray(values, dtype=np.float64)
+    return weights @ values, bootstrap_standard_errors(weights, values, n_bootstrap, seed), weights
+
+
+def read_property_columns(property_files, columns, n_conformers):
+    """Requested columns, each taken from the first property table that has it, as (n_conformers, n_columns)."""
+    tables = [pd.read_csv(path) for path in property_files]
+    for path, table in zip(property_files, tables):
+        if len(table) != n_conformers:
+            raise ValueError(f"Mismatch in number of conformations: {path} has {len(table)} rows, energies have {n_conformers}")
+
+    values = []
+    for column in columns:
+        table = next((t for t in tables if column in t.columns), None)
+        if table is None:
+            raise ValueError(f"The specified column '{column}' does not exist in any properties file")
+        values.append(pd.to_numeric(table[column]).values)
+    return np.column_stack(values)
+
+
+def read_frame_log_weights(frame_weights_csv, populations_table, n_conformers):
+    """
+    Bias log-weights (hills_reweight.py) of every conformer. For clustered runs these are
+    the Log_Weight column of the populations: the log-sum-exp of the member frames'
+    weights, written by cluster_conformers.py -f, which already includes the population.
+    """
+    if populations_table is not None:
+        if "Log_Weight" not in populations_table.columns:
+            raise ValueError(f"Frame weights need the summed cluster weights: rerun cluster_conformers.py with -f {frame_weights_csv}")
+        log_weights = populations_table["Log_Weight"].values
+    else:
+        log_weights = pd.read_csv(frame_weights_csv)["Log_Weight"].values
+    if len(log_weights) != n_conformers:
+        raise ValueError(f"{frame_weights_csv} has {len(log_weights)} frame weights but there are {n_conformers} conformers")
+    return log_weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculate Boltzmann-weighted ensemble averages of several properties at several temperatures, with bootstrap errors.")
+    parser.add_argument("-e", "--energies", required=True, help="CSV file with the conformer energies (ANI_energy(kcal/mol)).")
+    parser.add_argument("-p", "--properties", required=True, nargs="+", help="CSV file(s) with per-conformer property values, rows in conformer order.")
+    parser.add_argument("-o", "--output", required=True, help="Output CSV file (Temperature, Property, Ensemble_Average, Bootstrap_SE).")
+    parser.add_argument("-c", "--columns", nargs="+", default=DEFAULT_COLUMNS, help=f"Property columns to average (default: {' '.join(DEFAULT_COLUMNS)}).")
+    parser.add_argument("-t", "--temperatures", nargs="+", type=float, default=DEFAULT_TEMPERATURES, help="Temperatures in Kelvin (default: 298).")
+    parser.add_argument("--populations", default=None, help="Optional cluster populations CSV (cluster_conformers.py); rows follow the conformer order.")
+    parser.add_argument("--frame_weights", default=None, help="Optional metadynamics frame weights CSV (hills_reweight.py); its Log_Weight column removes the bias.")
+    parser.add_argument("-w", "--weights", default=None, help="Optional CSV to save the energies with one Boltzmann weight column per temperature.")
+    parser.add_argument("-b", "--bootstrap", type=int, default=N_BOOTSTRAP, help=f"Bootstrap resamples (default: {N_BOOTSTRAP}; 0 disables).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the bootstrap (default: 0).")
+    args = parser.parse_args()
+
+    energy_df = pd.read_csv(args.energies)
+    energies = energy_df[ENERGY_COLUMN].values
+
+    populations = None
+    populations_table = None
+    if args.populations:
+        populations_table = pd.read_csv(args.populations)
+        populations = populations_table["Population"].values
+        if len(populations) != len(energies):
+            raise ValueError(f"{args.populations} has {len(populations)} populations but {args.energies} has {len(energies)} energies")
+
+    log_weights = None
+    if args.frame_weights:
+        log_weights = read_frame_log_weights(args.frame_weights, populations_table, len(energies))
+        # Summed cluster weights replace population x representative weight
+        populations = None
+
+    values = read_property_columns(args.properties, args.columns, len(energies))
+    count_items(conformers=len(energies))
+    averages, errors, weights = ensemble_averages(energies, values, args.temperatures, populations, args.bootstrap, args.seed, log_weights)
+
+    rows = [
+        {"Temperature": temperature, "Property": column, "Ensemble_Average": averages[t, c], "Bootstrap_SE": errors[t, c]}
+        for t, temperature in enumerate(args.temperatures)
+        for c, column in enumerate(args.columns)
+    ]
+    pd.DataFrame(rows).to_csv(args.output, index=False)
+
+    if args.weights:
+        for t, temperature in enumerate(args.temperatures):
+            energy_df[f"Boltzmann Weight {temperature:g}K"] = weights[t]
+        energy_df.to_csv(args.weights, index=False)
+
+    for row in rows:
+        print(f"T={row['Temperature']:g}K Ensemble_Average_{row['Property']}: {row['Ensemble_Average']:.2f} ± {row['Bootstrap_SE']:.2f}")
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Geometric intramolecular hydrogen-bond (IMHB) detection for whole conformer ensembles.
+
+Donor hydrogens, acceptors and the acceptors' bonded neighbors are taken from the
+topology once; the distance and angle criteria are then evaluated for every
+candidate (H, acceptor) pair in every conformer with NumPy. The default criteria
+are those of Schrödinger's hbond.get_hydrogen_bonds.
+"""
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import Lipinski
+
+MAX_DISTANCE = 2.8  # H...A distance (Angstrom)
+MIN_DONOR_ANGLE = 120.0  # D-H...A angle (degrees)
+MIN_ACCEPTOR_ANGLE = 90.0  # H...A-X angle for every neighbor X of the acceptor (degrees)
+
+DONOR_PATTERN = Lipinski.HDonorSmarts
+ACCEPTOR_PATTERN = Lipinski.HAcceptorSmarts
+
+
+class HBondTopology:
+    """
+    Candidate (hydrogen, acceptor) pairs of one molecule: every hydrogen on a donor
+    atom with every acceptor in the same fragment other than that donor atom.
+    """
+
+    def __init__(self, mol):
+        donors = {match[0] for match in mol.GetSubstructMatches(DONOR_PATTERN)}
+        acceptors = sorted({match[0] for match in mol.GetSubstructMatches(ACCEPTOR_PATTERN)})
+        fragment = np.zeros(mol.GetNumAtoms(), dtype=int)
+        for k, atoms in enumerate(Chem.GetMolFrags(mol)):
+            fragment[list(atoms)] = k
+
+        hydrogens, donor_atoms, acceptor_atoms = [], [], []
+        for atom in mol.GetAtoms():
+            if atom.GetAtomicNum() != 1 or atom.GetDegree() != 1:
+                continue
+            donor = atom.GetNeighbors()[0].GetIdx()
+            if donor not in donors:
+                continue
+            for acceptor in acceptors:
+                if acceptor != donor and fragment[acceptor] == fragment[atom.GetIdx()]:
+                    hydrogens.append(atom.GetIdx())
+                    donor_atoms.append(donor)
+                    acceptor_atoms.append(acceptor)
+
+        self.hydrogens = np.array(hydrogens, dtype=int)
+        self.donors = np.array(donor_atoms, dtype=int)
+        self.acceptors = np.array(acceptor_atoms, dtype=int)
+
+        # Bonded neighbors of each candidate acceptor, padded with -1
+        neighbors = [[n.GetIdx() for n in mol.GetAtomWithIdx(int(a)).GetNeighbors()] for a in self.acceptors]
+        width = max((len(n) for n in neighbors), default=0)
+        self.acceptor_neighbors = np.array([n + [-1] * (width - len(n)) for n in neighbors], dtype=int).reshape(len(neighbors), width)
+
+
+def cos_angle(a, b):
+    return (a * b).sum(axis=-1) / (np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1))
+
+
+def find_imhb(topology, coordinates, max_distance=MAX_DISTANCE, min_donor_angle=MIN_DONOR_ANGLE, min_acceptor_angle=MIN_ACCEPTOR_ANGLE):
+    """
+    Intramolecular hydrogen bonds of every conformer (coordinates of shape
+    (n_conformers, n_atoms, 3)) as lists of (hydrogen, acceptor) pairs with 1-based
+    atom indices, like Schrödinger's atom.index.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    n_conf = len(coordinates)
+    if not len(topology.hydrogens):
+        return [[] for _ in range(n_conf)]
+
+    h = coordinates[:, topology.hydrogens]
+    d = coordinates[:, topology.donors]
+    a = coordinates[:, topology.acceptors]
+    h_to_a = a - h
+
+    within = (h_to_a ** 2).sum(axis=-1) <= max_distance ** 2
+    donor_ok = cos_angle(d - h, h_to_a) <= np.cos(np.radians(min_donor_angle))
+
+    # Acceptor angle against every bonded neighbor; padded neighbors always pass
+    x = coordinates[:, topology.acceptor_neighbors]
+    acceptor_cos = cos_angle(-h_to_a[:, :, None, :], x - a[:, :, None, :])
+    acceptor_ok = ((acceptor_cos <= np.cos(np.radians(min_acceptor_angle))) | (topology.acceptor_neighbors < 0)).all(axis=2)
+
+    bonded = within & donor_ok & acceptor_ok
+    return [
+        [(int(topology.hydrogens[p]) + 1, int(topology.acceptors[p]) + 1) for p in np.flatnonzero(row)]
+        for row in bonded
+    ]
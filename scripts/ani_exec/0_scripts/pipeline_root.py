@@ -0,0 +1,25 @@
+"""
+Repository root of this pipeline, put on sys.path so that ``pipeline`` can be imported.
+
+The scripts next to this file also run from copies under outputs/, at different
+depths, so the root is $PIPELINE_ROOT or the nearest parent directory that contains
+pipeline/. Import this module before any ``pipeline`` import; every script directory
+has the same copy.
+"""
+import os
+import sys
+
+
+def find_root(path):
+    path = os.path.abspath(path)
+    while not os.path.isfile(os.path.join(path, "pipeline", "telemetry.py")):
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise ImportError(f"No pipeline/ directory above {os.path.dirname(os.path.abspath(__file__))}; set PIPELINE_ROOT.")
+        path = parent
+    return path
+
+
+PIPELINE_ROOT = os.environ.get("PIPELINE_ROOT") or find_root(os.path.dirname(__file__))
+if PIPELINE_ROOT not in sys.path:
+    sys.path.insert(0, PIPELINE_ROOT)
@@ -32,29 +32,36 @@ FINAL_SDF="../../sdf/optimized_${INPUT_INDEX}.sdf"
 # Create directories if they don't exist
 mkdir -p "$SPLIT_DIR" "$OUTPUT_DIR" "$(dirname "$FINAL_CSV")" "$(dirname "$FINAL_SDF")"
 
-# Get line numbers of the delimiters and store them in an array
-mapfile -t line_numbers < <(grep -n '\$\$\$\$' "$INPUT_FILE" | cut -d: -f1)
-
-# Split the file based on the line numbers
-start=1
-count=1 # Start counting from 1
-for end in "${line_numbers[@]}"; do
-  sed -n "${start},${end}p" "$INPUT_FILE" > "$SPLIT_DIR/molecule_$count.sdf"
-  echo "Saved molecule $count from line $start to $end."
-  start=$((end + 1))
-  count=$((count + 1))
-done
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+MODEL="ANI2x_${SOLVENT}"
+
+# By default one worker process loads the model once and optimizes the whole chunk in batches.
+# ANI_RUNNER=run_ANI keeps the original one-process-per-molecule route below.
+if [[ "${ANI_RUNNER:-worker}" != "run_ANI" ]]; then
+  # The ANI2x_<solvent> models are not part of torchani: set ANI_MODEL_FILE to the serialized model
+  python "$SCRIPT_DIR/ani_worker.py" \
+    -i "$INPUT_FILE" \
+    --output_sdf "$FINAL_SDF" \
+    --output_csv "$FINAL_CSV" \
+    --calculator "${ANI_CALCULATOR:-torchani}" \
+    --model "$MODEL" \
+    ${ANI_MODEL_FILE:+--model_file "$ANI_MODEL_FILE"}
+  exit $?
+fi
 
-echo "Split completed. $((count - 1)) molecules saved to '$SPLIT_DIR'."
+# Split into one file per molecule in a single indexed pass over the chunk
+python "$SCRIPT_DIR/sdf_index.py" split "$INPUT_FILE" -n 1 -o "$SPLIT_DIR/molecule_{}.sdf"
+NUM_MOLECULES=$(python "$SCRIPT_DIR/sdf_index.py" count "$INPUT_FILE")
 
-# Python script and model for ANI processing
+echo "Split completed. $NUM_MOLECULES molecules saved to '$SPLIT_DIR'."
+
+# Python script for ANI processing
 ANI_PYTHON_SCRIPT="/SFS/project/kw/kimbry/rklake/smiles_to_ff/git/mrl-mi-ssf-torchani/scripts/run_ANI.py"
-MODEL="ANI2x_${SOLVENT}"
 
-# Loop through each SDF file in the input directory
-for input_file in "$SPLIT_DIR"/*.sdf; do
-  # Extract base filename without extension
-  base_name=$(basename "$input_file" .sdf)
+# Loop through the molecules in their order in the chunk
+for count in $(seq 1 "$NUM_MOLECULES"); do
+  input_file="$SPLIT_DIR/molecule_$count.sdf"
+  base_name="molecule_$count"
 
   # Set output filenames
   output_sdf="$OUTPUT_DIR/${base_name}_optimized.sdf"
@@ -95,15 +102,22 @@ echo "All files processed."
 
 # Concatenate all CSV files in order
 echo "Concatenating all CSV files into $FINAL_CSV..."
-head -n 1 $(find "$OUTPUT_DIR" -type f -name "*.csv" | sort | head -n 1) > "$FINAL_CSV" # Add header from the first file
-for file in $(find "$OUTPUT_DIR" -type f -name "*.csv" | sort); do
+# Molecules are numbered, so concatenate in numeric (chunk) order rather than lexical order
+CSV_FILES=()
+SDF_FILES=()
+for count in $(seq 1 "$NUM_MOLECULES"); do
+  [[ -f "$OUTPUT_DIR/molecule_${count}_optimized.csv" ]] && CSV_FILES+=("$OUTPUT_DIR/molecule_${count}_optimized.csv")
+  [[ -f "$OUTPUT_DIR/molecule_${count}_optimized.sdf" ]] && SDF_FILES+=("$OUTPUT_DIR/molecule_${count}_optimized.sdf")
+done
+head -n 1 "${CSV_FILES[0]}" > "$FINAL_CSV" # Add header from the first file
+for file in "${CSV_FILES[@]}"; do
   tail -n +2 "$file" >> "$FINAL_CSV" # Skip header lines from subsequent files
 done
 echo "CSV concatenation complete. Saved to $FINAL_CSV."
 
 # Concatenate all SDF files in order
 echo "Concatenating all SDF files into $FINAL_SDF..."
-cat $(find "$OUTPUT_DIR" -type f -name "*.sdf" | sort) > "$FINAL_SDF"
+cat "${SDF_FILES[@]}" > "$FINAL_SDF"
 echo "SDF concatenation complete. Saved to $FINAL_SDF."
 
 echo "All tasks completed successfully."
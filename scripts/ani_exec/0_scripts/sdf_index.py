@@ -0,0 +1,158 @@
+"""
+Byte-offset index of the records of a multi-record SDF file.
+
+The file is scanned once for the ``$$$$`` terminators; the record boundaries are
+saved next to it as ``<file>.idx.npy`` and reused while the file is unchanged.
+Records, slices and chunks are then copied out as raw byte ranges, so nothing is
+parsed or re-serialized and the text of every record is preserved exactly.
+"""
+import os
+import re
+import mmap
+import argparse
+import numpy as np
+
+INDEX_SUFFIX = ".idx.npy"
+TERMINATOR = re.compile(rb"^\$\$\$\$[^\n]*(?:\n|$)", re.MULTILINE)
+
+
+def index_path(sdf_file):
+    return sdf_file + INDEX_SUFFIX
+
+
+def scan_offsets(sdf_file):
+    """
+    Record boundaries of ``sdf_file``: record k spans bytes [offsets[k], offsets[k + 1]).
+    Text after the last terminator counts as a final record unless it is only whitespace.
+    """
+    size = os.path.getsize(sdf_file)
+    offsets = [0]
+    if size:
+        with open(sdf_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets += [m.end() for m in TERMINATOR.finditer(mm)]
+            if mm[offsets[-1]:].strip():
+                offsets.append(size)
+    return np.array(offsets, dtype=np.int64)
+
+
+class SDFIndex:
+    """
+    Random access to the records of an SDF file by position.
+    The saved index stores the file size ahead of the offsets and is rebuilt when
+    the size differs or the SDF is newer than the index.
+    """
+
+    def __init__(self, sdf_file, save=True):
+        self.path = sdf_file
+        self.offsets = self._load() if self._is_current() else None
+        if self.offsets is None:
+            self.offsets = scan_offsets(sdf_file)
+            if save:
+                np.save(index_path(sdf_file), np.concatenate([[os.path.getsize(sdf_file)], self.offsets]))
+
+    def _is_current(self):
+        idx = index_path(self.path)
+        return os.path.exists(idx) and os.path.getmtime(idx) >= os.path.getmtime(self.path)
+
+    def _load(self):
+        stored = np.load(index_path(self.path))
+        if stored[0] != os.path.getsize(self.path):
+            return None
+        return stored[1:]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def byte_range(self, start=0, stop=None):
+        """Byte offsets [begin, end) covering records [start, stop)."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        return int(self.offsets[start]), int(self.offsets[stop])
+
+    def read(self, start=0, stop=None):
+        """Raw bytes of records [start, stop)."""
+        begin, end = self.byte_range(start, stop)
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            return f.read(end - begin)
+
+    def record(self, i):
+        """Raw bytes of record ``i``."""
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"record {i} out of range for {self.path} ({len(self)} records)")
+        i %= len(self)
+        return self.read(i, i + 1)
+
+    def records(self, start=0, stop=None):
+        """Raw bytes of each of records [start, stop), read in one pass."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        data = self.read(start, stop)
+        bounds = (self.offsets[start:stop + 1] - self.offsets[start]).tolist()
+        return [data[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def write(self, output_file, start=0, stop=None):
+        """Copy records [start, stop) to ``output_file``."""
+        begin, end = self.byte_range(start, stop)
+        with open(self.path, "rb") as src, open(output_file, "wb") as dst:
+            if end > begin:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    dst.write(mm[begin:end])
+
+    def chunks(self, chunk_size):
+        """(start, stop) record ranges of consecutive chunks of ``chunk_size`` records."""
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        return [(start, min(start + chunk_size, len(self))) for start in range(0, len(self), chunk_size)]
+
+    def split(self, output_pattern, chunk_size):
+        """
+        Write each chunk to ``output_pattern.format(k)`` with k counting from 1,
+        creating directories as needed. Returns the written paths.
+        """
+        return self.write_ranges(output_pattern, self.chunks(chunk_size))
+
+    def write_ranges(self, output_pattern, ranges):
+        """Write records [start, stop) of the k-th (start, stop) range to ``output_pattern.format(k)``, k from 1."""
+        paths = []
+        for k, (start, stop) in enumerate(ranges, start=1):
+            path = output_pattern.format(k)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.write(path, start, stop)
+            paths.append(path)
+        return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index, slice and split SDF files by byte offsets.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count = subparsers.add_parser("count", help="Print the number of records.")
+    count.add_argument("sdf_file")
+
+    extract = subparsers.add_parser("extract", help="Copy records [start, stop) to a new file.")
+    extract.add_argument("sdf_file")
+    extract.add_argument("-s", "--start", type=int, default=0, help="First record, 0-based (default: 0).")
+    extract.add_argument("-e", "--stop", type=int, default=None, help="Stop record, exclusive (default: end of file).")
+    extract.add_argument("-o", "--output", required=True, help="Output SDF file.")
+
+    split = subparsers.add_parser("split", help="Split into chunks of consecutive records.")
+    split.add_argument("sdf_file")
+    split.add_argument("-n", "--chunk_size", type=int, default=1, help="Records per chunk (default: 1).")
+    split.add_argument("-o", "--output", required=True, help="Output path pattern with '{}' for the 1-based chunk number.")
+
+    args = parser.parse_args()
+    index = SDFIndex(args.sdf_file)
+
+    if args.command == "count":
+        print(len(index))
+    elif args.command == "extract":
+        index.write(args.output, args.start, args.stop)
+        print(f"Records {args.start} to {args.stop if args.stop is not None else len(index)} of {args.sdf_file} saved to {args.output}")
+    elif args.command == "split":
+        paths = index.split(args.output, args.chunk_size)
+        print(f"Split {len(index)} records of {args.sdf_file} into {len(paths)} files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,27 @@
 #!/bin/bash
 
 # Check if the correct number of arguments is provided
-if [ "$#" -ne 6 ]; then
-    echo "Usage: $0 <solvent> <sdf_file> <total_configurations> <chunk_size> <files_dir> <template_pbs>"
+if [ "$#" -ne 6 ] && [ "$#" -ne 7 ]; then
+    echo "Usage: $0 <solvent> <sdf_file> <target_hours> <max_tasks> <files_dir> <template_pbs> [populations_csv]"
     exit 1
 fi
 
 # Assign arguments to variables
 SOLVENT=$1
 SDF_FILE=$2
-TOTAL_CONFIGURATIONS=$3
-CHUNK_SIZE=$4
+TARGET_HOURS=$3  # Target wall time per array task; chunks are sized by the cost model in chunk_planner.py
+MAX_TASKS=$4
 FILES_DIR=$5
 TEMPLATE_PBS=$6
+POPULATIONS=$7
+
+# Cluster populations are optional (only when the frames were clustered)
+EXTRA_ARGS=()
+if [ -n "$POPULATIONS" ]; then
+    EXTRA_ARGS=(--populations "$POPULATIONS")
+fi
 
 # Run the Python script with the provided arguments
-python ../0_scripts/ani_job_setup.py "$SOLVENT" "$SDF_FILE" "$TOTAL_CONFIGURATIONS" "$CHUNK_SIZE" "$FILES_DIR" "$TEMPLATE_PBS"
+python ../0_scripts/ani_job_setup.py "$SOLVENT" "$SDF_FILE" "$FILES_DIR" "$TEMPLATE_PBS" \
+    --target_hours "$TARGET_HOURS" --max_tasks "$MAX_TASKS" "${EXTRA_ARGS[@]}"
 
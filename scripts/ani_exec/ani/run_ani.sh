@@ -36,14 +36,50 @@ python ../0_scripts/extract_lowest_energy.py \
     -o analysis/lowest_conformer.sdf \
     -n 10
 
-# Calculate molecular properties
-$SCHRODINGER/run python3 ../0_scripts/calculate_psa.py -i analysis/output_sp.sdf -o analysis/psa_values.csv
-$SCHRODINGER/run python3 ../0_scripts/calculate_imhb.py -i analysis/output_sp.sdf -o analysis/imhb_results.csv
-python ../0_scripts/calculate_3d_descriptors.py -i analysis/output_sp.sdf -o analysis/3d_descriptors.csv
+# This job runs in outputs/ani_exec/mol_N/ani, four levels below the repository root
+PIPELINE_ROOT="${PIPELINE_ROOT:-$(cd ../../../.. && pwd)}"
+export PIPELINE_ROOT
 
-# Perform ensemble averaging
-python ../0_scripts/calculate_boltzmann_weights.py -i analysis/output_sp.csv -o analysis/boltzmann_weights.csv
-python ../0_scripts/calculate_ensemble_avg.py -w analysis/boltzmann_weights.csv -p analysis/psa_values.csv -o analysis/ensemble_avg_psa.txt -c PSA
-python ../0_scripts/calculate_ensemble_avg.py -w analysis/boltzmann_weights.csv -p analysis/imhb_results.csv -o analysis/ensemble_avg_num_imhb.txt -c Num_IMHB
-python ../0_scripts/calculate_ensemble_avg.py -w analysis/boltzmann_weights.csv -p analysis/3d_descriptors.csv -o analysis/ensemble_avg_rgyr.txt -c RadiusOfGyration
+# Convert the single points once to a memory-mapped conformer ensemble (pipeline/ensemble.py),
+# so the property workers slice coordinates instead of parsing SDF records; the SDF is used if that fails
+PROPERTY_INPUT=analysis/output_sp.sdf
+if python "$PIPELINE_ROOT/pipeline/ensemble.py" from-sdf analysis/output_sp.sdf analysis/output_sp.ens; then
+    PROPERTY_INPUT=analysis/output_sp.ens
+fi
+
+# Calculate PSA, IMHB and 3D descriptors in one pass (one row per conformer)
+# PSA_BACKEND=numpy / IMHB_BACKEND=numpy use the built-in implementations instead of Schrödinger's;
+# with both set, the Schrödinger runtime is not needed at all
+PSA_BACKEND="${PSA_BACKEND:-schrodinger}"
+IMHB_BACKEND="${IMHB_BACKEND:-schrodinger}"
+PROPERTY_PYTHON=("$SCHRODINGER/run" python3)
+if [[ "$PSA_BACKEND" == "numpy" && "$IMHB_BACKEND" == "numpy" ]]; then
+    PROPERTY_PYTHON=(python)
+fi
+"${PROPERTY_PYTHON[@]}" ../0_scripts/calculate_properties.py -i "$PROPERTY_INPUT" -o analysis/properties.csv -w "${NCPUS:-1}" \
+    --psa_backend "$PSA_BACKEND" --imhb_backend "$IMHB_BACKEND"
+
+# Perform ensemble averaging: log-sum-exp Boltzmann weights and bootstrap errors for every property
+# and temperature in one pass (ENSEMBLE_TEMPERATURES is a space-separated list in Kelvin)
+# Clustered runs weight each representative by the number of frames it stands for, and the
+# metadynamics frame weights (hills_reweight.py, copied to ../data by 04_run_ani_exec.py) remove the bias
+ENSEMBLE_TEMPERATURES="${ENSEMBLE_TEMPERATURES:-298}"
+WEIGHT_ARGS=()
+if [ -f files/cluster_populations.csv ]; then
+    WEIGHT_ARGS+=(--populations files/cluster_populations.csv)
+fi
+if [ -f ../data/frame_weights.csv ]; then
+    WEIGHT_ARGS+=(--frame_weights ../data/frame_weights.csv)
+fi
+python ../0_scripts/ensemble_averages.py -e analysis/output_sp.csv -p analysis/properties.csv \
+    -c PSA Num_IMHB RadiusOfGyration -t $ENSEMBLE_TEMPERATURES \
+    -w analysis/boltzmann_weights.csv -o analysis/ensemble_averages.csv "${WEIGHT_ARGS[@]}"
+
+
+# Publish per-molecule results to outputs/ani_exec/mol_N, where get_3d_properties.py reads them
+cp analysis/ensemble_averages.csv analysis/lowest_conformer.sdf ..
 
+# Record this molecule's averages in the feature store (outputs/feature_store) as soon as they exist
+MOL_INDEX="$(basename "$(dirname "$PWD")")"
+python "$PIPELINE_ROOT/scripts/ml_models/feature_store.py" upsert-ensemble "$PIPELINE_ROOT/outputs/feature_store" \
+    "${MOL_INDEX#mol_}" analysis/ensemble_averages.csv --solvent "${SOLVENT^}"
@@ -0,0 +1,217 @@
+"""
+Columnar store of per-molecule features, keyed by the molecule Index of data/mol_data.csv.
+
+The store is a directory with one ``.npy`` file per column (float64, NaN where a
+molecule has no value yet), ``index.npy`` with the molecule Index of every row, and
+``columns.json`` listing the columns in order with their group (``2d``, ``3d``,
+``target``, ...). Readers memory-map only the columns they ask for; no CSV is parsed.
+
+Writers upsert: new molecules are appended, existing values are overwritten and new
+columns are added, under an exclusive lock, so every ani_exec/mol_N job can record its
+results as it finishes. Column files are replaced atomically and written before the
+index and the manifest, so a reader never sees a row or column that is not complete.
+"""
+import os
+import json
+import fcntl
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+
+MANIFEST = "columns.json"
+INDEX_FILE = "index.npy"
+LOCK_FILE = ".lock"
+TARGET_COLUMN = "P_appLog"
+
+
+def default_group(name):
+    """Feature group of a column, from the naming used in model_data.csv."""
+    if name == TARGET_COLUMN:
+        return "target"
+    if name.startswith("Ensemble_Average_"):
+        return "3d"
+    if name.startswith("Ensemble_SE_"):
+        return "uncertainty"
+    if name.startswith("P_app"):
+        return "measurement"
+    return "2d"
+
+
+class FeatureStore:
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return {"columns": []}
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save(self, name, array):
+        tmp = os.path.join(self.path, name + ".tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    @property
+    def columns(self):
+        return [column["name"] for column in self._manifest()["columns"]]
+
+    def groups(self):
+        """{group: [column names]} in column order."""
+        groups = {}
+        for column in self._manifest()["columns"]:
+            groups.setdefault(column["group"], []).append(column["name"])
+        return groups
+
+    def index(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return np.empty(0, dtype=np.int64)
+        return np.load(index_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.index())
+
+    def column(self, name, manifest=None):
+        """Memory-mapped values of one column, aligned with index()."""
+        manifest = manifest or self._manifest()
+        for column in manifest["columns"]:
+            if column["name"] == name:
+                return np.load(os.path.join(self.path, column["file"]), mmap_mode="r")[:len(self.index())]
+        raise KeyError(f"Column '{name}' is not in the feature store {self.path}")
+
+    def upsert(self, index, values, groups=None):
+        """
+        Set values[name][k] for the molecule index[k]. Unknown molecules are appended
+        and unknown columns are created; the group of a new column comes from
+        groups[name] or default_group(name).
+        """
+        index = np.asarray(index, dtype=np.int64)
+        groups = groups or {}
+        with self._lock():
+            manifest = self._manifest()
+            old_index = np.array(self.index())
+            new_ids = np.setdiff1d(np.unique(index), old_index)
+            all_index = np.concatenate([old_index, new_ids])
+
+            order = np.argsort(all_index, kind="stable")
+            rows = order[np.searchsorted(all_index[order], index)]
+
+            files = {column["name"]: column["file"] for column in manifest["columns"]}
+            for name in values:
+                if name not in files:
+                    files[name] = f"c{len(manifest['columns']):04d}.npy"
+                    manifest["columns"].append({"name": name, "file": files[name], "group": groups.get(name, default_group(name))})
+
+            for column in manifest["columns"]:
+                name = column["name"]
+                if name not in values and not len(new_ids):
+                    continue
+                path = os.path.join(self.path, column["file"])
+                old = np.load(path)[:len(old_index)] if os.path.exists(path) else np.full(len(old_index), np.nan)
+                array = np.concatenate([old, np.full(len(new_ids), np.nan)])
+                if name in values:
+                    array[rows] = np.asarray(values[name], dtype=np.float64)
+                self._save(column["file"], array)
+
+            # Columns first, then the rows they cover, then the manifest that names them
+            self._save(INDEX_FILE, all_index)
+            tmp = os.path.join(self.path, MANIFEST + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(manifest, f, indent=1)
+            os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+    def upsert_frame(self, df, index_column="Index", groups=None):
+        """Upsert every numeric column of a DataFrame; rows are keyed by df[index_column]."""
+        numeric = [c for c in df.columns if c != index_column and pd.api.types.is_numeric_dtype(df[c])]
+        self.upsert(df[index_column].values, {c: df[c].values for c in numeric}, groups)
+
+    def view(self, columns, dropna=True):
+        """DataFrame of the requested columns indexed by molecule Index, in Index order."""
+        manifest = self._manifest()
+        index = np.array(self.index())
+        order = np.argsort(index, kind="stable")
+        df = pd.DataFrame({name: self.column(name, manifest)[order] for name in columns}, index=pd.Index(index[order], name="Index"))
+        return df.dropna() if dropna else df
+
+
+def read_ensemble_averages(path, temperature):
+    """{property: (average, bootstrap SE)} of one temperature from an ensemble_averages.csv table."""
+    table = pd.read_csv(path)
+    table = table[np.isclose(table["Temperature"], temperature)]
+    return {row.Property: (row.Ensemble_Average, row.Bootstrap_SE) for row in table.itertuples()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, update and export the columnar per-molecule feature store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    csv_cmd = subparsers.add_parser("upsert-csv", help="Upsert the numeric columns of a CSV table.")
+    csv_cmd.add_argument("store")
+    csv_cmd.add_argument("csv_file")
+    csv_cmd.add_argument("--index_column", default="Index",
+                         help="Column with the molecule Index (default: Index); tables without it are numbered 1..N in row order, like mol_data.csv.")
+    csv_cmd.add_argument("--log_target", default=None,
+                         help=f"Also store log10 of this column (e.g. P_app) as the model target {TARGET_COLUMN}.")
+
+    ens_cmd = subparsers.add_parser("upsert-ensemble", help="Upsert one molecule's ensemble_averages.csv.")
+    ens_cmd.add_argument("store")
+    ens_cmd.add_argument("mol_index", type=int, help="Molecule Index (N of mol_N).")
+    ens_cmd.add_argument("ensemble_csv")
+    ens_cmd.add_argument("--solvent", default="Chloroform", help="Solvent label used in the column names (default: Chloroform).")
+    ens_cmd.add_argument("--temperature", type=float, default=298.0, help="Temperature of the averages to store, in Kelvin (default: 298).")
+
+    export_cmd = subparsers.add_parser("export", help="Write the store (or some columns) to CSV.")
+    export_cmd.add_argument("store")
+    export_cmd.add_argument("-o", "--output", required=True, help="Output CSV file.")
+    export_cmd.add_argument("-c", "--columns", nargs="+", default=None, help="Columns to export (default: all).")
+
+    info_cmd = subparsers.add_parser("info", help="Print the molecules and columns of the store.")
+    info_cmd.add_argument("store")
+
+    args = parser.parse_args()
+    store = FeatureStore(args.store)
+
+    if args.command == "upsert-csv":
+        df = pd.read_csv(args.csv_file)
+        if args.index_column not in df.columns:
+            df.insert(0, args.index_column, np.arange(1, len(df) + 1))
+        if args.log_target:
+            df[TARGET_COLUMN] = np.log10(df[args.log_target])
+        store.upsert_frame(df, args.index_column)
+        print(f"Upserted {len(df)} rows of {args.csv_file} into {args.store}")
+    elif args.command == "upsert-ensemble":
+        averages = read_ensemble_averages(args.ensemble_csv, args.temperature)
+        values = {}
+        for prop, (average, error) in averages.items():
+            # Two decimals, as in the ensemble_avg_*.txt files the CSV workflow used
+            values[f"Ensemble_Average_{prop}_{args.solvent}_ANI"] = [round(average, 2)]
+            values[f"Ensemble_SE_{prop}_{args.solvent}_ANI"] = [error]
+        store.upsert([args.mol_index], values)
+        print(f"Upserted {len(averages)} ensemble averages of mol_{args.mol_index} into {args.store}")
+    elif args.command == "export":
+        store.view(args.columns or store.columns, dropna=False).to_csv(args.output)
+        print(f"Exported {len(store)} molecules to {args.output}")
+    elif args.command == "info":
+        print(f"{len(store)} molecules")
+        for group, names in store.groups().items():
+            print(f"{group}: {len(names)} columns")
+            for name in names:
+                print(f"    {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import re
 import csv
 
 output_file = "3d_features.csv"
@@ -9,26 +10,47 @@ header = [
     "Ensemble_Average_RadiusOfGyration_Chloroform_ANI"
 ]
 
-number_of_molecules = 32
 base_dir = "../ani_exec"
 rows = []
 
+reference_temperature = 298.0  # Ensemble averages at this temperature become the features
+columns = ["PSA", "Num_IMHB", "RadiusOfGyration"]
+
 def extract_value(path):
     with open(path) as f:
         line = f.read().strip()
         return float(line.split(":")[1].strip())
 
-for i in range(1, number_of_molecules + 1):
+def extract_averages(mol_dir):
+    """Ensemble averages of `columns` from ensemble_averages.csv, or the older per-property text files."""
+    table_path = os.path.join(mol_dir, "ensemble_averages.csv")
+    if not os.path.exists(table_path):
+        return [
+            extract_value(os.path.join(mol_dir, f"ensemble_avg_{name}.txt"))
+            for name in ["psa", "num_imhb", "rgyr"]
+        ]
+
+    averages = {}
+    with open(table_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if float(row["Temperature"]) == reference_temperature:
+                averages[row["Property"]] = round(float(row["Ensemble_Average"]), 2)
+    missing = [c for c in columns if c not in averages]
+    if missing:
+        raise ValueError(f"no {reference_temperature:g} K average of {', '.join(missing)} in {table_path}")
+    return [averages[c] for c in columns]
+
+# Every ani_exec/mol_N directory, in molecule Index order
+mol_indices = sorted(
+    int(name.split("_")[1]) for name in os.listdir(base_dir)
+    if re.fullmatch(r"mol_\d+", name) and os.path.isdir(os.path.join(base_dir, name))
+) if os.path.isdir(base_dir) else []
+
+for i in mol_indices:
     mol_dir = os.path.join(base_dir, f"mol_{i}")
-    if not os.path.isdir(mol_dir):
-        print(f"❌ Skipping mol_{i}: directory not found.")
-        continue
 
     try:
-        psa = extract_value(os.path.join(mol_dir, "ensemble_avg_psa.txt"))
-        imhb = extract_value(os.path.join(mol_dir, "ensemble_avg_num_imhb.txt"))
-        rgyr = extract_value(os.path.join(mol_dir, "ensemble_avg_rgyr.txt"))
-        rows.append([i, psa, imhb, rgyr])
+        rows.append([i] + extract_averages(mol_dir))
     except Exception as e:
         print(f"⚠️  Failed to parse mol_{i}: {e}")
 
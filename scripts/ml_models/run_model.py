@@ -1,5 +1,10 @@
 import argparse
+import itertools
+import json
+import math
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
@@ -10,8 +15,12 @@ from sklearn.cross_decomposition import PLSRegression
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.svm import SVR
 from scipy.stats import pearsonr
+from threadpoolctl import threadpool_limits
 from tqdm import tqdm
 
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
 
 def load_data(csv_path):
     df = pd.read_csv(csv_path)
@@ -40,62 +49,426 @@ def load_data(csv_path):
     return df, y, feature_sets
 
 
-def evaluate_model(model_type, features, y, outdir,
-                   scrambled=False, n_splits=100, test_size=0.5,
-                   n_estimators=100, max_depth=None,
-                   n_components=2, svr_params=None,
-                   perm_repeats=10, model_args_for_config=None):
+def load_store(store_path):
+    """
+    Same as load_data, from the columnar feature store (feature_store.py): the 2d and 3d
+    groups are memory-mapped and molecules missing any feature or the target are dropped.
+    """
+    from feature_store import FeatureStore, TARGET_COLUMN
+
+    store = FeatureStore(store_path)
+    groups = store.groups()
+    features_2d = groups.get("2d", [])
+    features_3d = groups.get("3d", [])
+    df = store.view(features_2d + features_3d + [TARGET_COLUMN]).reset_index(drop=True)
+    y = df[TARGET_COLUMN]
+
+    feature_sets = {
+        "2d": features_2d,
+        "3d": features_3d,
+        "combined": features_2d + features_3d
+    }
+
+    return df, y, feature_sets
+
+
+MODEL_TYPES = ["rf", "svr", "pls"]
+FEATURE_SETS = ["2d", "3d", "combined"]
+SCRAMBLED_OPTIONS = [False, True]
+
+# Models trained on standardized features
+SCALED_MODELS = ["pls", "svr"]
+
+# Models whose prediction is linear in the features (closed-form permutation importance)
+LINEAR_MODELS = ["pls"]
+
+PERM_ENGINES = ["batched", "sklearn"]
+
+# Hyperparameters, named like their command-line options
+HYPERPARAMETERS = ["n_estimators", "max_depth", "n_components", "svr_C", "svr_epsilon"]
+
+# Candidate values tried by --search for each model type (override with --search_space)
+SEARCH_SPACES = {
+    "rf": {"n_estimators": [10, 50, 100, 200], "max_depth": [3, 5, 10, None]},
+    "svr": {"svr_C": [0.1, 1.0, 10.0, 100.0], "svr_epsilon": [0.01, 0.1, 0.5]},
+    "pls": {"n_components": [1, 2, 3, 4, 5, 6, 8, 10]},
+}
+SEARCH_METHODS = ["grid", "random"]
+SEARCH_METRIC = "R2"  # Mean test-set metric ranking the candidates (higher is better)
+
+
+def model_params(hyperparameters):
+    """build_model keyword arguments from a dict of HYPERPARAMETERS."""
+    return {
+        "n_estimators": hyperparameters["n_estimators"],
+        "max_depth": hyperparameters["max_depth"],
+        "n_components": hyperparameters["n_components"],
+        "svr_params": {"kernel": "rbf", "C": hyperparameters["svr_C"], "epsilon": hyperparameters["svr_epsilon"]},
+    }
+
+
+def build_model(model_type, seed, n_estimators=100, max_depth=None,
+                n_components=2, svr_params=None, n_jobs=-1):
+    if model_type == "pls":
+        return PLSRegression(n_components=n_components)
+    elif model_type == "svr":
+        return SVR(**(svr_params or {}))
+    elif model_type == "rf":
+        return RandomForestRegressor(
+            n_estimators=n_estimators,
+            max_depth=max_depth,
+            random_state=seed,
+            n_jobs=n_jobs
+        )
+    else:
+        raise ValueError("Unsupported model type")
+
+
+class SplitCache:
+    """
+    Train/test indices and standardized matrices shared by every model and feature set.
+    ``train_test_split`` only depends on the number of rows and the seed, so split ``i``
+    selects the same rows for every combination; scrambling permutes y, not X.
+    """
+
+    def __init__(self, df, feature_sets, n_splits=100, test_size=0.5):
+        row_ids = np.arange(len(df))
+        self.indices = {
+            i: train_test_split(row_ids, test_size=test_size, random_state=i)
+            for i in range(1, n_splits + 1)
+        }
+        self.raw = {}
+        self.scaled = {}
+        for name, columns in feature_sets.items():
+            X = df[columns]
+            for i, (train_idx, test_idx) in self.indices.items():
+                X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+                scaler = StandardScaler()
+                self.raw[(name, i)] = (X_train, X_test)
+                self.scaled[(name, i)] = (scaler.fit_transform(X_train), scaler.transform(X_test))
 
+    def get(self, feature_set, i, scaled):
+        """Return (train_idx, test_idx, X_train, X_test) for split ``i``."""
+        train_idx, test_idx = self.indices[i]
+        X_train, X_test = (self.scaled if scaled else self.raw)[(feature_set, i)]
+        return train_idx, test_idx, X_train, X_test
+
+
+def permutation_indices(n_samples, n_repeats, random_state):
+    """
+    Row orders used by ``sklearn.inspection.permutation_importance`` for each repeat.
+    sklearn draws one seed from ``random_state``, restarts a RandomState from it for
+    every feature, and shuffles the already-permuted column again on each repeat,
+    so every feature sees the same sequence of compounded permutations.
+    """
+    seed = np.random.RandomState(random_state).randint(np.iinfo(np.int32).max + 1)
+    rng = np.random.RandomState(seed)
+    shuffling_idx = np.arange(n_samples)
+    order = np.arange(n_samples)
+    orders = np.empty((n_repeats, n_samples), dtype=int)
+    for r in range(n_repeats):
+        rng.shuffle(shuffling_idx)
+        order = order[shuffling_idx]
+        orders[r] = order
+    return orders
+
+
+def r2_scores(y_true, y_pred):
+    """R² of ``y_pred[..., n_samples]`` against ``y_true``, vectorized over the leading axes."""
+    numerator = ((y_true - y_pred) ** 2).sum(axis=-1)
+    denominator = ((y_true - y_true.mean()) ** 2).sum()
+    if denominator == 0:
+        # Same convention as sklearn.metrics.r2_score for a constant target
+        return np.where(numerator == 0, 1.0, 0.0)
+    return 1 - numerator / denominator
+
+
+def batched_permutation_importance(model, X, y, n_repeats=10, random_state=None, linear=False):
+    """
+    Permutation importance equivalent to ``sklearn.inspection.permutation_importance``
+    with the default R² scorer and the same ``random_state``.
+    All permuted copies of X (n_features x n_repeats) are stacked and predicted in one
+    call; for linear models the permuted predictions are computed in closed form as
+    ``y_pred + (x_perm_j - x_j) * w_j`` without any further ``predict`` call.
+    Returns the mean importance of each feature over the repeats.
+    """
+    columns = X.columns if hasattr(X, "columns") else None
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).ravel()
+    n_samples, n_features = X.shape
+
+    def predict(rows):
+        if columns is not None:
+            rows = pd.DataFrame(rows, columns=columns)
+        return np.asarray(model.predict(rows), dtype=float).reshape(len(rows), -1)[:, 0]
+
+    orders = permutation_indices(n_samples, n_repeats, random_state)
+    y_pred = predict(X)
+    baseline = r2_scores(y, y_pred)
+
+    if linear:
+        # Effective weight of each feature, including any internal scaling of the model
+        weights = predict(np.eye(n_features)) - predict(np.zeros((1, n_features)))
+        delta = X[orders] - X[np.newaxis]                       # (n_repeats, n_samples, n_features)
+        y_perm = y_pred + np.moveaxis(delta * weights, -1, 0)   # (n_features, n_repeats, n_samples)
+    else:
+        X_perm = np.broadcast_to(X, (n_features, n_repeats, n_samples, n_features)).copy()
+        for j in range(n_features):
+            X_perm[j, :, :, j] = X[orders, j]
+        y_perm = predict(X_perm.reshape(-1, n_features)).reshape(n_features, n_repeats, n_samples)
+
+    importances = baseline - r2_scores(y, y_perm)
+    return importances.mean(axis=1)
+
+
+def run_split(i, split=None, model_type=None, features=None, y=None, scrambled=False,
+              test_size=0.5, model_params=None, perm_repeats=10, n_jobs=-1,
+              perm_engine="batched"):
+    """
+    Fit and score one train/test split seeded with ``i``.
+    ``split`` optionally supplies the precomputed (train_idx, test_idx, X_train, X_test)
+    from a SplitCache; otherwise the split and scaling are computed here.
+    Returns the metrics row and the permutation-importance row for the split;
+    ``perm_repeats=0`` skips the importances and returns None for that row.
+    """
     feature_names = list(features.columns)
-    metric_rows = []
-    feature_rows = []
 
-    for i in tqdm(range(1, n_splits + 1), desc=model_type.upper()):
-        rng = np.random.RandomState(i)
-        y_used = y.sample(frac=1.0, random_state=rng).reset_index(drop=True) if scrambled else y.copy()
+    rng = np.random.RandomState(i)
+    y_used = y.sample(frac=1.0, random_state=rng).reset_index(drop=True) if scrambled else y.copy()
+
+    if split is not None:
+        train_idx, test_idx, X_train_scaled, X_test_scaled = split
+        y_train, y_test = y_used.iloc[train_idx], y_used.iloc[test_idx]
+    else:
         X_train, X_test, y_train, y_test = train_test_split(features, y_used, test_size=test_size, random_state=i)
 
-        if model_type in ["pls", "svr"]:
+        if model_type in SCALED_MODELS:
             scaler = StandardScaler()
             X_train_scaled = scaler.fit_transform(X_train)
             X_test_scaled = scaler.transform(X_test)
         else:
             X_train_scaled, X_test_scaled = X_train, X_test
 
-        if model_type == "pls":
-            model = PLSRegression(n_components=n_components)
-        elif model_type == "svr":
-            model = SVR(**(svr_params or {}))
-        elif model_type == "rf":
-            model = RandomForestRegressor(
-                n_estimators=n_estimators,
-                max_depth=max_depth,
-                random_state=i,
-                n_jobs=-1
-            )
-        else:
-            raise ValueError("Unsupported model type")
-
-        model.fit(X_train_scaled, y_train)
-        y_pred = model.predict(X_test_scaled)
-
-        r2 = r2_score(y_test, y_pred)
-        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-        pearson_r, _ = pearsonr(y_test, y_pred)
-        evs = explained_variance_score(y_test, y_pred)
-
-        metric_rows.append({
-            "Split": i,
-            "R2": r2,
-            "RMSE": rmse,
-            "Pearson_r": pearson_r,
-            "Pearson_r2": pearson_r ** 2,
-            "ExplainedVariance": evs
-        })
+    model = build_model(model_type, i, n_jobs=n_jobs, **(model_params or {}))
+
+    model.fit(X_train_scaled, y_train)
+    y_pred = model.predict(X_test_scaled)
 
+    r2 = r2_score(y_test, y_pred)
+    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+    pearson_r, _ = pearsonr(y_test, y_pred)
+    evs = explained_variance_score(y_test, y_pred)
+
+    metric_row = {
+        "Split": i,
+        "R2": r2,
+        "RMSE": rmse,
+        "Pearson_r": pearson_r,
+        "Pearson_r2": pearson_r ** 2,
+        "ExplainedVariance": evs
+    }
+
+    if perm_repeats == 0:
+        return metric_row, None
+    if perm_engine == "batched":
+        importances = batched_permutation_importance(
+            model, X_test_scaled, y_test, n_repeats=perm_repeats, random_state=i,
+            linear=model_type in LINEAR_MODELS
+        )
+    else:
         result = permutation_importance(model, X_test_scaled, y_test, n_repeats=perm_repeats, random_state=i)
         importances = result.importances_mean
-        feature_rows.append(dict(zip(["Split"] + feature_names, [i] + list(importances))))
+    feature_row = dict(zip(["Split"] + feature_names, [i] + list(importances)))
+
+    return metric_row, feature_row
+
+
+def available_cpus():
+    """Cores allocated to this job: $NCPUS under PBS, else the CPU affinity of the process."""
+    if os.environ.get("NCPUS"):
+        return max(1, int(os.environ["NCPUS"]))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _limit_worker_threads(n_threads):
+    # Each worker gets an equal share of the cores for BLAS/OpenMP
+    threadpool_limits(limits=n_threads)
+
+
+def run_splits(model_type, features, y, n_splits=100, workers=1,
+               split_cache=None, feature_set=None, **split_kwargs):
+    """
+    Run splits 1..n_splits, serially or on a pool of ``workers`` processes.
+    Results are returned in split order, so the output files match the serial run.
+    """
+    split_ids = list(range(1, n_splits + 1))
+    if split_cache is not None:
+        splits = [split_cache.get(feature_set, i, model_type in SCALED_MODELS) for i in split_ids]
+    else:
+        splits = [None] * n_splits
+
+    if workers <= 1:
+        return [
+            run_split(i, split, model_type=model_type, features=features, y=y, **split_kwargs)
+            for i, split in tqdm(zip(split_ids, splits), total=n_splits, desc=model_type.upper())
+        ]
+
+    # Split the cores between workers instead of letting every RF use all of them
+    threads_per_worker = max(1, available_cpus() // workers)
+    split_fn = partial(run_split, model_type=model_type, features=features, y=y,
+                       n_jobs=threads_per_worker, **split_kwargs)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_limit_worker_threads,
+                             initargs=(threads_per_worker,)) as executor:
+        return list(tqdm(executor.map(split_fn, split_ids, splits),
+                         total=n_splits, desc=model_type.upper()))
+
+
+def search_candidates(space, method="grid", n_candidates=20, seed=0):
+    """
+    Hyperparameter dicts to try: every combination of the values in ``space``, or for
+    the 'random' method ``n_candidates`` of them drawn without replacement.
+    """
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if method == "random" and n_candidates < len(grid):
+        picks = np.random.RandomState(seed).choice(len(grid), n_candidates, replace=False)
+        grid = [grid[k] for k in sorted(picks)]
+    return grid
+
+
+def halving_rungs(n_splits, min_splits=10, factor=3):
+    """Cumulative number of splits each surviving candidate has been scored on after each rung."""
+    rungs = []
+    n = max(1, min(min_splits, n_splits))
+    while n < n_splits:
+        rungs.append(n)
+        n *= factor
+    return rungs + [n_splits]
+
+
+_search_state = {}  # Model, data and splits shared by the search tasks of this process
+
+
+def _init_search_worker(n_threads, state):
+    _limit_worker_threads(n_threads)
+    _search_state.update(state)
+
+
+def _search_split(candidate, hyperparameters, i):
+    state = _search_state
+    metric_row, _ = run_split(
+        i, state["splits"][i], model_type=state["model_type"], features=state["features"], y=state["y"],
+        scrambled=state["scrambled"], model_params=model_params(hyperparameters), perm_repeats=0,
+        n_jobs=state["n_jobs"]
+    )
+    return candidate, metric_row
+
+
+def search_model(model_type, features, y, outdir, split_cache, feature_set, base_params, space,
+                 method="grid", n_candidates=20, seed=0, min_splits=10, factor=3,
+                 scrambled=False, n_splits=100, workers=1):
+    """
+    Successive-halving hyperparameter search on the splits of ``split_cache``.
+    Every candidate (``base_params`` updated with a point of ``space``) is scored on the
+    first rung's splits; only the best 1/``factor`` by mean SEARCH_METRIC are scored on
+    the next rung's additional splits, until one candidate is left or all ``n_splits``
+    are used. Candidate x split fits run on a pool of ``workers`` processes, without
+    permutation importances. Writes search_leaderboard.csv to ``outdir`` and returns
+    the winning hyperparameters.
+    """
+    if model_type == "pls" and "n_components" in space:
+        # PLS cannot extract more components than there are features
+        space = {**space, "n_components": [n for n in space["n_components"] if n <= features.shape[1]]}
+    candidates = [{**base_params, **values} for values in search_candidates(space, method, n_candidates, seed)]
+    if not candidates:
+        raise ValueError(f"No {model_type} candidates to search for {features.shape[1]} features")
+
+    rungs = halving_rungs(n_splits, min_splits, factor)
+    scaled = model_type in SCALED_MODELS
+    state = {
+        "model_type": model_type, "features": features, "y": y, "scrambled": scrambled,
+        "splits": {i: split_cache.get(feature_set, i, scaled) for i in range(1, n_splits + 1)},
+    }
+
+    if workers <= 1:
+        executor = None
+        _search_state.update(state, n_jobs=-1)
+    else:
+        # The shared data is sent once per worker, not once per task
+        threads_per_worker = max(1, available_cpus() // workers)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                                       initargs=(threads_per_worker, {**state, "n_jobs": threads_per_worker}))
+
+    metric_rows = {k: [] for k in range(len(candidates))}
+    reached = {}
+    alive = list(range(len(candidates)))
+    done = 0
+    try:
+        for rung, n_rung in enumerate(rungs, start=1):
+            tasks = [(k, candidates[k], i) for k in alive for i in range(done + 1, n_rung + 1)]
+            results = (executor.map if executor else map)(_search_split, *zip(*tasks))
+            for k, metric_row in tqdm(results, total=len(tasks), desc=f"{model_type.upper()} rung {rung}"):
+                metric_rows[k].append(metric_row)
+            done = n_rung
+
+            scores = {k: np.mean([row[SEARCH_METRIC] for row in metric_rows[k]]) for k in alive}
+            alive.sort(key=lambda k: -scores[k])
+            for k in alive:
+                reached[k] = rung
+            print(f"Rung {rung}: {len(alive)} candidates x {n_rung} splits, best mean {SEARCH_METRIC} {scores[alive[0]]:.4f}")
+            alive = alive[:math.ceil(len(alive) / factor)]
+            if len(alive) == 1:
+                break
+    finally:
+        if executor:
+            executor.shutdown()
+        _search_state.clear()
+
+    rows = []
+    for k, candidate in enumerate(candidates):
+        df_rows = pd.DataFrame(metric_rows[k])
+        rows.append({
+            "Candidate": k + 1,
+            **{name: candidate[name] for name in space},
+            "Rung": reached[k],
+            "Splits": len(df_rows),
+            f"Mean_{SEARCH_METRIC}": df_rows[SEARCH_METRIC].mean(),
+            f"Std_{SEARCH_METRIC}": df_rows[SEARCH_METRIC].std(),
+            "Mean_RMSE": df_rows["RMSE"].mean(),
+        })
+    leaderboard = pd.DataFrame(rows).sort_values(["Splits", f"Mean_{SEARCH_METRIC}"], ascending=False, kind="stable")
+    leaderboard.insert(0, "Rank", range(1, len(leaderboard) + 1))
+    leaderboard.to_csv(os.path.join(outdir, "search_leaderboard.csv"), index=False)
+
+    winner = candidates[alive[0]]
+    print(f"Best of {len(candidates)} candidates: " + ", ".join(f"{name}={winner[name]}" for name in space))
+    return winner
+
+
+def evaluate_model(model_type, features, y, outdir,
+                   scrambled=False, n_splits=100, test_size=0.5,
+                   n_estimators=100, max_depth=None,
+                   n_components=2, svr_params=None,
+                   perm_repeats=10, model_args_for_config=None, workers=1,
+                   split_cache=None, feature_set=None, perm_engine="batched"):
+
+    model_params = {
+        "n_estimators": n_estimators,
+        "max_depth": max_depth,
+        "n_components": n_components,
+        "svr_params": svr_params,
+    }
+    results = run_splits(
+        model_type, features, y, n_splits=n_splits, workers=workers,
+        split_cache=split_cache, feature_set=feature_set, scrambled=scrambled, test_size=test_size,
+        model_params=model_params, perm_repeats=perm_repeats, perm_engine=perm_engine
+    )
+    metric_rows = [metric_row for metric_row, _ in results]
+    count_items(splits=len(results))
+    feature_rows = [feature_row for _, feature_row in results]
 
     # Save metrics
     df_metrics = pd.DataFrame(metric_rows)
@@ -131,11 +504,100 @@ def evaluate_model(model_type, features, y, outdir,
     print(f"\nSaved all output files to: {outdir}")
 
 
+def model_config(args, model, features, scrambled, hyperparameters=None):
+    """Row of model_config.csv; ``hyperparameters`` (e.g. a search winner) override the CLI values."""
+    values = {**vars(args), **(hyperparameters or {})}
+    config = {
+        "model": model,
+        "features": features,
+        "scrambled": scrambled,
+        "splits": args.splits,
+        "test_size": args.test_size,
+        "n_components": values["n_components"] if model == "pls" else "NA",
+        "n_estimators": values["n_estimators"] if model == "rf" else "NA",
+        "max_depth": values["max_depth"] if model == "rf" else "NA",
+        "svr_C": values["svr_C"] if model == "svr" else "NA",
+        "svr_epsilon": values["svr_epsilon"] if model == "svr" else "NA",
+        "perm_repeats": args.perm_repeats
+    }
+    if args.search:
+        config["search"] = args.search
+    return config
+
+
+def search_space(args, model):
+    """Searched values for ``model``: its entry of the --search_space JSON file, or SEARCH_SPACES."""
+    spaces = SEARCH_SPACES
+    if args.search_space:
+        with open(args.search_space) as f:
+            spaces = {**SEARCH_SPACES, **json.load(f)}
+    unknown = set(spaces[model]) - set(HYPERPARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters in the {model} search space: {', '.join(sorted(unknown))}")
+    return spaces[model]
+
+
+def tune(args, model, features, scrambled, X, y, outdir, split_cache):
+    """The CLI hyperparameters, or the winner of a successive-halving search with --search."""
+    hyperparameters = {name: getattr(args, name) for name in HYPERPARAMETERS}
+    if not args.search:
+        return hyperparameters
+    return search_model(
+        model, X, y, outdir, split_cache, features, hyperparameters, search_space(args, model),
+        method=args.search, n_candidates=args.search_candidates, seed=args.search_seed,
+        min_splits=args.halving_min_splits, factor=args.halving_factor,
+        scrambled=scrambled, n_splits=args.splits, workers=args.workers
+    )
+
+
+def combination_name(model, features, scrambled):
+    """Output directory name used by generate_pbs_jobs.py, e.g. rf_2d_scrambled."""
+    return f"{model}_{features}" + ("_scrambled" if scrambled else "")
+
+
+def run_sweep(args, df, y, feature_sets):
+    """
+    Evaluate every model x feature set x scrambled combination in this process.
+    The data is read once and the split indices and scaled matrices are shared
+    through a SplitCache; each combination is written to <outdir>/<combination>.
+    """
+    split_cache = SplitCache(df, feature_sets, n_splits=args.splits, test_size=args.test_size)
+
+    for model in MODEL_TYPES:
+        for features in FEATURE_SETS:
+            for scrambled in SCRAMBLED_OPTIONS:
+                name = combination_name(model, features, scrambled)
+                outdir = os.path.join(args.outdir, name)
+                os.makedirs(outdir, exist_ok=True)
+                print(f"\n##### {name} #####")
+
+                X = df[feature_sets[features]]
+                hyperparameters = tune(args, model, features, scrambled, X, y, outdir, split_cache)
+                evaluate_model(
+                    model_type=model,
+                    features=X,
+                    y=y,
+                    outdir=outdir,
+                    scrambled=scrambled,
+                    n_splits=args.splits,
+                    test_size=args.test_size,
+                    **model_params(hyperparameters),
+                    perm_repeats=args.perm_repeats,
+                    model_args_for_config=model_config(args, model, features, scrambled, hyperparameters),
+                    workers=args.workers,
+                    split_cache=split_cache,
+                    feature_set=features,
+                    perm_engine=args.perm_engine
+                )
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", required=True, choices=["pls", "svr", "rf"])
-    parser.add_argument("--features", default="combined", choices=["2d", "3d", "combined"])
-    parser.add_argument("--csv", required=True)
+    parser.add_argument("--model", choices=MODEL_TYPES)
+    parser.add_argument("--features", default="combined", choices=FEATURE_SETS)
+    data_source = parser.add_mutually_exclusive_group(required=True)
+    data_source.add_argument("--csv", help="Model matrix CSV (e.g. model_data.csv).")
+    data_source.add_argument("--store", help="Feature store directory (feature_store.py) to load instead of a CSV.")
     parser.add_argument("--outdir", required=True)
     parser.add_argument("--scrambled", action="store_true")
     parser.add_argument("--splits", type=int, default=100)
@@ -146,43 +608,61 @@ if __name__ == "__main__":
     parser.add_argument("--svr_C", type=float, default=1.0)
     parser.add_argument("--svr_epsilon", type=float, default=0.1)
     parser.add_argument("--perm_repeats", type=int, default=10)
+    parser.add_argument("--perm_engine", default="batched", choices=PERM_ENGINES,
+                        help="Permutation importance implementation (default: batched; sklearn for reference).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes running splits concurrently (default: 1, serial).")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Run every model/feature set/scrambled combination into <outdir>/<model>_<features>[_scrambled].")
+    parser.add_argument("--search", choices=SEARCH_METHODS,
+                        help="Tune the hyperparameters by successive halving over a grid or random sample of the search space.")
+    parser.add_argument("--search_space",
+                        help="JSON file of {model: {option: [values]}} replacing the built-in search space of those models.")
+    parser.add_argument("--search_candidates", type=int, default=20,
+                        help="Candidates drawn by --search random (default: 20).")
+    parser.add_argument("--search_seed", type=int, default=0, help="Seed of --search random (default: 0).")
+    parser.add_argument("--halving_min_splits", type=int, default=10,
+                        help="Splits every candidate is scored on in the first rung (default: 10).")
+    parser.add_argument("--halving_factor", type=int, default=3,
+                        help="Each rung keeps 1/factor of the candidates and uses factor times the splits (default: 3).")
     args = parser.parse_args()
 
+    if not args.sweep and args.model is None:
+        parser.error("--model is required unless --sweep is given")
+    if args.halving_factor < 2:
+        parser.error("--halving_factor must be at least 2")
+
     outdir = args.outdir
     os.makedirs(outdir, exist_ok=True)
 
-    df, y, feature_sets = load_data(args.csv)
-    X = df[feature_sets[args.features]]
+    df, y, feature_sets = load_store(args.store) if args.store else load_data(args.csv)
 
-    svr_params = {"kernel": "rbf", "C": args.svr_C, "epsilon": args.svr_epsilon}
+    if args.sweep:
+        run_sweep(args, df, y, feature_sets)
+    else:
+        X = df[feature_sets[args.features]]
+        split_cache = None
+        if args.search:
+            # The candidates and the winner share one set of splits
+            split_cache = SplitCache(df, {args.features: feature_sets[args.features]},
+                                     n_splits=args.splits, test_size=args.test_size)
+        hyperparameters = tune(args, args.model, args.features, args.scrambled, X, y, outdir, split_cache)
+        model_args_for_config = model_config(args, args.model, args.features, args.scrambled, hyperparameters)
 
-    model_args_for_config = {
-        "model": args.model,
-        "features": args.features,
-        "scrambled": args.scrambled,
-        "splits": args.splits,
-        "test_size": args.test_size,
-        "n_components": args.n_components if args.model == "pls" else "NA",
-        "n_estimators": args.n_estimators if args.model == "rf" else "NA",
-        "max_depth": args.max_depth if args.model == "rf" else "NA",
-        "svr_C": args.svr_C if args.model == "svr" else "NA",
-        "svr_epsilon": args.svr_epsilon if args.model == "svr" else "NA",
-        "perm_repeats": args.perm_repeats
-    }
-
-    evaluate_model(
-        model_type=args.model,
-        features=X,
-        y=y,
-        outdir=outdir,
-        scrambled=args.scrambled,
-        n_splits=args.splits,
-        test_size=args.test_size,
-        n_estimators=args.n_estimators,
-        max_depth=args.max_depth,
-        n_components=args.n_components,
-        svr_params=svr_params,
-        perm_repeats=args.perm_repeats,
-        model_args_for_config=model_args_for_config
-    )
+        evaluate_model(
+            model_type=args.model,
+            features=X,
+            y=y,
+            outdir=outdir,
+            scrambled=args.scrambled,
+            n_splits=args.splits,
+            test_size=args.test_size,
+            **model_params(hyperparameters),
+            perm_repeats=args.perm_repeats,
+            model_args_for_config=model_args_for_config,
+            workers=args.workers,
+            split_cache=split_cache,
+            feature_set=args.features,
+            perm_engine=args.perm_engine
+        )
 
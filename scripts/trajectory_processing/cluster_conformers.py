@@ -0,0 +1,169 @@
+import os
+import csv
+import argparse
+import numpy as np
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.ensemble import ConformerEnsemble
+from pipeline.telemetry import count_items
+
+
+def read_sdf_coordinates(sdf_file):
+    """
+    Read the V2000 atom blocks of a multi-conformer SDF of a single molecule.
+    Returns (coordinates of shape (n_frames, n_atoms, 3), element symbols).
+    """
+    frames = []
+    elements = None
+    with open(sdf_file, "r") as f:
+        while True:
+            header = [f.readline() for _ in range(4)]
+            if not header[0]:
+                break
+            n_atoms = int(header[3][:3])
+            atom_lines = [f.readline() for _ in range(n_atoms)]
+            frames.append([[float(line[0:10]), float(line[10:20]), float(line[20:30])] for line in atom_lines])
+            if elements is None:
+                elements = [line[31:34].strip() for line in atom_lines]
+            elif len(atom_lines) != len(elements):
+                raise ValueError(f"{sdf_file}: record {len(frames)} has {n_atoms} atoms, expected {len(elements)}")
+
+            # Skip bonds, properties and the record terminator
+            for line in f:
+                if line.startswith("$$$$"):
+                    break
+    return np.array(frames, dtype=np.float64), elements
+
+
+def open_ensemble(path):
+    """Conformer ensemble of pipeline/ensemble.py, or None if ``path`` is not one."""
+    if not os.path.exists(os.path.join(path, "ensemble.json")):
+        return None
+    return ConformerEnsemble(path)
+
+
+def kabsch_rmsd(reference, frames):
+    """
+    Minimum RMSD after optimal superposition between one centered reference (n_atoms, 3)
+    and a stack of centered frames (n_frames, n_atoms, 3), computed for all frames at once.
+    """
+    n_atoms = reference.shape[0]
+    covariance = np.einsum("kni,nj->kij", frames, reference)
+    u, s, vt = np.linalg.svd(covariance)
+    # Reflection correction: flip the smallest singular value when det(U V^T) < 0
+    s[:, -1] *= np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    msd = ((frames ** 2).sum(axis=(1, 2)) + (reference ** 2).sum() - 2 * s.sum(axis=1)) / n_atoms
+    return np.sqrt(np.clip(msd, 0, None))
+
+
+def cluster_frames(coordinates, cutoff):
+    """
+    Leader clustering: each frame joins the closest existing representative within
+    ``cutoff`` Angstrom, otherwise it becomes a new representative.
+    Returns (representative frame indices, cluster label of every frame).
+    """
+    centered = coordinates - coordinates.mean(axis=1, keepdims=True)
+    n_frames = len(centered)
+
+    representatives = []
+    labels = np.empty(n_frames, dtype=int)
+    rep_coords = np.empty_like(centered)
+    for i in range(n_frames):
+        if representatives:
+            rmsd = kabsch_rmsd(centered[i], rep_coords[:len(representatives)])
+            nearest = int(np.argmin(rmsd))
+            if rmsd[nearest] <= cutoff:
+                labels[i] = nearest
+                continue
+        labels[i] = len(representatives)
+        rep_coords[len(representatives)] = centered[i]
+        representatives.append(i)
+    return representatives, labels
+
+
+def cluster_log_weights(frame_log_weights, labels, n_clusters):
+    """
+    Log of the summed frame weights of each cluster (log-sum-exp over its members), the
+    unbiased weight of the cluster when the frames carry metadynamics log-weights.
+    """
+    frame_log_weights = np.asarray(frame_log_weights, dtype=np.float64)
+    peak = np.full(n_clusters, -np.inf)
+    np.maximum.at(peak, labels, frame_log_weights)
+    sums = np.zeros(n_clusters)
+    np.add.at(sums, labels, np.exp(frame_log_weights - peak[labels]))
+    return peak + np.log(sums)
+
+
+def write_representatives(sdf_file, output_sdf, representatives, populations):
+    """Copy the representative records verbatim, tagging each with its cluster population."""
+    selected = dict(zip(representatives, populations))
+    record = 0
+    keep = record in selected
+    with open(sdf_file, "r") as f, open(output_sdf, "w") as out:
+        for line in f:
+            if line.startswith("$$$$"):
+                if keep:
+                    out.write(f">  <Cluster_Population>\n{selected[record]}\n\n")
+                    out.write(line)
+                record += 1
+                keep = record in selected
+            elif keep:
+                out.write(line)
+
+
+def write_ensemble_representatives(ensemble, output_sdf, representatives, populations):
+    """Write the representative conformers of an ensemble as SDF, tagged with their cluster populations."""
+    with open(output_sdf, "w") as out:
+        for frame, population in zip(representatives, populations):
+            record = ensemble.records(frame, frame + 1)[0]
+            out.write(record[:-len("$$$$\n")] + f">  <Cluster_Population>\n{population}\n\n$$$$\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster trajectory frames by heavy-atom RMSD and keep one representative per cluster.")
+    parser.add_argument("-i", "--input", default="output.sdf", help="Multi-frame SDF or conformer ensemble (output.ens) from trajectory processing (default: output.sdf).")
+    parser.add_argument("-o", "--output", default="output_clustered.sdf", help="SDF of cluster representatives (default: output_clustered.sdf).")
+    parser.add_argument("-p", "--populations", default="cluster_populations.csv", help="CSV of cluster populations (default: cluster_populations.csv).")
+    parser.add_argument("-r", "--rmsd", type=float, default=1.0, help="RMSD cutoff in Angstrom (default: 1.0).")
+    parser.add_argument("-f", "--frame_weights", default=None, help="Optional metadynamics frame weights CSV (hills_reweight.py); adds each cluster's summed Log_Weight to the populations.")
+    args = parser.parse_args()
+
+    # An ensemble is memory-mapped instead of parsed
+    ensemble = open_ensemble(args.input)
+    if ensemble is not None:
+        coordinates = ensemble.positions()
+        elements = [line[31:34].strip() for line in ensemble.molblock.splitlines()[4:4 + ensemble.n_atoms]]
+    else:
+        coordinates, elements = read_sdf_coordinates(args.input)
+    heavy = np.array([element != "H" for element in elements])
+    count_items(frames=coordinates.shape[0])
+    print(f"Loaded {coordinates.shape[0]} frames with {heavy.sum()} heavy atoms from {args.input}")
+
+    representatives, labels = cluster_frames(coordinates[:, heavy], args.rmsd)
+    populations = np.bincount(labels, minlength=len(representatives))
+
+    log_weights = None
+    if args.frame_weights:
+        with open(args.frame_weights, newline="") as f:
+            frame_log_weights = [float(row["Log_Weight"]) for row in csv.DictReader(f)]
+        if len(frame_log_weights) != len(labels):
+            raise ValueError(f"{args.frame_weights} has {len(frame_log_weights)} frame weights but {args.input} has {len(labels)} frames")
+        log_weights = cluster_log_weights(frame_log_weights, labels, len(representatives))
+
+    if ensemble is not None:
+        write_ensemble_representatives(ensemble, args.output, representatives, populations)
+    else:
+        write_representatives(args.input, args.output, representatives, populations)
+
+    # Row k describes the k-th conformer of the reduced SDF
+    with open(args.populations, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Conformation_ID", "Frame", "Population"] + (["Log_Weight"] if log_weights is not None else []))
+        for k, (frame, population) in enumerate(zip(representatives, populations), start=1):
+            writer.writerow([k, frame + 1, population] + ([repr(float(log_weights[k - 1]))] if log_weights is not None else []))
+
+    print(f"{len(representatives)} clusters at {args.rmsd} Å RMSD. Representatives saved to {args.output}, populations to {args.populations}")
+
+
+if __name__ == "__main__":
+    main()
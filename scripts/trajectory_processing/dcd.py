@@ -0,0 +1,253 @@
+"""
+Memory-mapped reader for CHARMM-format DCD trajectories (as written by cpptraj and pmemd).
+
+Layout (all records are Fortran unformatted, i.e. framed by int32 byte counts):
+
+    [84]  'CORD' + 20 int32 control words (NSET, ISTART, NSAVC, ..., unit-cell flag, CHARMM version)  [84]
+    [len] int32 NTITLE + NTITLE * 80 title bytes                                                    [len]
+    [4]   int32 NATOM                                                                               [4]
+    per frame:
+      [48]    6 float64 unit cell (A, gamma, B, beta, alpha, C)        -- only if the unit-cell flag is set
+      [4N]    N float32 X  [4N]
+      [4N]    N float32 Y  [4N]
+      [4N]    N float32 Z  [4N]
+
+Every frame has the same size, so coordinates can be viewed in place through a
+strided NumPy array and only the pages holding the requested atoms are read.
+For the same reason, frame ranges can be sliced, strided and concatenated by
+copying byte ranges. Only the frame-count fields of the header are patched, so
+the solvated trajectories are never decoded:
+
+    python dcd.py info md.dcd
+    python dcd.py slice md.dcd -s 0 -e 2500 -o md_part1.dcd
+    python dcd.py slice md.dcd --stride 10 -o md_every10.dcd
+    python dcd.py split md.dcd -n 2 -o "md_part{}.dcd"
+    python dcd.py concat md_part1.dcd md_part2.dcd -o md.dcd
+
+Frame indices are 0-based and stop frames are exclusive.
+"""
+import os
+import argparse
+import numpy as np
+
+CONTROL_WORDS = 20
+HEADER_MAGIC = b"CORD"
+UNIT_CELL_BYTES = 6 * 8
+NSET, ISTART, NSAVC, NSTEP = 0, 1, 2, 3  # Control words describing the saved frames
+COPY_BLOCK_BYTES = 1 << 26  # Bytes handed to one write() call
+
+
+class DCDFile:
+    """
+    Read-only view of a DCD file.
+    ``n_frames`` is derived from the file size, which stays correct even when the
+    NSET field of an interrupted run was never updated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r")
+        self._parse_header()
+
+    def _parse_header(self):
+        first = bytes(self._mm[:4])
+        if int.from_bytes(first, "little") == 84:
+            self.endian = "<"
+        elif int.from_bytes(first, "big") == 84:
+            self.endian = ">"
+        else:
+            raise ValueError(f"{self.path} is not a DCD file (bad first record marker)")
+
+        if bytes(self._mm[4:8]) != HEADER_MAGIC:
+            raise ValueError(f"{self.path} is not a DCD file (missing 'CORD' tag)")
+
+        int32 = np.dtype(self.endian + "i4")
+        self.control = np.frombuffer(self._mm, dtype=int32, count=CONTROL_WORDS, offset=8).copy()
+        if self.control[8] != 0:
+            raise NotImplementedError(f"{self.path} has fixed atoms, which are not supported")
+        if self.control[19] == 0:
+            raise NotImplementedError(f"{self.path} is an X-PLOR DCD; only CHARMM-format files are supported")
+
+        self.has_unit_cell = bool(self.control[10])
+        self.has_4d = bool(self.control[11])
+        if self.has_4d:
+            raise NotImplementedError(f"{self.path} stores 4D coordinates, which are not supported")
+
+        # Title record
+        offset = 8 + 4 * CONTROL_WORDS + 4
+        title_len = int(np.frombuffer(self._mm, dtype=int32, count=1, offset=offset)[0])
+        offset += 4 + title_len + 4
+
+        # Atom count record
+        self.n_atoms = int(np.frombuffer(self._mm, dtype=int32, count=1, offset=offset + 4)[0])
+        self.header_size = offset + 12
+
+        self.float32 = np.dtype(self.endian + "f4")
+        self.float64 = np.dtype(self.endian + "f8")
+        self.axis_size = 4 * self.n_atoms + 8
+        self.cell_size = UNIT_CELL_BYTES + 8 if self.has_unit_cell else 0
+        self.frame_size = self.cell_size + 3 * self.axis_size
+
+        data_bytes = os.path.getsize(self.path) - self.header_size
+        self.n_frames = data_bytes // self.frame_size
+        if data_bytes % self.frame_size:
+            print(f"⚠️  {self.path}: ignoring {data_bytes % self.frame_size} bytes of a truncated last frame")
+
+    @property
+    def header_n_frames(self):
+        """Frame count stored in the NSET header field."""
+        return int(self.control[0])
+
+    def frame_offset(self, frame):
+        """Byte offset of the start of ``frame`` (0-based)."""
+        return self.header_size + frame * self.frame_size
+
+    def header(self, n_frames, first=0, stride=1):
+        """
+        Header bytes for ``n_frames`` frames of this file, taken from ``first`` every
+        ``stride`` frames: NSET, ISTART, NSAVC and NSTEP are patched, the rest is copied.
+        """
+        control = self.control.copy()
+        control[ISTART] += first * control[NSAVC]
+        control[NSAVC] *= stride
+        if control[NSTEP]:
+            control[NSTEP] = n_frames * control[NSAVC]
+        control[NSET] = n_frames
+
+        header = bytearray(self._mm[:self.header_size])
+        header[8:8 + 4 * CONTROL_WORDS] = control.astype(self.endian + "i4").tobytes()
+        return bytes(header)
+
+    def copy_frames(self, output, start, stop):
+        """Write the bytes of frames [start, stop) to the open binary file ``output``."""
+        end = self.frame_offset(stop)
+        for begin in range(self.frame_offset(start), end, COPY_BLOCK_BYTES):
+            output.write(self._mm[begin:min(begin + COPY_BLOCK_BYTES, end)])
+
+    def same_layout(self, other):
+        return (self.endian, self.n_atoms, self.has_unit_cell, self.frame_size) == \
+            (other.endian, other.n_atoms, other.has_unit_cell, other.frame_size)
+
+    def coordinates(self, atom_indices=None, start=0, stop=None):
+        """
+        Coordinates of frames [start, stop) as a float32 array of shape (n_frames, n_atoms, 3).
+        With ``atom_indices`` only those atoms are copied out of the file.
+        """
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        view = np.ndarray(
+            shape=(self.n_frames, 3, self.n_atoms),
+            dtype=self.float32,
+            buffer=self._mm,
+            offset=self.header_size + self.cell_size + 4,
+            strides=(self.frame_size, self.axis_size, 4),
+        )[start:stop]
+        if atom_indices is not None:
+            view = view[:, :, atom_indices]
+        return np.ascontiguousarray(view.transpose(0, 2, 1), dtype=np.float32)
+
+    def unit_cells(self, start=0, stop=None):
+        """Unit cells of frames [start, stop) as (A, gamma, B, beta, alpha, C) rows."""
+        if not self.has_unit_cell:
+            raise ValueError(f"{self.path} has no unit cell information")
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        view = np.ndarray(
+            shape=(self.n_frames, 6),
+            dtype=self.float64,
+            buffer=self._mm,
+            offset=self.header_size + 4,
+            strides=(self.frame_size, 8),
+        )[start:stop]
+        return np.array(view, dtype=np.float64)
+
+    def box_lengths(self, start=0, stop=None):
+        """Box edge lengths (A, B, C) of frames [start, stop)."""
+        return self.unit_cells(start, stop)[:, [0, 2, 5]]
+
+
+def write_dcd(output, selections):
+    """
+    Write frames of one or more DCD files to ``output`` by copying their bytes.
+    ``selections`` are (DCDFile, start, stop, stride) tuples, written in order; the
+    header is the first file's with the frame-count fields patched. The file is
+    written next to ``output`` and moved into place, so an input may be overwritten.
+    Returns the number of frames written.
+    """
+    first = selections[0][0]
+    for dcd, *_ in selections[1:]:
+        if not first.same_layout(dcd):
+            raise ValueError(f"{dcd.path} does not match {first.path} (atoms, unit cell or byte order)")
+
+    frames = [(dcd, range(*slice(start, stop, stride).indices(dcd.n_frames))) for dcd, start, stop, stride in selections]
+    n_frames = sum(len(selected) for _, selected in frames)
+    first_frames = frames[0][1]
+
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(first.header(n_frames, first_frames.start if len(first_frames) else 0, first_frames.step))
+        for dcd, selected in frames:
+            if selected.step == 1:
+                # One contiguous byte range
+                if len(selected):
+                    dcd.copy_frames(f, selected.start, selected.stop)
+            else:
+                for frame in selected:
+                    dcd.copy_frames(f, frame, frame + 1)
+    os.replace(tmp, output)
+    return n_frames
+
+
+def split_ranges(n_frames, n_parts):
+    """(start, stop) ranges of ``n_parts`` consecutive parts of nearly equal size."""
+    bounds = [round(k * n_frames / n_parts) for k in range(n_parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, slice, split and concatenate DCD trajectories by copying frame bytes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info = subparsers.add_parser("info", help="Print the frame and atom counts.")
+    info.add_argument("dcd_files", nargs="+")
+
+    slice_cmd = subparsers.add_parser("slice", help="Copy frames [start, stop) every stride frames to a new file.")
+    slice_cmd.add_argument("dcd_file")
+    slice_cmd.add_argument("-s", "--start", type=int, default=0, help="First frame, 0-based (default: 0).")
+    slice_cmd.add_argument("-e", "--stop", type=int, default=None, help="Stop frame, exclusive (default: end of file).")
+    slice_cmd.add_argument("--stride", type=int, default=1, help="Keep every stride-th frame (default: 1).")
+    slice_cmd.add_argument("-o", "--output", required=True, help="Output DCD file.")
+
+    split = subparsers.add_parser("split", help="Split into consecutive parts of nearly equal size.")
+    split.add_argument("dcd_file")
+    split.add_argument("-n", "--parts", type=int, default=2, help="Number of parts (default: 2).")
+    split.add_argument("-o", "--output", required=True, help="Output pattern with {} for the part number from 1, e.g. md_part{}.dcd.")
+
+    concat = subparsers.add_parser("concat", help="Concatenate files with the same atoms into one.")
+    concat.add_argument("dcd_files", nargs="+")
+    concat.add_argument("-o", "--output", required=True, help="Output DCD file (may be one of the inputs).")
+
+    args = parser.parse_args()
+
+    if args.command == "info":
+        for path in args.dcd_files:
+            dcd = DCDFile(path)
+            stale = f" (header says {dcd.header_n_frames})" if dcd.header_n_frames != dcd.n_frames else ""
+            print(f"{path}: {dcd.n_frames} frames{stale}, {dcd.n_atoms} atoms, "
+                  f"{'with' if dcd.has_unit_cell else 'no'} unit cell, ISTART {dcd.control[ISTART]}, NSAVC {dcd.control[NSAVC]}")
+    elif args.command == "slice":
+        if args.stride < 1:
+            parser.error("--stride must be positive")
+        n = write_dcd(args.output, [(DCDFile(args.dcd_file), args.start, args.stop, args.stride)])
+        print(f"{n} frames of {args.dcd_file} saved to {args.output}")
+    elif args.command == "split":
+        dcd = DCDFile(args.dcd_file)
+        for k, (start, stop) in enumerate(split_ranges(dcd.n_frames, args.parts), start=1):
+            path = args.output.format(k)
+            write_dcd(path, [(dcd, start, stop, 1)])
+            print(f"Frames {start + 1}-{stop} of {args.dcd_file} saved to {path}")
+    else:
+        n = write_dcd(args.output, [(DCDFile(path), 0, None, 1) for path in args.dcd_files])
+        print(f"{n} frames of {len(args.dcd_files)} files saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
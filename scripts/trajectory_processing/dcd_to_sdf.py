@@ -0,0 +1,186 @@
+import os
+import re
+import argparse
+import contextlib
+from collections import deque
+import numpy as np
+from rdkit import Chem
+
+from dcd import DCDFile
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.ensemble import EnsembleWriter
+from pipeline.telemetry import count_items
+
+FRAMES_PER_BLOCK = 1000  # Frames read from the memory map at a time
+
+
+def read_prmtop_sections(prmtop_file, flags):
+    """
+    Read the requested %FLAG sections of an AMBER prmtop file.
+    Returns {flag: list of string fields}, split by the widths in each %FORMAT line.
+    """
+    sections = {}
+    current = None
+    width = None
+    with open(prmtop_file, "r") as f:
+        for line in f:
+            if line.startswith("%FLAG"):
+                name = line.split()[1]
+                current = name if name in flags else None
+                if current:
+                    sections[current] = []
+            elif line.startswith("%FORMAT") and current:
+                # e.g. %FORMAT(20a4), %FORMAT(10I8), %FORMAT(5E16.8)
+                width = int(re.search(r"\(\d*[a-zA-Z](\d+)", line).group(1))
+            elif current and not line.startswith("%"):
+                text = line.rstrip("\n")
+                sections[current] += [text[k:k + width].strip() for k in range(0, len(text), width)]
+    return sections
+
+
+def solute_atoms(prmtop_file, resname):
+    """Indices and masses of the atoms in residues named ``resname``."""
+    sections = read_prmtop_sections(prmtop_file, {"POINTERS", "MASS", "RESIDUE_LABEL", "RESIDUE_POINTER"})
+    n_atoms = int(sections["POINTERS"][0])
+    masses = np.array(sections["MASS"], dtype=float)
+    pointers = [int(p) - 1 for p in sections["RESIDUE_POINTER"]] + [n_atoms]
+
+    indices = []
+    for k, label in enumerate(sections["RESIDUE_LABEL"]):
+        if label == resname:
+            indices.extend(range(pointers[k], pointers[k + 1]))
+    if not indices:
+        raise ValueError(f"No residue named '{resname}' in {prmtop_file}")
+    return n_atoms, np.array(indices), masses[indices]
+
+
+def load_template(pdb_file, resname, n_solute):
+    """
+    Build the solute topology once from the PDB (bond perception happens here only)
+    and return the molecule with its MolBlock lines.
+    """
+    lines = [
+        line for line in open(pdb_file, "r")
+        if line.startswith(("ATOM", "HETATM")) and line[17:20].strip() == resname
+    ]
+    mol = Chem.MolFromPDBBlock("".join(lines), removeHs=False)
+    if mol is None:
+        raise ValueError(f"RDKit could not read the '{resname}' residue of {pdb_file}")
+    if mol.GetNumAtoms() != n_solute:
+        raise ValueError(f"{pdb_file} has {mol.GetNumAtoms()} '{resname}' atoms but the prmtop has {n_solute}")
+    return mol, Chem.MolToMolBlock(mol).splitlines(keepends=True)
+
+
+def bond_tree(mol):
+    """
+    Breadth-first (child, parent) pairs covering every atom; the roots of
+    disconnected fragments are paired with atom 0.
+    """
+    edges = []
+    seen = set()
+    for root in range(mol.GetNumAtoms()):
+        if root in seen:
+            continue
+        if root != 0:
+            edges.append((root, 0))
+        seen.add(root)
+        queue = deque([root])
+        while queue:
+            atom = mol.GetAtomWithIdx(queue.popleft())
+            for neighbor in atom.GetNeighbors():
+                idx = neighbor.GetIdx()
+                if idx not in seen:
+                    seen.add(idx)
+                    edges.append((idx, atom.GetIdx()))
+                    queue.append(idx)
+    return edges
+
+
+def check_orthorhombic(cells, path):
+    # DCD angles are stored either in degrees or as cosines
+    angles = cells[:, [1, 3, 4]]
+    cosines = np.where(np.abs(angles) <= 1.0, angles, np.cos(np.radians(angles)))
+    if np.abs(cosines).max() > 1e-4:
+        raise NotImplementedError(f"{path} has a non-orthorhombic box; use the cpptraj extractor instead")
+
+
+def image_and_center(xyz, boxes, masses, edges):
+    """
+    Make the solute whole across periodic boundaries and move its center of mass to
+    the origin (cpptraj: center :MOL mass origin; image origin center).
+    xyz is (n_frames, n_atoms, 3) and boxes (n_frames, 3), or None without periodicity;
+    xyz is modified in place.
+    """
+    if boxes is not None:
+        # Walk the bond tree so every atom takes the periodic image closest to its parent
+        for child, parent in edges:
+            d = xyz[:, child] - xyz[:, parent]
+            xyz[:, child] = xyz[:, parent] + d - boxes * np.round(d / boxes)
+
+    com = (xyz * masses[np.newaxis, :, np.newaxis]).sum(axis=1) / masses.sum()
+    xyz -= com[:, np.newaxis, :]
+    return xyz
+
+
+def write_frames(output, template_lines, xyz):
+    """Write frames by substituting coordinates into the template MolBlock atom lines."""
+    n_atoms = xyz.shape[1]
+    head = "".join(template_lines[:4])
+    atom_tails = [line[30:] for line in template_lines[4:4 + n_atoms]]
+    tail = "".join(template_lines[4 + n_atoms:]) + "$$$$\n"
+    for frame in xyz:
+        atom_block = "".join(
+            f"{x:10.4f}{y:10.4f}{z:10.4f}{rest}" for (x, y, z), rest in zip(frame.tolist(), atom_tails)
+        )
+        output.write(head + atom_block + tail)
+
+
+def extract_sdf(prmtop_file, pdb_file, dcd_files, output_sdf, resname="MOL", output_ensemble=None):
+    n_atoms, indices, masses = solute_atoms(prmtop_file, resname)
+    mol, template_lines = load_template(pdb_file, resname, len(indices))
+    edges = bond_tree(mol)
+    title = template_lines[0].rstrip("\n")
+
+    n_frames = 0
+    # The optional conformer ensemble gets the same frames in the same pass
+    ensemble = EnsembleWriter(output_ensemble, "".join(template_lines)) if output_ensemble else contextlib.nullcontext()
+    with open(output_sdf, "w") as output, ensemble:
+        for path in dcd_files:
+            dcd = DCDFile(path)
+            if dcd.n_atoms != n_atoms:
+                raise ValueError(f"{path} has {dcd.n_atoms} atoms but {prmtop_file} has {n_atoms}")
+
+            for start in range(0, dcd.n_frames, FRAMES_PER_BLOCK):
+                stop = start + FRAMES_PER_BLOCK
+                xyz = dcd.coordinates(indices, start, stop).astype(np.float64)
+                if dcd.has_unit_cell:
+                    cells = dcd.unit_cells(start, stop)
+                    check_orthorhombic(cells, path)
+                    image_and_center(xyz, cells[:, [0, 2, 5]], masses, edges)
+                else:
+                    image_and_center(xyz, None, masses, edges)
+                write_frames(output, template_lines, xyz)
+                if output_ensemble:
+                    # Rounded as in the SDF atom lines, so both outputs hold the same coordinates
+                    ensemble.append(np.round(xyz, 4), [title] * len(xyz))
+                n_frames += len(xyz)
+
+            print(f"Read {dcd.n_frames} frames from {path}")
+
+    count_items(frames=n_frames)
+    print(f"Total configurations found: {n_frames}")
+    print(f"All configurations processed. Output written to {output_sdf}" + (f" and {output_ensemble}" if output_ensemble else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract solute frames from DCD trajectories directly to SDF.")
+    parser.add_argument("-p", "--prmtop", default="mol.prmtop", help="Topology of the solvated system (default: mol.prmtop).")
+    parser.add_argument("-r", "--pdb", default="mol.pdb", help="PDB of the solvated system, used for the bond template (default: mol.pdb).")
+    parser.add_argument("-y", "--dcd", nargs="+", required=True, help="DCD trajectories, concatenated in the given order.")
+    parser.add_argument("-o", "--output", default="output.sdf", help="Output SDF file (default: output.sdf).")
+    parser.add_argument("-e", "--ensemble", default=None, help="Also write the frames as a memory-mapped conformer ensemble (e.g. output.ens).")
+    parser.add_argument("--resname", default="MOL", help="Residue name of the solute (default: MOL).")
+    args = parser.parse_args()
+
+    extract_sdf(args.prmtop, args.pdb, args.dcd, args.output, resname=args.resname, output_ensemble=args.ensemble)
@@ -19,8 +19,10 @@ cp "${META_DIR}/system_2.prmtop" mol.prmtop
 # Fix residue name
 sed -i 's/UNK/MOL/g' mol.*
 
-# Dynamically write amber_script.in
-cat > amber_script.in <<EOF
+# EXTRACTOR=cpptraj keeps the original cpptraj -> frames.pdb -> RDKit route
+if [[ "${EXTRACTOR:-python}" == "cpptraj" ]]; then
+    # Dynamically write amber_script.in
+    cat > amber_script.in <<EOF
 parm mol.prmtop
 trajin ${META_DIR}/eq_1/md.dcd
 trajin ${META_DIR}/eq_2/md.dcd
@@ -31,14 +33,30 @@ strip !:MOL
 trajout frames.pdb pdb
 EOF
 
-# Run cpptraj
-cpptraj amber_script.in > amber_script.log
-
-# Convert to SDF
-python frames_to_sdf.py
+    # Run cpptraj; no conformer ensemble is written on this route
+    rm -rf output.ens
+    cpptraj amber_script.in > amber_script.log
+
+    # Convert to SDF
+    python frames_to_sdf.py
+else
+    # Read the solute straight from the memory-mapped DCDs and write SDF frames from one topology template;
+    # output.ens holds the same frames as a memory-mapped conformer ensemble (pipeline/ensemble.py)
+    python dcd_to_sdf.py -p mol.prmtop -r mol.pdb -y "${META_DIR}/eq_1/md.dcd" "${META_DIR}/eq_2/md.dcd" -o output.sdf -e output.ens --resname MOL
+fi
+
+# Unbiased frame weights from the metadynamics hills (REWEIGHT=ct, final or none; see hills_reweight.py)
+REWEIGHT="${REWEIGHT:-ct}"
+rm -f frame_weights.csv
+if [[ "$REWEIGHT" != "none" && -f "${META_DIR}/eq_1/HILLS" ]]; then
+    FRAMES=output.sdf
+    if [ -d output.ens ]; then
+        FRAMES=output.ens
+    fi
+    python hills_reweight.py --hills "${META_DIR}/eq_1/HILLS" -f "$FRAMES" -m "$REWEIGHT" -o frame_weights.csv
+fi
 
 # Clean up
 rm -f mol.pdb mol.prmtop frames.pdb amber_script.in
 
 echo "✅ output.sdf created in $(pwd)"
-
@@ -1,39 +1,110 @@
+import io
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from rdkit import Chem
 
-def process_pdb_frames(pdb_file, output_sdf):
-    with open(pdb_file, 'r') as file:
-        lines = file.readlines()
-    
-    frames = []
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
+FRAMES_PER_TASK = 64  # Frames converted per worker task
+TASKS_PER_WORKER = 4  # Converted batches held in memory per worker before writing
+
+
+def iter_pdb_frames(pdb_file):
+    """
+    Yield the frames of a multi-frame PDB one at a time as PDB blocks.
+    Only the frame being read is held in memory.
+    """
     current_frame = []
-    
-    for line in lines:
-        if line.startswith("END") or line.startswith("ENDMDL"):  # Marks end of a frame
-            if current_frame:
-                frames.append(current_frame)
-                current_frame = []
-        else:
-            current_frame.append(line)
-    
+    with open(pdb_file, 'r') as file:
+        for line in file:
+            if line.startswith("END") or line.startswith("ENDMDL"):  # Marks end of a frame
+                if current_frame:
+                    yield "".join(current_frame)
+                    current_frame = []
+            else:
+                current_frame.append(line)
+
     # Catch last frame if no END is present
     if current_frame:
-        frames.append(current_frame)
-    
-    print(f"Total configurations found: {len(frames)}")
-    
-    # Write each frame to an SDF
-    writer = Chem.SDWriter(output_sdf)
-    for i, frame in enumerate(frames):
-        pdb_string = "".join(frame)
+        yield "".join(current_frame)
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def convert_frames(pdb_blocks):
+    """
+    Convert a batch of PDB blocks to SDF text.
+    Returns the SDF records and the positions in the batch of frames RDKit could not read.
+    """
+    buffer = io.StringIO()
+    writer = Chem.SDWriter(buffer)
+    failed = []
+    for k, pdb_string in enumerate(pdb_blocks):
         mol = Chem.MolFromPDBBlock(pdb_string, removeHs=False)
         if mol is not None:
             writer.write(mol)
         else:
-            print(f"Skipping frame {i+1}: Invalid molecule.")
-    
+            failed.append(k)
     writer.close()
-    print(f"All configurations processed. Output written to {output_sdf}")
+    return buffer.getvalue(), failed
+
+
+def write_batch(output, future, first_frame, size):
+    """Write one converted batch and return the number of frames written."""
+    sdf_text, failed = future.result()
+    output.write(sdf_text)
+    for k in failed:
+        print(f"Skipping frame {first_frame + k + 1}: Invalid molecule.")
+    return size - len(failed)
+
+
+def process_pdb_frames(pdb_file, output_sdf, workers=None):
+    """
+    Stream frames from pdb_file, convert them on a pool of worker processes, and
+    write them to output_sdf in trajectory order.  At most
+    workers * TASKS_PER_WORKER batches are in flight, so memory does not grow
+    with the trajectory length.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * TASKS_PER_WORKER
+
+    n_frames = 0
+    n_written = 0
+
+    with open(output_sdf, 'w') as output, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in iter_batches(iter_pdb_frames(pdb_file), FRAMES_PER_TASK):
+            pending.append((executor.submit(convert_frames, batch), n_frames, len(batch)))
+            n_frames += len(batch)
+
+            # Write the oldest batch before reading further once the window is full
+            if len(pending) >= max_pending:
+                n_written += write_batch(output, *pending.popleft())
+
+        while pending:
+            n_written += write_batch(output, *pending.popleft())
+
+    count_items(frames=n_frames)
+    print(f"Total configurations found: {n_frames}")
+    print(f"All configurations processed ({n_written} written). Output written to {output_sdf}")
+
 
-# Usage
-process_pdb_frames('frames.pdb', 'output.sdf')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a multi-frame PDB trajectory to SDF.")
+    parser.add_argument("-i", "--input", default="frames.pdb", help="Multi-frame PDB file (default: frames.pdb).")
+    parser.add_argument("-o", "--output", default="output.sdf", help="Output SDF file (default: output.sdf).")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    args = parser.parse_args()
 
+    process_pdb_frames(args.input, args.output, workers=args.workers)
@@ -0,0 +1,257 @@
+"""
+Unbiased frame weights from a PLUMED metadynamics HILLS file.
+
+plumed.dat biases the radius of gyration (METAD ARG=rg), so the frames of eq_1 and
+eq_2 are a biased sample. Each frame gets the log-weight beta * (V - c) that
+removes the bias:
+
+* ``final``: V is the bias of all hills at the frame's CV value and c = 0.
+* ``ct`` (Tiwary & Parrinello, J. Phys. Chem. B 2015): V is the bias of the hills
+  deposited before the frame was written, and c(t) is
+
+      c(t) = 1/beta * log( sum_s exp(gamma/(gamma-1) beta V(s,t)) / sum_s exp(1/(gamma-1) beta V(s,t)) )
+
+  over the grid, with gamma the bias factor.
+
+The hills are summed once onto a CV grid. Each hill only touches the grid points
+within KERNEL_CUTOFF widths, and bincount adds them up. Frames then interpolate
+the grid instead of summing every hill. The interpolation is cubic Hermite, with
+the analytic slopes. The final bias thus costs O(hills + grid + frames) instead
+of O(frames x hills). For c(t), each frame's new hills go into one row of a
+(frames, grid) block, and a cumulative sum along the frames gives the bias at
+every frame time. c(t) then costs O(frames x grid) on top.
+
+Frame k (0-based, eq_1 then eq_2) is taken to follow the first (k + 1) x
+hills_per_frame hills. This ratio is the coordinate save interval over the
+METAD PACE: 5000 / 500 = 10 in 01run.sh. By default it is inferred from the
+numbers of hills and frames.
+
+The CV of every frame is the radius of gyration in nm over all solute atoms,
+unweighted (PLUMED GYRATION without MASS_WEIGHTED), computed from output.ens or
+output.sdf, or read from a PLUMED COLVAR file.
+
+Output: Frame, CV, Bias, Log_Weight and Weight (normalized) for every frame.
+ensemble_averages.py --frame_weights combines the log-weights with the ANI
+Boltzmann factors.
+"""
+import csv
+import argparse
+import numpy as np
+
+from cluster_conformers import open_ensemble, read_sdf_coordinates
+
+import pipeline_root  # Puts the repository root on sys.path for the pipeline imports
+from pipeline.telemetry import count_items
+
+k_B_KJ = 0.0083144626  # Boltzmann constant in kJ/(mol·K), PLUMED's default energy unit
+KCAL_TO_KJ = 4.184
+ANGSTROM_TO_NM = 0.1
+KERNEL_CUTOFF = 6.0  # Gaussians are summed out to this many widths
+GRID_POINTS_PER_SIGMA = 10  # Default grid spacing: the smallest hill width / this
+BLOCK_ELEMENTS = 2 ** 22  # Frames x grid points evaluated at a time in c(t) mode
+
+
+def read_plumed_table(path):
+    """Columns of a PLUMED HILLS or COLVAR file as {field: array}; restarts append rows under repeated headers."""
+    fields = None
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith("#! FIELDS"):
+                header = line.split()[2:]
+                if fields is not None and header != fields:
+                    raise ValueError(f"{path}: fields change from {fields} to {header}")
+                fields = header
+            elif line.strip() and not line.startswith("#"):
+                rows.append(line.split())
+    if fields is None:
+        raise ValueError(f"{path} has no '#! FIELDS' header")
+    if not rows:
+        raise ValueError(f"{path} has no data rows")
+    values = np.array(rows, dtype=np.float64)
+    return {name: values[:, k] for k, name in enumerate(fields)}
+
+
+def read_hills(path, energy_unit="kj"):
+    """
+    CV name, centers, widths, heights (kJ/mol) and bias factor (None without tempering)
+    of a one-dimensional HILLS file. Well-tempered hills are stored scaled by
+    gamma/(gamma-1), so the heights are scaled back to the deposited bias.
+    """
+    table = read_plumed_table(path)
+    names = [name for name in table if name not in ("time", "height", "biasf") and not name.startswith("sigma_")]
+    if len(names) != 1:
+        raise NotImplementedError(f"{path} biases {len(names)} CVs ({', '.join(names)}); only one-dimensional hills are supported")
+    cv = names[0]
+
+    heights = table["height"] * (KCAL_TO_KJ if energy_unit == "kcal" else 1.0)
+    biasfactor = None
+    if "biasf" in table and table["biasf"][0] > 1:
+        biasfactor = float(table["biasf"][0])
+        heights = heights * (biasfactor - 1) / biasfactor
+    return cv, table[cv], table[f"sigma_{cv}"], heights, biasfactor
+
+
+def radius_of_gyration(coordinates):
+    """Unweighted radius of gyration (nm) of every frame of (n_frames, n_atoms, 3) coordinates in Angstrom."""
+    centered = coordinates - coordinates.mean(axis=1, keepdims=True)
+    return np.sqrt((centered ** 2).sum(axis=2).mean(axis=1)) * ANGSTROM_TO_NM
+
+
+def frame_radius_of_gyration(frames_path):
+    """Radius of gyration of every frame of a conformer ensemble or multi-frame SDF."""
+    ensemble = open_ensemble(frames_path)
+    if ensemble is None:
+        coordinates, _ = read_sdf_coordinates(frames_path)
+        return radius_of_gyration(coordinates)
+    # Memory-mapped frames are read a block at a time
+    block = max(1, BLOCK_ELEMENTS // (3 * ensemble.n_atoms))
+    return np.concatenate([radius_of_gyration(ensemble.positions(start, start + block)) for start in range(0, len(ensemble), block)])
+
+
+class BiasGrid:
+    """Regular CV grid covering the hills and the frames."""
+
+    def __init__(self, centers, sigmas, cv_values, spacing=None):
+        self.spacing = spacing or sigmas.min() / GRID_POINTS_PER_SIGMA
+        reach = KERNEL_CUTOFF * sigmas.max()
+        self.start = min(centers.min(), cv_values.min()) - reach - self.spacing
+        stop = max(centers.max(), cv_values.max()) + reach
+        self.size = int(np.ceil((stop - self.start) / self.spacing)) + 2
+        self.points = self.start + self.spacing * np.arange(self.size)
+        self.half_width = int(np.ceil(reach / self.spacing))
+
+    def kernels(self, centers, sigmas, heights):
+        """Grid indices, values and slopes of every hill's Gaussian within the cutoff, each (n_hills, kernel width)."""
+        offsets = np.arange(-self.half_width, self.half_width + 1)
+        index = np.rint((centers - self.start) / self.spacing).astype(np.int64)[:, None] + offsets[None, :]
+        np.clip(index, 0, self.size - 1, out=index)  # Kernels stay inside: the grid extends KERNEL_CUTOFF widths past every center
+        scaled = (self.points[index] - centers[:, None]) / sigmas[:, None]
+        values = heights[:, None] * np.exp(-0.5 * scaled ** 2)
+        return index, values, -scaled / sigmas[:, None] * values
+
+    def bias(self, centers, sigmas, heights):
+        """Sum of all hills and of their slopes at every grid point."""
+        index, values, slopes = self.kernels(centers, sigmas, heights)
+        return (np.bincount(index.ravel(), weights=values.ravel(), minlength=self.size),
+                np.bincount(index.ravel(), weights=slopes.ravel(), minlength=self.size))
+
+    def interpolate(self, bias, slope, cv_values):
+        """
+        Cubic Hermite interpolation of the bias at the CV values, from either one grid
+        (grid,) or one grid row per CV value (n, grid).
+        """
+        position = (cv_values - self.start) / self.spacing
+        left = np.clip(np.floor(position).astype(np.int64), 0, self.size - 2)
+        t = position - left
+        if bias.ndim == 1:
+            p0, p1, m0, m1 = bias[left], bias[left + 1], slope[left], slope[left + 1]
+        else:
+            rows = np.arange(len(cv_values))
+            p0, p1, m0, m1 = bias[rows, left], bias[rows, left + 1], slope[rows, left], slope[rows, left + 1]
+        return ((2 * t ** 3 - 3 * t ** 2 + 1) * p0 + (t ** 3 - 2 * t ** 2 + t) * self.spacing * m0
+                + (3 * t ** 2 - 2 * t ** 3) * p1 + (t ** 3 - t ** 2) * self.spacing * m1)
+
+
+def logsumexp(values, axis):
+    peak = values.max(axis=axis, keepdims=True)
+    return (peak + np.log(np.exp(values - peak).sum(axis=axis, keepdims=True))).squeeze(axis)
+
+
+def final_bias_weights(grid, centers, sigmas, heights, cv_values, beta):
+    """Bias of all hills at every frame and the log-weights beta * V."""
+    frame_bias = grid.interpolate(*grid.bias(centers, sigmas, heights), cv_values)
+    return frame_bias, beta * frame_bias
+
+
+def ct_weights(grid, centers, sigmas, heights, cv_values, beta, biasfactor, hills_per_frame):
+    """
+    Bias at every frame from the hills deposited before it, and the log-weights
+    beta * (V - c(t)). Without a bias factor (untempered metadynamics), c(t) is the
+    log of the mean of exp(beta V) over the grid.
+    """
+    n_frames = len(cv_values)
+    deposited = np.minimum((np.arange(n_frames) + 1) * hills_per_frame, len(centers))
+    index, values, slopes = grid.kernels(centers, sigmas, heights)
+
+    frame_bias = np.empty(n_frames)
+    c = np.empty(n_frames)
+    running = np.zeros((2, grid.size))  # Bias and slope after the previous block
+    block = max(1, BLOCK_ELEMENTS // (2 * grid.size))
+    for start in range(0, n_frames, block):
+        stop = min(start + block, n_frames)
+        first_hill = deposited[start - 1] if start else 0
+        # Row r of the block receives the hills deposited between frames start + r - 1 and start + r
+        rows = np.repeat(np.arange(stop - start), np.diff(np.concatenate([[first_hill], deposited[start:stop]])))
+        hills = slice(first_hill, deposited[stop - 1])
+        flat = (rows[:, None] * grid.size + index[hills]).ravel()
+        bias, slope = (
+            total + np.cumsum(np.bincount(flat, weights=kernel[hills].ravel(), minlength=(stop - start) * grid.size)
+                              .reshape(stop - start, grid.size), axis=0)
+            for total, kernel in zip(running, (values, slopes))
+        )
+        running = np.stack([bias[-1], slope[-1]])
+
+        frame_bias[start:stop] = grid.interpolate(bias, slope, cv_values[start:stop])
+        if biasfactor:
+            c[start:stop] = (logsumexp(biasfactor / (biasfactor - 1) * beta * bias, axis=1)
+                             - logsumexp(beta * bias / (biasfactor - 1), axis=1)) / beta
+        else:
+            c[start:stop] = (logsumexp(beta * bias, axis=1) - np.log(grid.size)) / beta
+    return frame_bias, beta * (frame_bias - c)
+
+
+def infer_hills_per_frame(n_hills, n_frames):
+    if n_hills < n_frames:
+        raise ValueError(f"{n_hills} hills for {n_frames} frames; set --hills_per_frame")
+    return int(round(n_hills / n_frames))
+
+
+def write_weights(path, cv_values, frame_bias, log_weights):
+    weights = np.exp(log_weights - logsumexp(log_weights, axis=0))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Frame", "CV", "Bias", "Log_Weight", "Weight"])
+        for k, row in enumerate(zip(cv_values, frame_bias, log_weights, weights), start=1):
+            writer.writerow([k] + [f"{value:.8g}" for value in row])
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute unbiased per-frame weights from a metadynamics HILLS file.")
+    parser.add_argument("--hills", required=True, help="PLUMED HILLS file (one CV).")
+    parser.add_argument("-f", "--frames", default="output.sdf", help="Trajectory frames as SDF or conformer ensemble, used for the radius of gyration (default: output.sdf).")
+    parser.add_argument("--colvar", default=None, help="PLUMED COLVAR file with the CV of every frame, instead of computing it from --frames.")
+    parser.add_argument("-o", "--output", default="frame_weights.csv", help="Output CSV (default: frame_weights.csv).")
+    parser.add_argument("-m", "--mode", choices=["ct", "final"], default="ct", help="Time-dependent c(t) or final-bias reweighting (default: ct).")
+    parser.add_argument("-t", "--temperature", type=float, default=300.0, help="Simulation temperature in K, METAD TEMP (default: 300).")
+    parser.add_argument("--biasfactor", type=float, default=None, help="Bias factor (default: the biasf column of the HILLS file).")
+    parser.add_argument("--hills_per_frame", type=int, default=None, help="Hills deposited per saved frame (default: number of hills / number of frames).")
+    parser.add_argument("--grid_spacing", type=float, default=None, help=f"CV grid spacing (default: smallest hill width / {GRID_POINTS_PER_SIGMA}).")
+    parser.add_argument("--energy_unit", choices=["kj", "kcal"], default="kj", help="Energy unit of the hill heights, PLUMED UNITS (default: kj).")
+    args = parser.parse_args()
+
+    cv, centers, sigmas, heights, biasfactor = read_hills(args.hills, args.energy_unit)
+    if args.biasfactor:
+        biasfactor = args.biasfactor
+    if args.colvar:
+        cv_values = read_plumed_table(args.colvar)[cv]
+    else:
+        cv_values = frame_radius_of_gyration(args.frames)
+    count_items(frames=len(cv_values))
+
+    beta = 1 / (k_B_KJ * args.temperature)
+    grid = BiasGrid(centers, sigmas, cv_values, args.grid_spacing)
+    if args.mode == "final":
+        frame_bias, log_weights = final_bias_weights(grid, centers, sigmas, heights, cv_values, beta)
+    else:
+        hills_per_frame = args.hills_per_frame or infer_hills_per_frame(len(centers), len(cv_values))
+        frame_bias, log_weights = ct_weights(grid, centers, sigmas, heights, cv_values, beta, biasfactor, hills_per_frame)
+
+    weights = write_weights(args.output, cv_values, frame_bias, log_weights)
+    print(f"{len(centers)} hills on {cv}, {len(cv_values)} frames, {grid.size} grid points ({args.mode} reweighting)")
+    print(f"Effective sample size {1 / (weights ** 2).sum():.1f} of {len(weights)} frames. Weights saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()